@@ -0,0 +1,103 @@
+"""
+Redis Cache
+Shared Redis client for caching external API results.
+
+Caching is best effort: when Redis is disabled, missing or unreachable,
+reads behave as misses and writes are dropped, so callers always fall
+through to the real source.
+"""
+from typing import Any, Iterable, List, Optional
+import logging
+
+from app.core.serialization import dumps, loads
+
+logger = logging.getLogger(__name__)
+
+# Keep a slow or down Redis from stalling requests
+SOCKET_TIMEOUT = 0.25
+
+
+# Global Redis client (None = caching disabled)
+redis_client = None
+
+
+def init_cache(redis_url: Optional[str]):
+    """
+    Initialize the global Redis client
+    
+    Args:
+        redis_url: Redis URL, or None to disable caching (mock mode)
+    """
+    global redis_client
+    redis_client = None
+    
+    if not redis_url:
+        logger.info("⚠️  Cache disabled (no Redis URL)")
+        return None
+    
+    try:
+        import redis
+        redis_client = redis.Redis.from_url(
+            redis_url,
+            socket_timeout=SOCKET_TIMEOUT,
+            socket_connect_timeout=SOCKET_TIMEOUT
+        )
+        logger.info("✅ Redis cache initialized")
+    except ImportError:
+        logger.warning("⚠️  redis not installed - caching disabled")
+    
+    return redis_client
+
+
+def get_redis():
+    """Get the global Redis client (None when caching is disabled)"""
+    return redis_client
+
+
+def cache_get_json(key: str) -> Optional[Any]:
+    """Read a JSON value, or None on a miss or any Redis error"""
+    if redis_client is None:
+        return None
+    
+    try:
+        raw = redis_client.get(key)
+    except Exception as e:
+        logger.warning("⚠️  Cache read failed for %s: %s", key, e)
+        return None
+    
+    return loads(raw) if raw is not None else None
+
+
+def cache_set_json(key: str, value: Any, ttl_seconds: int):
+    """Store a JSON value with a TTL; errors are logged and ignored"""
+    if redis_client is None:
+        return
+    
+    try:
+        redis_client.setex(key, ttl_seconds, dumps(value))
+    except Exception as e:
+        logger.warning("⚠️  Cache write failed for %s: %s", key, e)
+
+
+def cache_set_add(key: str, member: str):
+    """Add a member to a Redis set; errors are logged and ignored"""
+    if redis_client is None:
+        return
+    
+    try:
+        redis_client.sadd(key, member)
+    except Exception as e:
+        logger.warning("⚠️  Cache write failed for %s: %s", key, e)
+
+
+def cache_set_contains(key: str, members: Iterable[str]) -> List[bool]:
+    """Membership flags for members in one SMISMEMBER call (all False on error)"""
+    members = list(members)
+    if redis_client is None or not members:
+        return [False] * len(members)
+    
+    try:
+        return [bool(flag) for flag in redis_client.smismember(key, members)]
+    except Exception as e:
+        logger.warning("⚠️  Cache read failed for %s: %s", key, e)
+        return [False] * len(members)
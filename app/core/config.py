@@ -4,66 +4,191 @@ Handles loading secrets from environment variables (.env)
 Replacing complex Vault integration with simple python-dotenv
 """
 import os
-from typing import Dict, Optional
-from dotenv import load_dotenv
+from functools import lru_cache
+from types import MappingProxyType
+from typing import Dict, Mapping, Tuple
 import logging
 
-# Load environment variables from .env file
-load_dotenv()
-
 logger = logging.getLogger(__name__)
 
+
+def load_environment() -> None:
+    """
+    Load environment variables from the .env file
+
+    Skipped when DOTENV_LOAD=0 (e.g. Docker/K8s, where the orchestrator
+    injects env vars), and a no-op if python-dotenv is not installed.
+    """
+    if os.environ.get("DOTENV_LOAD", "1") != "1":
+        return
+    try:
+        from dotenv import load_dotenv
+    except ImportError:
+        logger.debug("python-dotenv not installed; using process environment only")
+        return
+    load_dotenv()
+
+
+load_environment()
+
+# One-time snapshot of the environment; all lookups below read from it
+_ENV: Dict[str, str] = dict(os.environ)
+_get = _ENV.get
+
+
+# Secrets are read once per process and served from these caches.
+# Results are read-only views so callers cannot mutate the shared copies.
+# Call ConfigManager.reload() after changing os.environ (e.g. in tests)
+# to re-snapshot it.
+
+# Number of database shards configured at startup
+NUM_SHARDS = 2
+
+# Shard routing hash ("sha256" or "crc32"); see app/database/router.py
+# before changing this on a cluster that already holds data
+SHARD_HASH_ALGORITHM = _get("SHARD_HASH_ALGORITHM", "sha256")
+
+# Per-shard connection pool bounds (connections opened at startup / cap)
+DB_POOL_MIN = int(_get("DB_POOL_MIN", "5"))
+DB_POOL_MAX = int(_get("DB_POOL_MAX", "25"))
+
+# Run hot queries as named server-side prepared statements (PREPARE once per
+# pooled connection, then EXECUTE). Set to false behind PgBouncer in
+# transaction pooling mode, where EXECUTE may land on another backend
+DB_SERVER_PREPARE = _get("DB_SERVER_PREPARE", "true").lower() == "true"
+
+# Redis used for rate limiting
+REDIS_URL = _get("REDIS_URL", "redis://localhost:6379")
+
+# Celery broker and result backend shared by the web process and workers
+# (defaults to the same Redis)
+CELERY_BROKER_URL = _get("CELERY_BROKER_URL", REDIS_URL)
+
+# Root log level (e.g. "WARNING" in production to drop per-request INFO logs)
+LOG_LEVEL = _get("LOG_LEVEL", "INFO").upper()
+
+# Seconds to wait on external APIs (Maps, OpenRouter, Twilio, scraped
+# sites) before giving up; applied to every outbound request
+HTTP_TIMEOUT = float(_get("HTTP_TIMEOUT", "10"))
+
+# Public https://host the API is reached at behind a TLS-terminating proxy;
+# Twilio callbacks are built and signature-checked against it. Unset uses
+# the request's own URL (fine when Flask serves clients directly)
+PUBLIC_BASE_URL = _get("PUBLIC_BASE_URL")
+
+# Object storage for prescription images (unset keeps them in Postgres);
+# set the endpoint for MinIO or another S3-compatible store
+S3_BUCKET = _get("S3_BUCKET")
+S3_ENDPOINT_URL = _get("S3_ENDPOINT_URL")
+
+
+def _build_database_credentials(shard_id: int) -> Mapping[str, str]:
+    prefix = f"DB_SHARD{shard_id}"
+    return MappingProxyType({
+        "host": _get(f"{prefix}_HOST", "localhost"),
+        "port": _get(f"{prefix}_PORT", "5432"),
+        "database": _get(f"{prefix}_DATABASE", f"aurahealth_shard{shard_id}"),
+        "username": _get(f"{prefix}_USER", "postgres"),
+        "password": _get(f"{prefix}_PASSWORD", "postgres")
+    })
+
+
+def _init_shard_credentials(num_shards: int) -> Tuple[Mapping[str, str], ...]:
+    """Build credentials for every configured shard once, indexed by shard_id"""
+    return tuple(_build_database_credentials(i) for i in range(num_shards))
+
+
+_SHARD_CREDENTIALS = _init_shard_credentials(NUM_SHARDS)
+
+
+@lru_cache(maxsize=None)
+def _master_encryption_key() -> str:
+    # Default dev key if not set
+    return _get("MASTER_ENCRYPTION_KEY", "dev-master-key-32-bytes-long!!")
+
+
+_EMPTY: Mapping[str, str] = MappingProxyType({})
+
+
+def _build_api_keys() -> Dict[str, Mapping[str, str]]:
+    """Build the read-only key mapping for every supported service once"""
+    return {
+        'gemini': _build_api_key('gemini'),
+        'google_maps': _build_api_key('google_maps'),
+        'twilio': _build_api_key('twilio'),
+    }
+
+
+def _build_api_key(service: str) -> Mapping[str, str]:
+    if service == 'gemini':
+        # Support both native Gemini and OpenRouter (for DeepSeek)
+        return MappingProxyType({
+            "api_key": _get("OPENROUTER_API_KEY") or _get("GEMINI_API_KEY"),
+            "model_name": _get("OPENROUTER_MODEL") or _get("GEMINI_MODEL", "gemini-1.5-flash"),
+            "provider": "openrouter" if _get("OPENROUTER_API_KEY") else "google"
+        })
+    elif service == 'google_maps':
+        # Support Mappls/Ola Maps if keys exist
+        if _get("MAPPLS_API_KEY"):
+            return MappingProxyType({
+                "provider": "mappls",
+                "api_key": _get("MAPPLS_API_KEY"),
+                "client_id": _get("MAPPLS_CLIENT_ID"),
+                "client_secret": _get("MAPPLS_CLIENT_SECRET")
+            })
+        return MappingProxyType({
+            "provider": "google",
+            "api_key": _get("GOOGLE_MAPS_API_KEY")
+        })
+    elif service == 'twilio':
+        return MappingProxyType({
+            "account_sid": _get("TWILIO_ACCOUNT_SID"),
+            "auth_token": _get("TWILIO_AUTH_TOKEN"),
+            "phone_number": _get("TWILIO_PHONE_NUMBER")
+        })
+    return _EMPTY
+
+
+_API_KEYS = _build_api_keys()
+
+
 class ConfigManager:
     """Simple configuration manager using environment variables"""
-    
+
     @staticmethod
-    def get_database_credentials(shard_id: int) -> Dict[str, str]:
+    def get_database_credentials(shard_id: int) -> Mapping[str, str]:
         """Get database credentials from env vars"""
-        prefix = f"DB_SHARD{shard_id}"
-        return {
-            "host": os.getenv(f"{prefix}_HOST", "localhost"),
-            "port": os.getenv(f"{prefix}_PORT", "5432"),
-            "database": os.getenv(f"{prefix}_DATABASE", f"aurahealth_shard{shard_id}"),
-            "username": os.getenv(f"{prefix}_USER", "postgres"),
-            "password": os.getenv(f"{prefix}_PASSWORD", "postgres")
-        }
+        if 0 <= shard_id < len(_SHARD_CREDENTIALS):
+            return _SHARD_CREDENTIALS[shard_id]
+        return _build_database_credentials(shard_id)
 
     @staticmethod
     def get_master_encryption_key() -> str:
         """Get master encryption key"""
-        # Default dev key if not set
-        return os.getenv("MASTER_ENCRYPTION_KEY", "dev-master-key-32-bytes-long!!")
+        return _master_encryption_key()
 
     @staticmethod
-    def get_api_key(service: str) -> Dict[str, str]:
+    def get_api_key(service: str) -> Mapping[str, str]:
         """Get API keys for services"""
-        if service == 'gemini':
-            # Support both native Gemini and OpenRouter (for DeepSeek)
-            return {
-                "api_key": os.getenv("OPENROUTER_API_KEY") or os.getenv("GEMINI_API_KEY"),
-                "model_name": os.getenv("OPENROUTER_MODEL") or os.getenv("GEMINI_MODEL", "gemini-1.5-flash"),
-                "provider": "openrouter" if os.getenv("OPENROUTER_API_KEY") else "google"
-            }
-        elif service == 'google_maps':
-            # Support Mappls/Ola Maps if keys exist
-            if os.getenv("MAPPLS_API_KEY"):
-                return {
-                    "provider": "mappls",
-                    "api_key": os.getenv("MAPPLS_API_KEY"),
-                    "client_id": os.getenv("MAPPLS_CLIENT_ID"),
-                    "client_secret": os.getenv("MAPPLS_CLIENT_SECRET")
-                }
-            return {
-                "provider": "google",
-                "api_key": os.getenv("GOOGLE_MAPS_API_KEY")
-            }
-        elif service == 'twilio':
-            return {
-                "account_sid": os.getenv("TWILIO_ACCOUNT_SID"),
-                "auth_token": os.getenv("TWILIO_AUTH_TOKEN"),
-                "phone_number": os.getenv("TWILIO_PHONE_NUMBER")
-            }
-        return {}
+        return _API_KEYS.get(service, _EMPTY)
+
+    @staticmethod
+    def reload() -> None:
+        """
+        Re-snapshot os.environ and drop the cached secrets
+        
+        Only shard credentials, API keys and the master encryption key are
+        re-read on the next lookup. Module-level settings (DB_POOL_MIN/MAX,
+        DB_SERVER_PREPARE, REDIS_URL, CELERY_BROKER_URL, LOG_LEVEL,
+        HTTP_TIMEOUT, PUBLIC_BASE_URL, S3_*) keep their import-time values;
+        other modules import them by value, so they need a process restart.
+        """
+        global _SHARD_CREDENTIALS, _API_KEYS
+        _ENV.clear()
+        _ENV.update(os.environ)
+        _SHARD_CREDENTIALS = _init_shard_credentials(NUM_SHARDS)
+        _API_KEYS = _build_api_keys()
+        _master_encryption_key.cache_clear()
 
 
 # Global instance for compatibility
@@ -0,0 +1,77 @@
+"""
+Outbound HTTP
+One pooled requests.Session shared by the services that call external
+APIs (Google Places, Mappls, OpenRouter, hospital websites).
+
+Reusing the session keeps TCP/TLS connections alive between calls, so
+repeat requests to the same host skip the handshake. Every request gets
+HTTP_TIMEOUT unless the caller passes its own, so a slow API can't hold
+a worker thread indefinitely. The session is created on first use and
+dropped in forked children (Celery prefork workers) so processes never
+share sockets.
+"""
+from typing import Optional
+import os
+import threading
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from app.core.config import HTTP_TIMEOUT
+
+# Hosts with a connection pool / connections kept per host
+POOL_CONNECTIONS = 32
+POOL_MAXSIZE = 128
+
+# Connection-level retries; urllib3 never re-sends a POST after a read error
+MAX_RETRIES = Retry(total=2, backoff_factor=0.1)
+
+_session: Optional[requests.Session] = None
+_session_lock = threading.Lock()
+
+
+class TimeoutHTTPAdapter(HTTPAdapter):
+    """HTTPAdapter that applies a default timeout to every request"""
+    
+    def __init__(self, *args, timeout: float = HTTP_TIMEOUT, **kwargs):
+        self.timeout = timeout
+        super().__init__(*args, **kwargs)
+    
+    def send(self, request, timeout=None, **kwargs):
+        if timeout is None:
+            timeout = self.timeout
+        return super().send(request, timeout=timeout, **kwargs)
+
+
+def _build_session() -> requests.Session:
+    """Session with pooled adapters for http and https"""
+    session = requests.Session()
+    adapter = TimeoutHTTPAdapter(
+        pool_connections=POOL_CONNECTIONS,
+        pool_maxsize=POOL_MAXSIZE,
+        max_retries=MAX_RETRIES
+    )
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+def get_http_session() -> requests.Session:
+    """Get the process-wide HTTP session"""
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                _session = _build_session()
+    return _session
+
+
+def _reset_session():
+    """Forked children open their own connections"""
+    global _session
+    _session = None
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_session)
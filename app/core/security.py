@@ -1,43 +1,89 @@
 """
 AES-256-GCM Encryption Module
 Implements row-level encryption with authentication for patient data.
+
+Ciphertext formats:
+    v1 (legacy): [96-bit IV][ciphertext][128-bit auth_tag]
+                 key = PBKDF2-HMAC-SHA256(master_key, salt=user_id, 100k iterations)
+    v2:          [0x02][96-bit IV][ciphertext][128-bit auth_tag]
+                 key = HKDF-SHA256(master_key, salt=user_id)
+
+New data is always written as v2. v1 rows remain readable, so existing
+records migrate lazily as they are re-encrypted on update.
 """
 import os
 import hashlib
-from typing import Tuple
+import threading
+from collections import OrderedDict
+from typing import Callable, Iterable, List, Tuple
+from cryptography.exceptions import InvalidTag
 from cryptography.hazmat.primitives.ciphers.aead import AESGCM
 from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.primitives.kdf.hkdf import HKDF
 from cryptography.hazmat.primitives.kdf.pbkdf2 import PBKDF2HMAC
 import logging
 
 logger = logging.getLogger(__name__)
 
+# Upper bound on per-user ciphers kept in memory
+KEY_CACHE_SIZE = 10_000
+
+# Leading byte marking HKDF-derived (v2) ciphertexts
+KEY_VERSION_HKDF = b'\x02'
+
 
 class EncryptionManager:
     """Handles AES-256-GCM encryption/decryption with user-specific keys"""
     
-    def __init__(self, master_key: str):
+    def __init__(self, master_key: str, cache_size: int = KEY_CACHE_SIZE):
         """
         Initialize encryption manager
         
         Args:
             master_key: 32-byte master key from Vault
+            cache_size: Max number of per-user ciphers kept (LRU)
         """
         # Ensure master key is exactly 32 bytes
         self.master_key = master_key.encode('utf-8')[:32].ljust(32, b'\x00')
+        
+        # user_id -> AESGCM, so the KDF runs once per user per process
+        self._key_cache: "OrderedDict[str, AESGCM]" = OrderedDict()
+        self._legacy_key_cache: "OrderedDict[str, AESGCM]" = OrderedDict()
+        self._cache_size = cache_size
+        self._cache_lock = threading.Lock()
         logger.info("✅ Encryption manager initialized with master key")
     
     def _derive_user_key(self, user_id: str) -> bytes:
         """
         Derive a user-specific encryption key from master key + user_id
         
+        The master key is already high-entropy, so a single HKDF
+        extract-and-expand is sufficient; password stretching adds nothing.
+        
+        Args:
+            user_id: Patient UUID as string
+            
+        Returns:
+            32-byte derived key
+        """
+        hkdf = HKDF(
+            algorithm=hashes.SHA256(),
+            length=32,
+            salt=user_id.encode('utf-8'),
+            info=b'aurahealth-row-key',
+        )
+        return hkdf.derive(self.master_key)
+    
+    def _derive_legacy_user_key(self, user_id: str) -> bytes:
+        """
+        Derive the PBKDF2 key used for v1 ciphertexts (read path only)
+        
         Args:
             user_id: Patient UUID as string
             
         Returns:
             32-byte derived key
         """
-        # Use PBKDF2 to derive a unique key per user
         kdf = PBKDF2HMAC(
             algorithm=hashes.SHA256(),
             length=32,
@@ -46,6 +92,43 @@ class EncryptionManager:
         )
         return kdf.derive(self.master_key)
     
+    def _cached_cipher(self,
+                       cache: "OrderedDict[str, AESGCM]",
+                       user_id: str,
+                       derive: Callable[[str], bytes]) -> AESGCM:
+        """Look up a user's cipher in an LRU cache, deriving it on a miss"""
+        with self._cache_lock:
+            cipher = cache.get(user_id)
+            if cipher is not None:
+                cache.move_to_end(user_id)
+                return cipher
+        
+        # Derive outside the lock so a slow KDF doesn't block other users
+        cipher = AESGCM(derive(user_id))
+        
+        with self._cache_lock:
+            cache[user_id] = cipher
+            cache.move_to_end(user_id)
+            if len(cache) > self._cache_size:
+                cache.popitem(last=False)
+        return cipher
+    
+    def _get_cipher(self, user_id: str) -> AESGCM:
+        """
+        Get the AES-GCM cipher for a user, deriving the key on first use
+        
+        Args:
+            user_id: Patient UUID as string
+            
+        Returns:
+            AESGCM instance keyed with the user's derived key
+        """
+        return self._cached_cipher(self._key_cache, user_id, self._derive_user_key)
+    
+    def _get_legacy_cipher(self, user_id: str) -> AESGCM:
+        """Get the PBKDF2-keyed cipher for decrypting v1 ciphertexts"""
+        return self._cached_cipher(self._legacy_key_cache, user_id, self._derive_legacy_user_key)
+    
     def encrypt(self, plaintext: str, user_id: str) -> bytes:
         """
         Encrypt plaintext using AES-256-GCM
@@ -55,64 +138,117 @@ class EncryptionManager:
             user_id: Patient UUID for key derivation
             
         Returns:
-            Encrypted data (IV + ciphertext + auth_tag) as bytes
+            Encrypted data (version + IV + ciphertext + auth_tag) as bytes
             
-        Format: [96-bit IV][ciphertext][128-bit auth_tag]
+        Format: [0x02][96-bit IV][ciphertext][128-bit auth_tag]
         """
         if not plaintext:
             return b''
         
-        # Derive user-specific key
-        user_key = self._derive_user_key(user_id)
+        return self._encrypt_bytes(plaintext.encode('utf-8'), user_id)
+    
+    def _encrypt_bytes(self, data: bytes, user_id: str) -> bytes:
+        """
+        Encrypt already-encoded data (skips the str -> UTF-8 step)
+        
+        user_id stays a str: it is only encoded by the KDF on a cipher-cache
+        miss, and str keys reuse their cached hash on every lookup.
+        """
+        # Get user-specific cipher
+        return self._seal(self._get_cipher(user_id), data)
+    
+    def encrypt_many(self, plaintexts: Iterable[str], user_id: str) -> List[bytes]:
+        """
+        Encrypt several values for the same user (e.g. all columns of a row)
         
+        The cipher is looked up once for the whole batch.
+        
+        Args:
+            plaintexts: Values to encrypt
+            user_id: Patient UUID for key derivation
+            
+        Returns:
+            Encrypted values in the same order (b'' for empty inputs)
+        """
+        aesgcm = self._get_cipher(user_id)
+        seal = self._seal
+        return [seal(aesgcm, p.encode('utf-8')) if p else b'' for p in plaintexts]
+    
+    @staticmethod
+    def _seal(aesgcm: AESGCM, data: bytes) -> bytes:
+        """Encrypt one encoded value into the v2 [version][IV][ciphertext+tag] format"""
         # Generate 96-bit (12 bytes) random IV
         iv = os.urandom(12)
         
-        # Initialize AES-GCM cipher
-        aesgcm = AESGCM(user_key)
-        
         # Encrypt (returns ciphertext + 128-bit auth tag appended)
-        ciphertext = aesgcm.encrypt(iv, plaintext.encode('utf-8'), None)
+        ciphertext = aesgcm.encrypt(iv, data, None)
         
-        # Return: IV + ciphertext+tag
-        return iv + ciphertext
+        # Return: version + IV + ciphertext+tag (single allocation)
+        return b''.join((KEY_VERSION_HKDF, iv, ciphertext))
+    
+    @staticmethod
+    def _open(aesgcm: AESGCM, data: memoryview) -> bytes:
+        """Split [IV][ciphertext+tag] and decrypt, verifying the auth tag"""
+        return aesgcm.decrypt(data[:12], data[12:], None)
     
     def decrypt(self, encrypted_data: bytes, user_id: str) -> str:
         """
         Decrypt AES-256-GCM encrypted data
         
         Args:
-            encrypted_data: Encrypted bytes (IV + ciphertext + auth_tag)
+            encrypted_data: Encrypted bytes (v2 or legacy v1 format)
             user_id: Patient UUID for key derivation
             
         Returns:
             Decrypted plaintext as string
             
         Raises:
-            cryptography.exceptions.InvalidTag: If data was tampered with
+            ValueError: If data was tampered with or the key is wrong
         """
         if not encrypted_data:
             return ''
         
-        # Derive user-specific key
-        user_key = self._derive_user_key(user_id)
-        
-        # Extract IV (first 12 bytes)
-        iv = encrypted_data[:12]
-        
-        # Extract ciphertext + auth_tag (remaining bytes)
-        ciphertext = encrypted_data[12:]
-        
-        # Initialize AES-GCM cipher
-        aesgcm = AESGCM(user_key)
+        return self._decrypt_with(self._get_cipher(user_id), encrypted_data, user_id)
+    
+    def _decrypt_with(self, aesgcm: AESGCM, encrypted_data: bytes, user_id: str) -> str:
+        """Decrypt one non-empty value given the user's already-resolved v2 cipher"""
+        # Slice through a view so IV/ciphertext aren't copied out
+        data = memoryview(encrypted_data)
         
         # Decrypt and verify authentication tag
         try:
-            plaintext = aesgcm.decrypt(iv, ciphertext, None)
+            if data[:1] == KEY_VERSION_HKDF:
+                try:
+                    plaintext = self._open(aesgcm, data[1:])
+                except InvalidTag:
+                    # A v1 ciphertext whose random IV starts with the version byte
+                    plaintext = self._open(self._get_legacy_cipher(user_id), data)
+            else:
+                plaintext = self._open(self._get_legacy_cipher(user_id), data)
             return plaintext.decode('utf-8')
         except Exception as e:
-            logger.error(f"❌ Decryption failed for user {user_id}: {e}")
+            logger.error("Decryption failed for user %s: %s", user_id, e)
             raise ValueError("Decryption failed - data may be corrupted or tampered")
+    
+    def decrypt_many(self, encrypted_values: Iterable[bytes], user_id: str) -> List[str]:
+        """
+        Decrypt several values belonging to the same user
+        
+        The cipher is looked up once for the whole batch.
+        
+        Args:
+            encrypted_values: Encrypted bytes (v2 or legacy v1 format)
+            user_id: Patient UUID for key derivation
+            
+        Returns:
+            Decrypted plaintexts in the same order
+            
+        Raises:
+            ValueError: If any value was tampered with or the key is wrong
+        """
+        aesgcm = self._get_cipher(user_id)
+        decrypt_with = self._decrypt_with
+        return [decrypt_with(aesgcm, v, user_id) if v else '' for v in encrypted_values]
 
 
 # Global encryption manager instance
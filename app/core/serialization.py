@@ -0,0 +1,69 @@
+"""
+JSON Serialization
+Flask JSON provider and a JSON parser backed by orjson, falling back to
+the stdlib json module.
+
+Both paths emit the same shapes: UUIDs as strings, dates/datetimes as
+ISO 8601 (not Flask's default HTTP-date format) and NumPy scalars/arrays
+as plain numbers/lists, so handlers can pass those objects to jsonify()
+directly. Request bodies (request.get_json()) are parsed by orjson too.
+"""
+from datetime import date
+from typing import Any
+import json
+import logging
+
+from flask.json.provider import DefaultJSONProvider
+
+logger = logging.getLogger(__name__)
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+    logger.info("⚠️  orjson not installed - using stdlib JSON encoder")
+
+
+def _default(obj: Any) -> Any:
+    """Encode types the JSON encoder doesn't handle natively"""
+    if isinstance(obj, date):
+        return obj.isoformat()
+    if type(obj).__module__ == "numpy":
+        return obj.tolist()
+    return DefaultJSONProvider.default(obj)
+
+
+# Parse JSON from bytes or str (e.g. loads(response.content) for external
+# API payloads - skips requests' charset detection and the stdlib parser)
+loads = orjson.loads if orjson is not None else json.loads
+
+
+def dumps(obj: Any) -> bytes:
+    """Serialize to JSON bytes (e.g. for Redis values)"""
+    if orjson is not None:
+        return orjson.dumps(obj, default=_default)
+    return json.dumps(obj, default=_default).encode()
+
+
+class OrjsonProvider(DefaultJSONProvider):
+    """JSON provider that serializes responses with orjson when available"""
+
+    default = staticmethod(_default)
+
+    def dumps(self, obj: Any, **kwargs: Any) -> str:
+        if orjson is None:
+            return super().dumps(obj, **kwargs)
+
+        # Match the stdlib provider: int keys become strings, honour sort_keys
+        option = orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY
+        if kwargs.get("sort_keys", self.sort_keys):
+            option |= orjson.OPT_SORT_KEYS
+        if kwargs.get("indent"):
+            option |= orjson.OPT_INDENT_2
+
+        return orjson.dumps(obj, default=self.default, option=option).decode()
+
+    def loads(self, s: str | bytes, **kwargs: Any) -> Any:
+        if orjson is None or kwargs:
+            return super().loads(s, **kwargs)
+        return orjson.loads(s)
@@ -4,11 +4,37 @@ Manages connections to multiple PostgreSQL shards with dynamic credential rotati
 Includes fallback to In-Memory Mock Database if PostgreSQL is unavailable.
 """
 import logging
+import re
+import threading
+import weakref
 from contextlib import contextmanager
+from contextvars import ContextVar, Token
+from functools import lru_cache
 from typing import Dict, Optional, Any, List
 
+from app.core.config import DB_SERVER_PREPARE
+
 logger = logging.getLogger(__name__)
 
+# Seconds a caller waits for a free pooled connection before giving up
+POOL_TIMEOUT = 30.0
+
+# Per-shard pool sizing. POOL_MIN_CONNECTIONS are opened when the shard is
+# added, so the first requests after startup don't pay connect cost;
+# 25 is the low end of the range where pooling stops paying off under
+# high concurrency.
+POOL_MIN_CONNECTIONS = 5
+POOL_MAX_CONNECTIONS = 25
+
+# Server-side prepared statement names already PREPAREd on each connection.
+# Entries disappear with the connection, so a reconnect re-prepares.
+_prepared_statements: "weakref.WeakKeyDictionary[Any, set]" = weakref.WeakKeyDictionary()
+
+# shard_id -> connection held for the current request (None outside a request)
+_request_connections: ContextVar[Optional[Dict[int, Any]]] = ContextVar(
+    "db_request_connections", default=None
+)
+
 # Global in-memory storage for fallback mode
 from datetime import datetime, timedelta
 
@@ -39,6 +65,96 @@ IN_MEMORY_STORE = {
     "digital_twins": []
 }
 
+# Query dispatch for MockCursor: one anchored match for the verb, one search
+# for the source table, instead of repeated substring scans of an uppercased copy
+_VERB_RE = re.compile(r"\s*(select|insert)\b", re.I)
+_FROM_RE = re.compile(r"from\s+(medications|patients|prescriptions)", re.I)
+
+# Row tuples in the shapes MockCursor returns, built once per table and
+# projection. Bump _store_version after mutating IN_MEMORY_STORE to rebuild.
+_store_version = 0
+_PROJECTIONS: Dict[tuple, tuple] = {}
+
+
+@lru_cache(maxsize=256)
+def _classify_query(query: str) -> tuple:
+    """
+    Parse a query into (verb, table, shape) once per distinct query string
+
+    The demo issues a small, fixed set of queries, so after warm-up every
+    execute() is a dict lookup. A single casefold() replaces the separate
+    upper()/lower() passes over the query text.
+    """
+    verb = _VERB_RE.match(query)
+    verb = verb.group(1).lower() if verb else None
+    if verb != "select":
+        return verb, None, None
+    
+    table = _FROM_RE.search(query)
+    table = table.group(1).lower() if table else None
+    q = query.casefold()
+    if "like any" in q:
+        shape = "chronic_conditions"
+    elif "adherence_events" in q:
+        shape = "adherence"
+    elif "drug_name, created_at" in q:
+        shape = "drug_name,created_at"
+    elif "count(*) filter" in q:
+        shape = "count,count"
+    elif "count(*)" in q:
+        shape = "count"
+    else:
+        shape = "*"
+    return verb, table, shape
+
+
+def _mock_chronic_conditions(params: tuple) -> list:
+    """
+    Evaluate the chronic-condition aggregate over the demo medications
+    
+    params: (condition, LIKE patterns) pairs, then patient_id, since, min_count
+    """
+    *pattern_params, _patient_id, since, min_count = params
+    rows = []
+    for condition, likes in zip(pattern_params[::2], pattern_params[1::2]):
+        needles = [like.strip("%") for like in likes]
+        matches = [
+            m for m in IN_MEMORY_STORE["medications"]
+            if m["created_at"] >= since
+            and any(n in m["drug_name"].lower() for n in needles)
+        ]
+        if len(matches) >= min_count:
+            rows.append((
+                condition,
+                len(matches),
+                min(m["created_at"] for m in matches),
+                sorted({m["drug_name"] for m in matches})
+            ))
+    return rows
+
+
+def _bump_store_version():
+    """Invalidate cached projections after IN_MEMORY_STORE changes"""
+    global _store_version
+    _store_version += 1
+
+
+def _projection(table: str, columns: Optional[tuple]) -> tuple:
+    """Rows of IN_MEMORY_STORE[table] as tuples (all values if columns is None)"""
+    key = (table, columns)
+    cached = _PROJECTIONS.get(key)
+    if cached is not None and cached[0] == _store_version:
+        return cached[1]
+    
+    source = IN_MEMORY_STORE[table]
+    if columns is None:
+        rows = tuple(tuple(r.values()) for r in source)
+    else:
+        rows = tuple(tuple(r[c] for c in columns) for r in source)
+    _PROJECTIONS[key] = (_store_version, rows)
+    return rows
+
+
 class MockCursor:
     """Mock Database Cursor for In-Memory operations"""
     def __init__(self):
@@ -48,44 +164,40 @@ class MockCursor:
         
     def execute(self, query: str, params: tuple = None):
         """Mock execute - logs query and simulates basic SELECTs with Column Filtering"""
-        q_upper = query.strip().upper()
+        verb, table, shape = _classify_query(query)
         
-        if q_upper.startswith("SELECT"):
-            data_source = []
-            if "FROM MEDICATIONS" in q_upper:
-                data_source = IN_MEMORY_STORE["medications"]
-            elif "FROM PATIENTS" in q_upper:
-                data_source = IN_MEMORY_STORE["patients"]
-            elif "FROM PRESCRIPTIONS" in q_upper:
-                data_source = IN_MEMORY_STORE["prescriptions"]
-            elif "COUNT(*)" in q_upper:
+        if verb == "select":
+            if table is None and shape == "count":
                 self.rows = [(len(IN_MEMORY_STORE["medications"]),)] # Dummy count
                 return
 
             # Column Selection Logic
-            if not data_source:
+            if not table or not IN_MEMORY_STORE[table]:
                 self.rows = []
                 return
 
-            if "drug_name, created_at" in query.lower():
-                self.rows = [(r['drug_name'], r['created_at']) for r in data_source]
-            elif "count(*)" in query.lower():
-                self.rows = [(len(data_source),)]
-            elif "*" in query:
-                self.rows = [tuple(r.values()) for r in data_source]
+            if shape == "chronic_conditions":
+                self.rows = _mock_chronic_conditions(params)
+            elif shape == "adherence":
+                # Demo medications carry no ids, pill counts or adherence
+                # events, so adherence queries find nothing to report
+                self.rows = []
+            elif shape == "drug_name,created_at":
+                self.rows = list(_projection(table, ("drug_name", "created_at")))
+            elif shape == "count":
+                self.rows = [(len(IN_MEMORY_STORE[table]),)]
+            elif shape == "count,count":
+                n = len(IN_MEMORY_STORE[table])
+                self.rows = [(n, n)]
             else:
-                 # Default fallback: return all values (best guess)
-                self.rows = [tuple(r.values()) for r in data_source]
+                # "*" and the default fallback both return all values (best guess)
+                self.rows = list(_projection(table, None))
                 
-        elif q_upper.startswith("INSERT"):
-            # Simple Insert Simulation
+        elif verb == "insert":
+            # Simple Insert Simulation (params are not persisted in the demo store)
             self.rowcount = 1
-            if "INTO MEDICATIONS" in q_upper:
-                # Naive insert parsing - assumes params match dict order (fragile but fine for demo)
-                pass 
-            elif "INTO PATIENTS" in q_upper:
-                pass
             self.rows = []
+            _bump_store_version()
         else:
             self.rows = []
             
@@ -95,6 +207,9 @@ class MockCursor:
     def fetchone(self):
         return self.rows[0] if self.rows else None
         
+    def __iter__(self):
+        return iter(self.rows)
+        
     def close(self):
         pass
 
@@ -124,6 +239,41 @@ class MockConnection:
     def __exit__(self, exc_type, exc_val, exc_tb):
         pass
 
+def _make_blocking_pool(pool_module, min_connections: int, max_connections: int,
+                        timeout: float, **conn_kwargs):
+    """
+    Build a ThreadedConnectionPool that queues callers when exhausted
+
+    psycopg2's pool raises PoolError as soon as max_connections are checked
+    out. Gating getconn() with a semaphore makes bursts wait for a free
+    connection instead, so max_connections can be sized to what Postgres
+    (or PgBouncer in front of it) can actually serve.
+    """
+    class BlockingThreadedConnectionPool(pool_module.ThreadedConnectionPool):
+        def __init__(self):
+            self._slots = threading.BoundedSemaphore(max_connections)
+            super().__init__(min_connections, max_connections, **conn_kwargs)
+
+        def getconn(self, key=None):
+            if not self._slots.acquire(timeout=timeout):
+                raise pool_module.PoolError(
+                    f"no connection available within {timeout}s"
+                )
+            try:
+                return super().getconn(key)
+            except Exception:
+                self._slots.release()
+                raise
+
+        def putconn(self, conn=None, key=None, close=False):
+            try:
+                super().putconn(conn, key, close)
+            finally:
+                self._slots.release()
+
+    return BlockingThreadedConnectionPool()
+
+
 class DatabaseConnectionManager:
     """Manages connection pools for multiple database shards"""
     
@@ -140,16 +290,24 @@ class DatabaseConnectionManager:
                   database: str,
                   username: str,
                   password: str,
-                  min_connections: int = 2,
-                  max_connections: int = 10):
-        """Add a database shard with connection pooling"""
+                  min_connections: int = POOL_MIN_CONNECTIONS,
+                  max_connections: int = POOL_MAX_CONNECTIONS,
+                  pool_timeout: float = POOL_TIMEOUT):
+        """
+        Add a database shard with connection pooling
+        
+        The pool opens min_connections immediately (pre-warmed) and grows
+        on demand up to max_connections.
+        """
         try:
             import psycopg2
             from psycopg2 import pool
             
-            connection_pool = pool.ThreadedConnectionPool(
+            connection_pool = _make_blocking_pool(
+                pool,
                 min_connections,
                 max_connections,
+                pool_timeout,
                 host=host,
                 port=port,
                 database=database,
@@ -171,7 +329,7 @@ class DatabaseConnectionManager:
         """Get a connection from the shard pool (context manager)"""
         if shard_id not in self.shard_pools:
             # Auto-initialize fallback if shard missing
-            logger.warning(f"Shard {shard_id} not initialized. Using Mock.")
+            logger.warning("Shard %s not initialized. Using Mock.", shard_id)
             self.shard_pools[shard_id] = "MOCK_POOL"
         
         pool = self.shard_pools[shard_id]
@@ -184,6 +342,48 @@ class DatabaseConnectionManager:
                 conn.close()
             return
 
+        held = _request_connections.get()
+        if held is not None:
+            # Inside a request scope: nested blocks share one connection per
+            # shard; the outermost block commits and returns it to the pool,
+            # so a failed commit surfaces as an error and no connection is
+            # held across slow non-database work later in the request
+            entry = held.get(shard_id)
+            if entry is None:
+                # [connection, nesting depth, failed]
+                entry = held[shard_id] = [pool.getconn(), 0, False]
+            connection = entry[0]
+            entry[1] += 1
+            try:
+                yield connection
+            except Exception as e:
+                # Even if an outer block catches this, its transaction must not
+                # commit partial work; the outermost block rolls back instead
+                entry[2] = True
+                logger.error("Database error on Shard %s: %s", shard_id, e)
+                raise
+            except BaseException:
+                entry[2] = True
+                raise
+            finally:
+                # Only the outermost block gives the connection up, so an outer
+                # block never keeps using a connection already back in the pool
+                entry[1] -= 1
+                if entry[1] == 0:
+                    del held[shard_id]
+                    try:
+                        if entry[2]:
+                            connection.rollback()
+                        else:
+                            connection.commit()
+                    except Exception as e:
+                        connection.rollback()
+                        logger.error("Database error on Shard %s: %s", shard_id, e)
+                        raise
+                    finally:
+                        pool.putconn(connection)
+            return
+
         connection = None
         try:
             connection = pool.getconn()
@@ -192,12 +392,41 @@ class DatabaseConnectionManager:
         except Exception as e:
             if connection:
                 connection.rollback()
-            logger.error(f"❌ Database error on Shard {shard_id}: {e}")
+            # Lazy %-formatting: only rendered if a handler emits it
+            logger.error("Database error on Shard %s: %s", shard_id, e)
             raise
         finally:
             if connection:
                 pool.putconn(connection)
     
+    def begin_request(self) -> Token:
+        """
+        Open a request scope in which nested get_connection() blocks reuse
+        one pooled connection per shard instead of checking out one each
+        
+        Returns:
+            Token to pass to end_request()
+        """
+        return _request_connections.set({})
+    
+    def end_request(self, token: Token, error: Optional[BaseException] = None):
+        """
+        Close a request scope: roll back and return any connection still
+        held (e.g. a generator abandoned mid-block) to its pool. Commits
+        happen when the outermost get_connection() block exits.
+        """
+        held = _request_connections.get() or {}
+        _request_connections.reset(token)
+        
+        for shard_id, (connection, _depth, _failed) in held.items():
+            pool = self.shard_pools[shard_id]
+            try:
+                connection.rollback()
+            except Exception as e:
+                logger.error("Database error on Shard %s: %s", shard_id, e)
+            finally:
+                pool.putconn(connection)
+    
     def close_all(self):
         """Close all connection pools"""
         for shard_id, pool in self.shard_pools.items():
@@ -206,6 +435,93 @@ class DatabaseConnectionManager:
                 logger.info(f"✅ Closed connection pool for Shard {shard_id}")
 
 
+@lru_cache(maxsize=None)
+def _to_pyformat(query: str) -> str:
+    """Rewrite $n placeholders as psycopg2 %(n)s (literal % doubled)"""
+    return re.sub(r"\$(\d+)", r"%(\1)s", query.replace("%", "%%"))
+
+
+def execute_prepared(cursor, name: str, query: str, params: tuple):
+    """
+    Execute a query through a server-side prepared statement
+    
+    The first call on each pooled connection issues PREPARE; every call
+    then runs EXECUTE, so Postgres skips parsing and planning the query.
+    With DB_SERVER_PREPARE off (PgBouncer transaction pooling: the backend
+    that saw PREPARE need not be the one that gets EXECUTE) the query is
+    sent as a plain parameterized statement instead.
+    
+    Args:
+        cursor: Cursor from get_connection()
+        name: Statement name (a fixed identifier, never user input)
+        query: SQL using $1..$n placeholders
+        params: Values for the placeholders
+    """
+    connection = getattr(cursor, "connection", None)
+    if connection is None:
+        # MockCursor: no server to prepare on
+        cursor.execute(query, params)
+        return
+    
+    if not DB_SERVER_PREPARE:
+        cursor.execute(_to_pyformat(query), {str(i): v for i, v in enumerate(params, 1)})
+        return
+    
+    prepared = _prepared_statements.get(connection)
+    if prepared is None:
+        prepared = _prepared_statements[connection] = set()
+    
+    if name not in prepared:
+        cursor.execute(f"PREPARE {name} AS {query}")
+        prepared.add(name)
+    
+    placeholders = ", ".join(["%s"] * len(params))
+    cursor.execute(f"EXECUTE {name} ({placeholders})", params)
+
+
+def jsonb(value: Any):
+    """
+    Wrap a dict/list parameter so psycopg2 sends it as JSON for a JSONB column
+    
+    None stays SQL NULL. psycopg2 is imported lazily so callers load in mock
+    mode without it; there the value is passed through (MockCursor ignores it).
+    """
+    if value is None:
+        return None
+    try:
+        from psycopg2.extras import Json
+    except ImportError:
+        return value
+    return Json(value)
+
+
+def execute_values(cursor, query: str, rows: List[tuple], page_size: int = 100,
+                   template: Optional[str] = None):
+    """
+    Insert many rows with one multi-row statement per page_size rows
+    
+    Wraps psycopg2.extras.execute_values: `query` holds a single %s where
+    the VALUES list goes, e.g. "INSERT INTO t (a, b) VALUES %s".
+    
+    Args:
+        cursor: Cursor from get_connection()
+        query: SQL with one %s placeholder for the VALUES list
+        rows: Tuples of column values
+        page_size: Rows per statement
+        template: Per-row snippet, e.g. "(%s::uuid, %s)" (default: plain %s per column)
+    """
+    if not rows:
+        return
+    
+    if getattr(cursor, "connection", None) is None:
+        # MockCursor: rows aren't persisted, one execute simulates the insert
+        cursor.execute(query)
+        return
+    
+    from psycopg2.extras import execute_values as _execute_values
+    _execute_values(cursor, query, rows, template=template, page_size=page_size)
+
+
 # Global database manager instance
 db_manager: Optional[DatabaseConnectionManager] = None
 
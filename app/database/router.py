@@ -1,8 +1,21 @@
 """
 Database Sharding Router
 Routes queries to appropriate PostgreSQL shard based on user_id hash.
+
+Hash algorithms:
+    sha256 (default): first 32 bits of SHA-256(user_id). Used by all
+                      existing deployments.
+    crc32:            zlib.crc32(user_id), PCLMULQDQ-accelerated and much
+                      cheaper per call. Sharding only needs a uniform
+                      spread, not collision resistance.
+
+Migration note: the two algorithms place users on different shards.
+Only pick crc32 for a fresh cluster (or a new tenant with its own
+shards); switching an existing cluster requires re-routing every row.
 """
 import hashlib
+import zlib
+from functools import lru_cache
 from typing import Literal
 import logging
 
@@ -10,19 +23,48 @@ logger = logging.getLogger(__name__)
 
 ShardId = Literal[0, 1]
 
+SHARD_HASH_ALGORITHMS = ("sha256", "crc32")
+
+# Max number of user_id -> shard assignments kept in memory
+SHARD_CACHE_SIZE = 100_000
+
+
+@lru_cache(maxsize=SHARD_CACHE_SIZE)
+def _shard_for(user_id: str, num_shards: int, algorithm: str) -> int:
+    """Pure hash(user_id) % num_shards, memoized so each user hashes once"""
+    if algorithm == "crc32":
+        hash_int = zlib.crc32(user_id.encode('utf-8'))
+    else:
+        # Hash the user_id using SHA-256 (OpenSSL-backed, uses SHA-NI where available)
+        hash_digest = hashlib.sha256(user_id.encode('utf-8')).digest()
+        
+        # First 4 bytes as big-endian int (same value as int(hexdigest[:8], 16))
+        hash_int = int.from_bytes(hash_digest[:4], 'big')
+    
+    # Modulo to determine shard
+    return hash_int % num_shards
+
 
 class ShardRouter:
     """Routes database queries to the correct shard based on user_id"""
     
-    def __init__(self, num_shards: int = 2):
+    def __init__(self, num_shards: int = 2, algorithm: str = "sha256"):
         """
         Initialize shard router
         
         Args:
             num_shards: Total number of shards (default: 2)
+            algorithm: Hash used for routing, "sha256" (default) or "crc32"
         """
+        if algorithm not in SHARD_HASH_ALGORITHMS:
+            raise ValueError(f"Unknown shard hash algorithm: {algorithm}")
         self.num_shards = num_shards
-        logger.info(f"✅ Shard router initialized with {num_shards} shards")
+        self.algorithm = algorithm
+        
+        # Lookups routed to each shard; a plain int add per call is far
+        # cheaper than logging every lookup (approximate under threads)
+        self.routing_counts = [0] * num_shards
+        logger.info(f"✅ Shard router initialized with {num_shards} shards ({algorithm})")
     
     def get_shard_id(self, user_id: str) -> ShardId:
         """
@@ -30,6 +72,11 @@ class ShardRouter:
         
         Strategy: hash(user_id) % num_shards
         
+        The default hash is SHA-256; changing it would move existing users
+        to a different shard. hashlib delegates to OpenSSL, which picks
+        SHA-NI/ARMv8 SHA instructions at runtime, so a 36-byte UUID costs a
+        single accelerated compression.
+        
         Args:
             user_id: Patient UUID as string
             
@@ -40,16 +87,8 @@ class ShardRouter:
             >>> router.get_shard_id("550e8400-e29b-41d4-a716-446655440000")
             0
         """
-        # Hash the user_id using SHA-256
-        hash_digest = hashlib.sha256(user_id.encode('utf-8')).hexdigest()
-        
-        # Convert first 8 chars of hex to integer
-        hash_int = int(hash_digest[:8], 16)
-        
-        # Modulo to determine shard
-        shard_id = hash_int % self.num_shards
-        
-        logger.debug(f"User {user_id[:8]}... → Shard {shard_id}")
+        shard_id = _shard_for(user_id, self.num_shards, self.algorithm)
+        self.routing_counts[shard_id] += 1
         return shard_id
     
     def validate_shard_consistency(self, user_id: str, stored_shard_id: int) -> bool:
@@ -79,10 +118,10 @@ class ShardRouter:
 shard_router: ShardRouter = None
 
 
-def init_shard_router(num_shards: int = 2) -> ShardRouter:
+def init_shard_router(num_shards: int = 2, algorithm: str = "sha256") -> ShardRouter:
     """Initialize the global shard router"""
     global shard_router
-    shard_router = ShardRouter(num_shards)
+    shard_router = ShardRouter(num_shards, algorithm)
     return shard_router
 
 
@@ -2,66 +2,84 @@
 AuraHealth Flask Application
 Main entry point with security infrastructure initialization.
 """
-from flask import Flask, jsonify
+from flask import Flask, g, jsonify, request
 from flask_cors import CORS
 from flask_limiter import Limiter
 from flask_limiter.util import get_remote_address
+from concurrent.futures import ThreadPoolExecutor
+import functools
 import logging
 import os
-from dotenv import load_dotenv
 
-# Load env vars before anything else
-load_dotenv()
+# Load env vars before anything else (skipped when DOTENV_LOAD=0)
+from app.core import config as _config  # noqa: F401
 
 # Import core modules
+# (services and routers are imported inside create_app, so importing this
+# module stays cheap for tooling and tests that never build the app)
+from app.core.cache import init_cache
 from app.core.security import init_encryption
+from app.core.serialization import OrjsonProvider
 from app.database.router import init_shard_router
 from app.database.connection import init_database_manager, get_db_manager
 
-# Import services
-from app.services.patient_service import PatientService
-from app.services.inventory_service import InventoryService
-from app.services.ocr_service import init_ocr_service
-from app.services.notification_service import init_notification_service
-from app.services.digital_twin_service import init_digital_twin_service
-from app.services.clinical_summary_service import init_clinical_summary_service
-from app.services.maps_service import init_maps_service
-from app.services.scraper_service import init_scraper_service
-from app.services.voice_service import init_voice_service
-
-# Import routers
-from app.routers.patient_router import patient_bp, init_patient_router
-from app.routers.prescription_router import prescription_bp
-from app.routers.medication_router import medication_bp, init_medication_router
-from app.routers.digital_twin_router import twin_bp
-from app.routers.hospital_router import hospital_bp
-
-# Configure logging
+# Configure logging (no-op if the root logger already has handlers, e.g.
+# under a test runner or a WSGI server that configures its own)
 logging.basicConfig(
-    level=logging.INFO,
+    level=_config.LOG_LEVEL,
     format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
 )
 logger = logging.getLogger(__name__)
 
 
+def _profile_startup(func):
+    """
+    Profile app construction with cProfile when AURA_PROFILE_STARTUP=1
+    
+    Stats are written to AURA_PROFILE_OUTPUT (default: startup.prof); view
+    them with `python -m pstats startup.prof` or snakeviz. Unset, the
+    wrapper only costs one env lookup per create_app() call.
+    """
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        if os.getenv("AURA_PROFILE_STARTUP") != "1":
+            return func(*args, **kwargs)
+        
+        import cProfile
+        profiler = cProfile.Profile()
+        try:
+            return profiler.runcall(func, *args, **kwargs)
+        finally:
+            output = os.getenv("AURA_PROFILE_OUTPUT", "startup.prof")
+            profiler.dump_stats(output)
+            logger.info("📈 Startup profile written to %s", output)
+    
+    return wrapper
+
+
+@_profile_startup
 def create_app(mock_mode: bool = True) -> Flask:
     """
     Create and configure the Flask application
     
     Args:
-        mock_mode: If True, use mock Vault and skip real DB connections
+        mock_mode: If True, use mock services and skip real DB connections
         
     Returns:
         Configured Flask app
     """
     app = Flask(__name__)
+    app.config["MOCK_MODE"] = mock_mode
+    app.json = OrjsonProvider(app)
     CORS(app)  # Enable CORS for all routes
     
     # ===== SECURITY INITIALIZATION =====
     logger.info("🚀 Initializing AuraHealth Security Infrastructure...")
     
     # Initialize simple config manager
-    from app.core.config import get_config
+    from app.core.config import (
+        get_config, NUM_SHARDS, SHARD_HASH_ALGORITHM, REDIS_URL, DB_POOL_MIN, DB_POOL_MAX
+    )
     config = get_config()
 
     # Initialize encryption
@@ -71,7 +89,7 @@ def create_app(mock_mode: bool = True) -> Flask:
     logger.info("✅ Encryption initialized")
 
     # Initialize shard router
-    init_shard_router(num_shards=2)
+    init_shard_router(num_shards=NUM_SHARDS, algorithm=SHARD_HASH_ALGORITHM)
     logger.info("✅ Database shard router initialized")
 
     # Initialize database connection manager
@@ -79,7 +97,7 @@ def create_app(mock_mode: bool = True) -> Flask:
     
     # Configure database shards
     if not mock_mode:
-        for shard_id in [0, 1]:
+        for shard_id in range(NUM_SHARDS):
             creds = config.get_database_credentials(shard_id)
             db_manager.add_shard(
                 shard_id=shard_id,
@@ -87,67 +105,114 @@ def create_app(mock_mode: bool = True) -> Flask:
                 port=int(creds['port']),
                 database=creds['database'],
                 username=creds['username'],
-                password=creds['password']
+                password=creds['password'],
+                min_connections=DB_POOL_MIN,
+                max_connections=DB_POOL_MAX
             )
         logger.info("✅ Database shards configured (PRODUCTION mode)")
     else:
         logger.info("⚠️  Database in MOCK mode (No connection)")
     
     # 5. Initialize Rate Limiter with Redis
+    # limits' Redis storage runs each check-and-increment as one registered
+    # Lua script (EVALSHA), so every limit costs a single atomic round trip
     limiter = Limiter(
         app=app,
         key_func=get_remote_address,
         default_limits=["100 per minute", "10 per second"],
-        storage_uri="memory://" if mock_mode else "redis://localhost:6379",
-        strategy="fixed-window"
+        storage_uri="memory://" if mock_mode else REDIS_URL,
+        # Weighted current+previous window counts: no 2x burst at window
+        # boundaries, still O(1) state (two counters) per key
+        strategy="sliding-window-counter"
     )
     logger.info("✅ Rate limiter initialized")
     
+    # Shared Redis cache for external API results (disabled in mock mode)
+    init_cache(None if mock_mode else REDIS_URL)
+    
     # ===== SERVICE INITIALIZATION =====
+    from app.services.patient_service import PatientService
+    from app.services.inventory_service import InventoryService
+    from app.services.notification_service import init_notification_service
+    from app.services.digital_twin_service import init_digital_twin_service
+    from app.services.clinical_summary_service import init_clinical_summary_service
+    from app.services.maps_service import init_maps_service
+    from app.routers.patient_router import init_patient_router
+    from app.routers.medication_router import init_medication_router
+    
     patient_service = PatientService()
     init_patient_router(patient_service)
     
-    # Phase 2 services
-    ocr_service = init_ocr_service()
-    notification_service = init_notification_service(mock_mode=mock_mode)
+    # Phase 2 services (OCR is initialized by the prescriptions blueprint)
     inventory_service = InventoryService()
     init_medication_router(inventory_service)
     
     # Phase 3 services
     digital_twin_service = init_digital_twin_service()
     
-    # Clinical summary with Gemini
+    # Notification, clinical summary (Gemini) and maps are independent and
+    # each sets only its own global; their third-party client imports and
+    # setup dominate cold start, so build them concurrently. result()
+    # re-raises any init error here, as the serial calls did.
     gemini_config = config.get_api_key('gemini')
-    clinical_summary_service = init_clinical_summary_service(
-        mock_mode=mock_mode,
-        api_key=gemini_config.get('api_key') if not mock_mode else None,
-        model_name=gemini_config.get('model_name', 'gemini-1.5-flash')
-    )
-    
-    # Maps and other services
     maps_config = config.get_api_key('google_maps')
-    maps_service = init_maps_service(
-        mock_mode=mock_mode, 
-        api_key=maps_config.get('api_key') if not mock_mode else None
-    )
     
-    scraper_service = init_scraper_service(mock_mode=mock_mode)
-    voice_service = init_voice_service(mock_mode=mock_mode)
+    with ThreadPoolExecutor(max_workers=3, thread_name_prefix="service-init") as executor:
+        notification_future = executor.submit(init_notification_service, mock_mode=mock_mode)
+        clinical_summary_future = executor.submit(
+            init_clinical_summary_service,
+            mock_mode=mock_mode,
+            api_key=gemini_config.get('api_key') if not mock_mode else None,
+            model_name=gemini_config.get('model_name', 'gemini-1.5-flash')
+        )
+        maps_future = executor.submit(
+            init_maps_service,
+            mock_mode=mock_mode, 
+            api_key=maps_config.get('api_key') if not mock_mode else None
+        )
     
+    notification_service = notification_future.result()
+    clinical_summary_service = clinical_summary_future.result()
+    maps_service = maps_future.result()
+    
+    # Scraper and voice are initialized by the hospitals blueprint
     logger.info("✅ Phase 2 & 3 services initialized")
     
     # ===== REGISTER BLUEPRINTS =====
+    from app.routers.patient_router import patient_bp
+    from app.routers.prescription_router import prescription_bp
+    from app.routers.medication_router import medication_bp
+    from app.routers.digital_twin_router import twin_bp
+    from app.routers.hospital_router import hospital_bp
+    
     app.register_blueprint(patient_bp)
     app.register_blueprint(prescription_bp)
     app.register_blueprint(medication_bp)
     app.register_blueprint(twin_bp)
     app.register_blueprint(hospital_bp)
     
+    # Twilio sends every call's status updates from a few shared IPs; they
+    # are signature-checked, so don't let them count against rate limits
+    from app.routers.hospital_router import call_status_callback
+    limiter.exempt(call_status_callback)
+    
+    # ===== REQUEST-SCOPED DB CONNECTIONS =====
+    # Nested blocks share a shard connection; teardown only cleans up leftovers
+    @app.before_request
+    def begin_db_scope():
+        g.db_scope = db_manager.begin_request()
+    
+    @app.teardown_request
+    def end_db_scope(exc):
+        token = g.pop('db_scope', None)
+        if token is not None:
+            db_manager.end_request(token, exc)
+    
     # ===== GLOBAL ERROR HANDLERS =====
     @app.errorhandler(429)
     def ratelimit_handler(e):
         """Handle rate limit exceeded"""
-        logger.warning(f"⚠️  Rate limit exceeded: {request.remote_addr}")
+        logger.warning("⚠️  Rate limit exceeded: %s", request.remote_addr)
         return jsonify({
             "error": "Rate limit exceeded",
             "message": str(e.description)
@@ -156,11 +221,14 @@ def create_app(mock_mode: bool = True) -> Flask:
     @app.errorhandler(500)
     def internal_error_handler(e):
         """Handle internal server errors"""
-        logger.error(f"❌ Internal server error: {e}")
+        logger.error("❌ Internal server error: %s", e)
         return jsonify({"error": "Internal server error"}), 500
     
     # ===== ROOT ENDPOINT =====
+    # Root and health probes are exempt from rate limiting so load balancer
+    # checks don't cost a storage round trip (or eat a client's budget)
     @app.route('/')
+    @limiter.exempt
     def root():
         """Root endpoint"""
         return jsonify({
@@ -171,6 +239,7 @@ def create_app(mock_mode: bool = True) -> Flask:
         }), 200
     
     @app.route('/health')
+    @limiter.exempt
     def health():
         """Health check endpoint"""
         return jsonify({"status": "healthy"}), 200
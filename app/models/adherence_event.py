@@ -5,10 +5,11 @@ from dataclasses import dataclass
 from typing import Optional
 from uuid import UUID
 from datetime import datetime
-import uuid
 
+from app.models.ids import fast_uuid4
 
-@dataclass
+
+@dataclass(slots=True)
 class AdherenceEvent:
     """Event tracking medication adherence"""
     
@@ -24,59 +25,67 @@ class AdherenceEvent:
     def create_taken(cls,
                     medication_id: UUID,
                     scheduled_time: datetime,
-                    pills_count: int = 1):
+                    pills_count: int = 1,
+                    now: Optional[datetime] = None):
         """Create a 'taken' event"""
+        now = now or datetime.now()
         return cls(
-            event_id=uuid.uuid4(),
+            event_id=fast_uuid4(),
             medication_id=medication_id,
             event_type='TAKEN',
             pills_count=pills_count,
             scheduled_time=scheduled_time,
-            actual_time=datetime.now(),
-            created_at=datetime.now()
+            actual_time=now,
+            created_at=now
         )
     
     @classmethod
     def create_missed(cls,
                      medication_id: UUID,
-                     scheduled_time: datetime):
+                     scheduled_time: datetime,
+                     now: Optional[datetime] = None):
         """Create a 'missed' event"""
+        now = now or datetime.now()
         return cls(
-            event_id=uuid.uuid4(),
+            event_id=fast_uuid4(),
             medication_id=medication_id,
             event_type='MISSED',
             pills_count=0,
             scheduled_time=scheduled_time,
-            actual_time=datetime.now(),
-            created_at=datetime.now()
+            actual_time=now,
+            created_at=now
         )
     
     @classmethod
     def create_wastage(cls,
                       medication_id: UUID,
-                      pills_count: int):
+                      pills_count: int,
+                      now: Optional[datetime] = None):
         """Create a 'wastage' event"""
+        now = now or datetime.now()
         return cls(
-            event_id=uuid.uuid4(),
+            event_id=fast_uuid4(),
             medication_id=medication_id,
             event_type='WASTAGE',
             pills_count=pills_count,
             scheduled_time=None,
-            actual_time=datetime.now(),
-            created_at=datetime.now()
+            actual_time=now,
+            created_at=now
         )
     
     @classmethod
     def create_refill(cls,
                      medication_id: UUID,
-                     pills_count: int):
+                     pills_count: int,
+                     now: Optional[datetime] = None):
         """Create a 'refill' event"""
+        now = now or datetime.now()
         return cls(
-            event_id=uuid.uuid4(),
+            event_id=fast_uuid4(),
             medication_id=medication_id,
             event_type='REFILL',
             pills_count=pills_count,
             scheduled_time=None,
-            actual_time=datetime.now(),
-            created_at=datetime.now()
+            actual_time=now,
+            created_at=now
         )
@@ -6,10 +6,11 @@ from dataclasses import dataclass
 from typing import List, Optional, Dict
 from uuid import UUID
 from datetime import datetime
-import uuid
 
+from app.models.ids import fast_uuid4
 
-@dataclass
+
+@dataclass(slots=True)
 class ChronicCondition:
     """Chronic health condition detected from medication patterns"""
     
@@ -18,17 +19,27 @@ class ChronicCondition:
     confidence_score: float  # 0.0 to 1.0
     supporting_medications: List[str]
     prescription_count: int
+    
+    def to_dict(self) -> Dict:
+        """Shallow dict for JSON responses (avoids asdict's deep copy)"""
+        return {
+            "condition_name": self.condition_name,
+            "first_detected": self.first_detected,
+            "confidence_score": self.confidence_score,
+            "supporting_medications": self.supporting_medications,
+            "prescription_count": self.prescription_count
+        }
 
 
-@dataclass
+@dataclass(slots=True)
 class DigitalTwinState:
     """Patient's Health Digital Twin state"""
     
     twin_id: UUID
     patient_id: UUID
     
-    # Chronic conditions
-    chronic_conditions: List[ChronicCondition]
+    # Chronic conditions, keyed by condition_name (insertion ordered)
+    chronic_conditions: Dict[str, ChronicCondition]
     
     # Adherence metrics
     overall_adherence_rate: float  # 0-100%
@@ -48,12 +59,13 @@ class DigitalTwinState:
     updated_at: datetime
     
     @classmethod
-    def create(cls, patient_id: UUID):
+    def create(cls, patient_id: UUID, now: Optional[datetime] = None):
         """Create new Digital Twin"""
+        now = now or datetime.now()
         return cls(
-            twin_id=uuid.uuid4(),
+            twin_id=fast_uuid4(),
             patient_id=patient_id,
-            chronic_conditions=[],
+            chronic_conditions={},
             overall_adherence_rate=0.0,
             consistency_index=0.0,
             risk_level="LOW",
@@ -61,20 +73,35 @@ class DigitalTwinState:
             total_prescriptions=0,
             last_acute_episode=None,
             last_acute_date=None,
-            created_at=datetime.now(),
-            updated_at=datetime.now()
+            created_at=now,
+            updated_at=now
         )
     
+    def to_dict(self) -> Dict:
+        """Shallow dict for JSON responses (avoids asdict's deep copy)"""
+        condition_to_dict = ChronicCondition.to_dict
+        return {
+            "twin_id": self.twin_id,
+            "patient_id": self.patient_id,
+            "chronic_conditions": [condition_to_dict(c) for c in self.chronic_conditions.values()],
+            "overall_adherence_rate": self.overall_adherence_rate,
+            "consistency_index": self.consistency_index,
+            "risk_level": self.risk_level,
+            "active_medications_count": self.active_medications_count,
+            "total_prescriptions": self.total_prescriptions,
+            "last_acute_episode": self.last_acute_episode,
+            "last_acute_date": self.last_acute_date,
+            "created_at": self.created_at,
+            "updated_at": self.updated_at
+        }
+    
     def add_chronic_condition(self, condition: ChronicCondition):
         """Add or update chronic condition"""
-        # Check if condition already exists
-        for i, existing in enumerate(self.chronic_conditions):
-            if existing.condition_name == condition.condition_name:
-                self.chronic_conditions[i] = condition
-                return
+        is_new = condition.condition_name not in self.chronic_conditions
+        self.chronic_conditions[condition.condition_name] = condition
         
-        self.chronic_conditions.append(condition)
-        self.updated_at = datetime.now()
+        if is_new:
+            self.updated_at = datetime.now()
     
     def calculate_risk_level(self) -> str:
         """Determine risk level based on adherence"""
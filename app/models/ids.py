@@ -0,0 +1,39 @@
+"""
+Identifier Generation
+Batched random (version 4) UUIDs for model factories.
+
+uuid.uuid4() makes an os.urandom(16) syscall per id. fast_uuid4() draws
+16 * UUID_BATCH_SIZE random bytes at once and hands the UUIDs out from a
+queue, so bulk ingest pays the syscall once per batch.
+"""
+from collections import deque
+from uuid import UUID
+import os
+
+# UUIDs generated per os.urandom() call
+UUID_BATCH_SIZE = 4096
+
+_uuid_pool: deque = deque()
+
+
+def _refill():
+    """Generate the next batch of UUIDs"""
+    data = os.urandom(16 * UUID_BATCH_SIZE)
+    _uuid_pool.extend([
+        UUID(bytes=data[i:i + 16], version=4)
+        for i in range(0, len(data), 16)
+    ])
+
+
+def fast_uuid4() -> UUID:
+    """Drop-in replacement for uuid.uuid4() (thread-safe)"""
+    while True:
+        try:
+            return _uuid_pool.popleft()
+        except IndexError:
+            _refill()
+
+
+# A forked worker must not hand out the UUIDs its parent already queued
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_uuid_pool.clear)
@@ -5,10 +5,11 @@ from dataclasses import dataclass
 from typing import Optional, Dict, List
 from uuid import UUID
 from datetime import datetime
-import uuid
 
+from app.models.ids import fast_uuid4
 
-@dataclass
+
+@dataclass(slots=True)
 class MedicationData:
     """Medication record with inventory tracking"""
     
@@ -50,10 +51,11 @@ class MedicationData:
                duration_days: int,
                total_pills: int,
                pharmacy_name: Optional[str] = None,
-               pharmacy_phone: Optional[str] = None):
+               pharmacy_phone: Optional[str] = None,
+               now: Optional[datetime] = None):
         """Create new medication record"""
         return cls(
-            medication_id=uuid.uuid4(),
+            medication_id=fast_uuid4(),
             patient_id=patient_id,
             prescription_id=prescription_id,
             drug_name=drug_name,
@@ -67,7 +69,7 @@ class MedicationData:
             refill_threshold=5,
             pharmacy_name=pharmacy_name,
             pharmacy_phone=pharmacy_phone,
-            created_at=datetime.now()
+            created_at=now or datetime.now()
         )
     
     def needs_refill(self) -> bool:
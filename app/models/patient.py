@@ -5,10 +5,11 @@ Defines the schema for patient records with encrypted fields.
 from dataclasses import dataclass
 from typing import Optional
 from uuid import UUID
-import uuid
 
+from app.models.ids import fast_uuid4
 
-@dataclass
+
+@dataclass(slots=True)
 class PatientRecord:
     """Patient record with encrypted sensitive data"""
     
@@ -21,7 +22,7 @@ class PatientRecord:
     def create(cls, patient_id: Optional[UUID] = None, shard_id: int = 0):
         """Create a new patient record with generated UUID if not provided"""
         if patient_id is None:
-            patient_id = uuid.uuid4()
+            patient_id = fast_uuid4()
         
         return cls(
             patient_id=patient_id,
@@ -31,7 +32,7 @@ class PatientRecord:
         )
 
 
-@dataclass
+@dataclass(slots=True)
 class PatientData:
     """Decrypted patient data for application use"""
     
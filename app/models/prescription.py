@@ -4,10 +4,11 @@ Prescription Data Model
 from dataclasses import dataclass
 from typing import Optional, Dict, Any
 from uuid import UUID
-import uuid
 
+from app.models.ids import fast_uuid4
 
-@dataclass
+
+@dataclass(slots=True)
 class PrescriptionData:
     """Prescription with OCR extracted data"""
     
@@ -20,14 +21,14 @@ class PrescriptionData:
     def create(cls, patient_id: UUID, image: bytes):
         """Create new prescription"""
         return cls(
-            prescription_id=uuid.uuid4(),
+            prescription_id=fast_uuid4(),
             patient_id=patient_id,
             prescription_image=image,
             extracted_data={}
         )
 
 
-@dataclass
+@dataclass(slots=True)
 class ExtractedPrescriptionData:
     """Structured data extracted from prescription OCR"""
     
@@ -0,0 +1,95 @@
+"""
+Request Schemas
+Pydantic models for API request bodies.
+
+Handlers validate raw request bytes with Model.model_validate_json(), so
+JSON parsing, required-field checks and UUID/datetime/int coercion happen
+in one pydantic-core call instead of dict lookups plus fromisoformat().
+"""
+from datetime import datetime
+from typing import List, Optional
+from uuid import UUID
+
+from pydantic import BaseModel, ValidationError
+
+
+class CreatePatientReq(BaseModel):
+    """POST /api/patients/"""
+    
+    name: str
+    medical_history: str
+
+
+class UpdatePatientReq(BaseModel):
+    """PUT /api/patients/<patient_id>"""
+    
+    name: Optional[str] = None
+    medical_history: Optional[str] = None
+
+
+class UploadPrescriptionReq(BaseModel):
+    """POST /api/prescriptions/upload"""
+    
+    patient_id: UUID
+    image: str  # base64-encoded image
+
+
+class ConfirmedMedication(BaseModel):
+    """One medication in a prescription confirmation"""
+    
+    drug_name: str
+    strength: str
+    frequency: str
+    duration_days: int
+    dosage_per_intake: int = 1
+
+
+class ConfirmPrescriptionReq(BaseModel):
+    """POST /api/prescriptions/<prescription_id>/confirm"""
+    
+    patient_id: UUID
+    medications: List[ConfirmedMedication]
+    pharmacy_name: Optional[str] = None
+    pharmacy_phone: Optional[str] = None
+
+
+class MarkTakenReq(BaseModel):
+    """POST /api/medications/<medication_id>/taken"""
+    
+    patient_id: UUID
+    scheduled_time: Optional[datetime] = None
+    pills_count: int = 1
+
+
+class TakenEvent(BaseModel):
+    """One dose in a batch of taken events"""
+    
+    medication_id: UUID
+    patient_id: UUID
+    scheduled_time: Optional[datetime] = None
+    pills_count: int = 1
+
+
+class MarkTakenBatchReq(BaseModel):
+    """POST /api/medications/taken/batch"""
+    
+    events: List[TakenEvent]
+
+
+class MarkMissedReq(BaseModel):
+    """POST /api/medications/<medication_id>/missed"""
+    
+    patient_id: UUID
+    scheduled_time: Optional[datetime] = None
+
+
+class PillsCountReq(BaseModel):
+    """POST /api/medications/<medication_id>/wastage and /refill"""
+    
+    patient_id: UUID
+    pills_count: int
+
+
+def error_details(e: ValidationError) -> list:
+    """JSON-safe validation errors for a 400 response (input not echoed)"""
+    return e.errors(include_url=False, include_context=False, include_input=False)
@@ -2,16 +2,28 @@
 Digital Twin API Router
 Endpoints for Health Digital Twin and clinical summaries.
 """
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, Response, request, jsonify, stream_with_context
+from datetime import datetime
 import logging
 
+from app.models.digital_twin import ChronicCondition
 from app.services.digital_twin_service import get_digital_twin_service
 from app.services.clinical_summary_service import get_clinical_summary_service
-from app.database.connection import get_db_manager
+from app.database.connection import get_db_manager, execute_prepared
 from app.database.router import get_shard_router
 
 logger = logging.getLogger(__name__)
 
+# Medication history for get_clinical_summary (server-side prepared)
+MED_HISTORY_SQL = """
+    SELECT drug_name, strength, frequency, created_at
+    FROM medications
+    WHERE patient_id = $1
+    ORDER BY created_at DESC
+    LIMIT 12
+"""
+MED_HISTORY_COLUMNS = ('drug_name', 'strength', 'frequency', 'created_at')
+
 twin_bp = Blueprint('digital_twin', __name__, url_prefix='/api/twin')
 
 
@@ -34,28 +46,8 @@ def get_digital_twin(patient_id: str):
         twin_service = get_digital_twin_service()
         twin = twin_service.get_or_create_twin(patient_id)
         
-        # Convert to dict
-        conditions = [{
-            "condition_name": c.condition_name,
-            "first_detected": c.first_detected.isoformat(),
-            "confidence_score": c.confidence_score,
-            "supporting_medications": c.supporting_medications,
-            "prescription_count": c.prescription_count
-        } for c in twin.chronic_conditions]
-        
-        return jsonify({
-            "twin_id": str(twin.twin_id),
-            "patient_id": str(twin.patient_id),
-            "chronic_conditions": conditions,
-            "overall_adherence_rate": twin.overall_adherence_rate,
-            "consistency_index": twin.consistency_index,
-            "risk_level": twin.risk_level,
-            "active_medications_count": twin.active_medications_count,
-            "total_prescriptions": twin.total_prescriptions,
-            "last_acute_episode": twin.last_acute_episode,
-            "created_at": twin.created_at.isoformat(),
-            "updated_at": twin.updated_at.isoformat()
-        }), 200
+        # UUIDs/datetimes are encoded by the JSON provider
+        return jsonify(twin.to_dict()), 200
         
     except Exception as e:
         logger.error(f"❌ Error fetching Digital Twin: {e}")
@@ -78,40 +70,9 @@ def get_clinical_summary(patient_id: str):
         }
     """
     try:
-        from datetime import datetime
-        
         max_words = int(request.args.get('max_words', 150))
         
-        # Get Digital Twin
-        twin_service = get_digital_twin_service()
-        twin = twin_service.get_or_create_twin(patient_id)
-        
-        # Get medication history
-        shard_router = get_shard_router()
-        db_manager = get_db_manager()
-        shard_id = shard_router.get_shard_id(patient_id)
-        
-        with db_manager.get_connection(shard_id) as conn:
-            cursor = conn.cursor()
-            cursor.execute(
-                """
-                SELECT drug_name, strength, frequency, created_at
-                FROM medications
-                WHERE patient_id = %s
-                ORDER BY created_at DESC
-                LIMIT 12
-                """,
-                (patient_id,)
-            )
-            
-            med_history = []
-            for row in cursor.fetchall():
-                med_history.append({
-                    "drug_name": row[0],
-                    "strength": row[1],
-                    "frequency": row[2],
-                    "created_at": row[3].isoformat()
-                })
+        twin, med_history = _summary_inputs(patient_id)
         
         # Generate summary
         summary_service = get_clinical_summary_service()
@@ -120,7 +81,7 @@ def get_clinical_summary(patient_id: str):
         return jsonify({
             "patient_id": patient_id,
             "summary": summary,
-            "generated_at": datetime.now().isoformat(),
+            "generated_at": datetime.now(),
             "word_count": len(summary.split())
         }), 200
         
@@ -129,6 +90,50 @@ def get_clinical_summary(patient_id: str):
         return jsonify({"error": "Internal server error"}), 500
 
 
+@twin_bp.route('/<patient_id>/summary/stream', methods=['GET'])
+def stream_clinical_summary(patient_id: str):
+    """
+    Stream the LLM-generated clinical summary as plain text
+    
+    Text is sent as the model produces it, so clients can render the
+    summary progressively instead of waiting for the full completion.
+    
+    Query Params:
+        max_words: Maximum summary length (default: 150)
+    """
+    try:
+        max_words = int(request.args.get('max_words', 150))
+        twin, med_history = _summary_inputs(patient_id)
+        
+        summary_service = get_clinical_summary_service()
+        chunks = summary_service.generate_summary_stream(twin, med_history, max_words)
+        
+        return Response(stream_with_context(chunks), mimetype='text/plain')
+        
+    except Exception as e:
+        logger.error(f"❌ Error streaming summary: {e}")
+        return jsonify({"error": "Internal server error"}), 500
+
+
+def _summary_inputs(patient_id: str):
+    """Digital Twin and recent medication history for a summary"""
+    twin_service = get_digital_twin_service()
+    twin = twin_service.get_or_create_twin(patient_id)
+    
+    shard_router = get_shard_router()
+    db_manager = get_db_manager()
+    shard_id = shard_router.get_shard_id(patient_id)
+    
+    with db_manager.get_connection(shard_id) as conn:
+        cursor = conn.cursor()
+        execute_prepared(cursor, "med_history", MED_HISTORY_SQL, (patient_id,))
+        
+        # Iterate the cursor directly; created_at stays a datetime
+        med_history = [dict(zip(MED_HISTORY_COLUMNS, row)) for row in cursor]
+    
+    return twin, med_history
+
+
 @twin_bp.route('/<patient_id>/chronic-conditions', methods=['GET'])
 def get_chronic_conditions(patient_id: str):
     """
@@ -143,15 +148,10 @@ def get_chronic_conditions(patient_id: str):
         twin_service = get_digital_twin_service()
         conditions = twin_service.detect_chronic_conditions(patient_id, lookback_months)
         
+        condition_to_dict = ChronicCondition.to_dict
         return jsonify({
             "patient_id": patient_id,
-            "chronic_conditions": [{
-                "condition_name": c.condition_name,
-                "first_detected": c.first_detected.isoformat(),
-                "confidence_score": c.confidence_score,
-                "supporting_medications": c.supporting_medications,
-                "prescription_count": c.prescription_count
-            } for c in conditions],
+            "chronic_conditions": [condition_to_dict(c) for c in conditions],
             "count": len(conditions)
         }), 200
         
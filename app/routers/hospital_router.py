@@ -2,17 +2,74 @@
 Hospital Discovery API Router
 Endpoints for geo-spatial hospital search and calling.
 """
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, current_app, request, jsonify, url_for
 import logging
 
+from app.core.cache import cache_get_json, cache_set_json, cache_set_add, cache_set_contains
+from app.core.config import PUBLIC_BASE_URL
 from app.services.maps_service import get_maps_service
-from app.services.scraper_service import get_scraper_service
-from app.services.voice_service import get_voice_service
+from app.services.scraper_service import get_scraper_service, init_scraper_service
+from app.services.voice_service import get_voice_service, init_voice_service
 
 logger = logging.getLogger(__name__)
 
 hospital_bp = Blueprint('hospitals', __name__, url_prefix='/api/hospitals')
 
+# How long Twilio call statuses are kept for polling
+CALL_STATUS_TTL = 86400
+
+
+def _visited_key(patient_id: str) -> str:
+    """Redis set of place_ids a patient has called or booked"""
+    return f"visited:{patient_id}"
+
+
+def _call_status_url() -> str:
+    """
+    URL Twilio posts call status to, and signs its callbacks with
+    
+    Behind a TLS-terminating proxy the request URL is http://internal-host,
+    which never matches the https URL Twilio signed, so PUBLIC_BASE_URL
+    takes precedence when set.
+    """
+    if PUBLIC_BASE_URL:
+        return PUBLIC_BASE_URL.rstrip('/') + url_for('hospitals.call_status_callback')
+    return url_for('hospitals.call_status_callback', _external=True)
+
+
+def _record_visit(data: dict):
+    """Remember the hospital for smart ranking when the request names both ids"""
+    if data.get('patient_id') and data.get('place_id'):
+        cache_set_add(_visited_key(data['patient_id']), data['place_id'])
+
+
+@hospital_bp.record_once
+def init_hospital_services(state):
+    """Initialize the services only this blueprint uses, on registration"""
+    mock_mode = state.app.config.get("MOCK_MODE", True)
+    init_scraper_service(mock_mode=mock_mode)
+    init_voice_service(mock_mode=mock_mode)
+
+
+def _hospital_to_dict(h) -> dict:
+    """Shape a HospitalData for the search response"""
+    return {
+        "place_id": h.place_id,
+        "name": h.name,
+        "address": h.formatted_address,
+        "location": {
+            "latitude": h.latitude,
+            "longitude": h.longitude
+        },
+        "distance_meters": h.distance_meters,
+        "phone": h.phone_number,
+        "website": h.website,
+        "rating": h.rating,
+        "user_ratings_total": h.user_ratings_total,
+        "visited_before": h.visited_before,
+        "rank_score": h.rank_score
+    }
+
 
 @hospital_bp.route('/search', methods=['GET'])
 def search_hospitals():
@@ -48,29 +105,14 @@ def search_hospitals():
         
         # Smart ranking if patient_id provided
         if patient_id:
-            # TODO: Get visited place_ids from database
-            visited_place_ids = []  # Mock for now
+            # One SMISMEMBER round trip for every candidate
+            place_ids = [h.place_id for h in hospitals]
+            flags = cache_set_contains(_visited_key(patient_id), place_ids)
+            visited_place_ids = {pid for pid, visited in zip(place_ids, flags) if visited}
             hospitals = maps_service.rank_hospitals(hospitals, visited_place_ids)
         
-        # Convert to JSON
-        hospitals_json = []
-        for h in hospitals:
-            hospitals_json.append({
-                "place_id": h.place_id,
-                "name": h.name,
-                "address": h.formatted_address,
-                "location": {
-                    "latitude": h.latitude,
-                    "longitude": h.longitude
-                },
-                "distance_meters": h.distance_meters,
-                "phone": h.phone_number,
-                "website": h.website,
-                "rating": h.rating,
-                "user_ratings_total": h.user_ratings_total,
-                "visited_before": h.visited_before,
-                "rank_score": h.rank_score
-            })
+        # jsonify encodes with orjson (app.json is the OrjsonProvider)
+        hospitals_json = [_hospital_to_dict(h) for h in hospitals]
         
         return jsonify({
             "hospitals": hospitals_json,
@@ -85,12 +127,34 @@ def search_hospitals():
         return jsonify({"error": "Internal server error"}), 500
 
 
+def _details_response(place_id: str, details: dict) -> dict:
+    """Shape scraped hospital details for the API"""
+    return {
+        "place_id": place_id,
+        "opd_timings": details.get("opd_timings"),
+        "departments": details.get("departments", []),
+        "emergency_number": details.get("emergency_number"),
+        "bed_availability": details.get("bed_availability"),
+        "last_scraped": details.get("last_scraped")
+    }
+
+
 @hospital_bp.route('/<place_id>/details', methods=['GET'])
 def get_hospital_details(place_id: str):
     """
     Get detailed hospital information with scraped data
     
-    Response:
+    Scraping runs on the Celery 'scrape' queue: the endpoint returns 202
+    with a job_id to poll at /api/hospitals/<place_id>/details/<job_id>.
+    In mock mode (no broker) details are returned directly with 200.
+    
+    Response (202):
+        {
+            "job_id": "...",
+            "status": "queued"
+        }
+    
+    Response (200):
         {
             "place_id": "...",
             "opd_timings": "...",
@@ -104,39 +168,75 @@ def get_hospital_details(place_id: str):
         
         website = request.args.get('website')
         
-        if website:
+        if not website:
+            return jsonify({"error": "Website URL required for scraping"}), 400
+        
+        if current_app.config.get("MOCK_MODE", True):
             scraper_service = get_scraper_service()
             details = scraper_service.scrape_hospital_details(website, place_id)
-            
-            return jsonify({
-                "place_id": place_id,
-                "opd_timings": details.get("opd_timings"),
-                "departments": details.get("departments", []),
-                "emergency_number": details.get("emergency_number"),
-                "bed_availability": details.get("bed_availability"),
-                "last_scraped": details.get("last_scraped")
-            }), 200
-        else:
-            return jsonify({"error": "Website URL required for scraping"}), 400
+            return jsonify(_details_response(place_id, details)), 200
+        
+        from app.tasks.celery_tasks import scrape_hospital
+        job = scrape_hospital.delay(website, place_id)
+        
+        return jsonify({"job_id": job.id, "status": "queued"}), 202
         
     except Exception as e:
         logger.error(f"❌ Error fetching hospital details: {e}")
         return jsonify({"error": "Internal server error"}), 500
 
 
+@hospital_bp.route('/<place_id>/details/<job_id>', methods=['GET'])
+def get_hospital_details_job(place_id: str, job_id: str):
+    """
+    Poll a queued hospital scrape
+    
+    Returns 202 while the job runs, 200 with the details once done.
+    """
+    try:
+        from app.tasks.celery_tasks import celery_app
+        
+        result = celery_app.AsyncResult(job_id)
+        
+        if not result.ready():
+            return jsonify({"job_id": job_id, "status": "queued"}), 202
+        
+        if result.failed():
+            return jsonify({"job_id": job_id, "status": "failed"}), 500
+        
+        return jsonify(_details_response(place_id, result.result)), 200
+        
+    except Exception as e:
+        logger.error(f"❌ Error polling hospital details job: {e}")
+        return jsonify({"error": "Internal server error"}), 500
+
+
 @hospital_bp.route('/call', methods=['POST'])
 def initiate_hospital_call():
     """
     Initiate click-to-call to hospital
     
+    The Twilio request runs on the Celery 'telephony' queue: the endpoint
+    returns 202 with a job_id to poll at /api/hospitals/call/<job_id>.
+    Twilio reports call progress to /api/hospitals/call/status.
+    In mock mode (no broker) the call result is returned directly with 200.
+    
     Request Body:
         {
             "patient_phone": "+919876543210",
             "hospital_phone": "+919123456789",
-            "hospital_name": "City General Hospital"
+            "hospital_name": "City General Hospital",
+            "patient_id": "...",  // optional, with place_id: remembered for ranking
+            "place_id": "..."     // optional
         }
     
-    Response:
+    Response (202):
+        {
+            "job_id": "...",
+            "status": "queued"
+        }
+    
+    Response (200):
         {
             "success": true,
             "call_sid": "...",
@@ -149,20 +249,91 @@ def initiate_hospital_call():
         if not data or not all(k in data for k in ['patient_phone', 'hospital_phone', 'hospital_name']):
             return jsonify({"error": "Missing required fields"}), 400
         
-        voice_service = get_voice_service()
-        result = voice_service.initiate_call(
-            patient_phone=data['patient_phone'],
-            hospital_phone=data['hospital_phone'],
-            hospital_name=data['hospital_name']
+        _record_visit(data)
+        
+        if current_app.config.get("MOCK_MODE", True):
+            voice_service = get_voice_service()
+            result = voice_service.initiate_call(
+                patient_phone=data['patient_phone'],
+                hospital_phone=data['hospital_phone'],
+                hospital_name=data['hospital_name']
+            )
+            return jsonify(result), 200 if result.get('success') else 500
+        
+        from app.tasks.celery_tasks import place_call
+        job = place_call.delay(
+            data['patient_phone'],
+            data['hospital_phone'],
+            data['hospital_name'],
+            _call_status_url()
         )
         
-        return jsonify(result), 200 if result.get('success') else 500
+        return jsonify({"job_id": job.id, "status": "queued"}), 202
         
     except Exception as e:
         logger.error(f"❌ Error initiating call: {e}")
         return jsonify({"error": "Internal server error"}), 500
 
 
+@hospital_bp.route('/call/status', methods=['POST'])
+def call_status_callback():
+    """
+    Twilio status callback
+    
+    Stores the latest CallStatus/CallDuration per CallSid in Redis so
+    call polls don't need to query Twilio. Exempt from rate limiting
+    (see create_app): requests are authenticated by Twilio's signature.
+    """
+    voice_service = get_voice_service()
+    signature = request.headers.get('X-Twilio-Signature', '')
+    
+    if not voice_service.validate_callback(_call_status_url(), request.form.to_dict(), signature):
+        return jsonify({"error": "Invalid signature"}), 403
+    
+    call_sid = request.form.get('CallSid')
+    if not call_sid:
+        return jsonify({"error": "CallSid required"}), 400
+    
+    cache_set_json(f"call:{call_sid}", {
+        "status": request.form.get('CallStatus'),
+        "duration": request.form.get('CallDuration')
+    }, CALL_STATUS_TTL)
+    
+    return "", 204
+
+
+@hospital_bp.route('/call/<job_id>', methods=['GET'])
+def get_call_job(job_id: str):
+    """
+    Poll a queued hospital call
+    
+    Returns 202 while the call is being placed, then the call result with
+    the latest status reported by Twilio's callback.
+    """
+    try:
+        from app.tasks.celery_tasks import celery_app
+        
+        result = celery_app.AsyncResult(job_id)
+        
+        if not result.ready():
+            return jsonify({"job_id": job_id, "status": "queued"}), 202
+        
+        if result.failed():
+            return jsonify({"job_id": job_id, "status": "failed"}), 500
+        
+        call = dict(result.result)
+        if call.get('call_sid'):
+            reported = cache_get_json(f"call:{call['call_sid']}")
+            if reported:
+                call.update(call_status=reported["status"], duration=reported["duration"])
+        
+        return jsonify(call), 200 if call.get('success') else 500
+        
+    except Exception as e:
+        logger.error(f"❌ Error polling call job: {e}")
+        return jsonify({"error": "Internal server error"}), 500
+
+
 @hospital_bp.route('/appointment', methods=['POST'])
 def book_appointment():
     """
@@ -185,6 +356,9 @@ def book_appointment():
         # 2. POST to hospital's booking API
         # 3. Or generate WhatsApp message with slot request
         
+        if data:
+            _record_visit(data)
+        
         # Mock response
         return jsonify({
             "success": True,
@@ -5,7 +5,11 @@ Endpoints for medication management and adherence tracking.
 from flask import Blueprint, request, jsonify
 import logging
 from datetime import datetime
+from pydantic import ValidationError
 
+from app.models.schemas import (
+    MarkTakenReq, MarkTakenBatchReq, MarkMissedReq, PillsCountReq, error_details
+)
 from app.services.inventory_service import InventoryService
 from app.services.notification_service import get_notification_service
 from app.database.connection import get_db_manager
@@ -15,6 +19,10 @@ logger = logging.getLogger(__name__)
 
 medication_bp = Blueprint('medications', __name__, url_prefix='/api/medications')
 
+# Page size bounds for list_medications
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
 # Initialize service
 inventory_service = None
 
@@ -28,16 +36,27 @@ def init_medication_router(service: InventoryService):
 @medication_bp.route('/', methods=['GET'])
 def list_medications():
     """
-    List all active medications for a patient
+    List all active medications for a patient, newest first
     
     Query Params:
         patient_id: Required
+        limit: Page size (default: 50, max: 200)
+        offset: Rows to skip (default: 0)
     """
     try:
         patient_id = request.args.get('patient_id')
         if not patient_id:
             return jsonify({"error": "patient_id required"}), 400
         
+        try:
+            limit = min(int(request.args.get('limit', DEFAULT_PAGE_SIZE)), MAX_PAGE_SIZE)
+            offset = int(request.args.get('offset', 0))
+        except ValueError:
+            return jsonify({"error": "limit and offset must be integers"}), 400
+        
+        if limit < 1 or offset < 0:
+            return jsonify({"error": "limit must be positive and offset non-negative"}), 400
+        
         shard_router = get_shard_router()
         db_manager = get_db_manager()
         
@@ -52,13 +71,14 @@ def list_medications():
                 FROM medications
                 WHERE patient_id = %s AND pills_remaining > 0
                 ORDER BY created_at DESC
+                LIMIT %s OFFSET %s
                 """,
-                (patient_id,)
+                (patient_id, limit, offset)
             )
             
-            medications = []
-            for row in cursor.fetchall():
-                medications.append({
+            # Iterate the cursor directly (no intermediate fetchall() list)
+            medications = [
+                {
                     "medication_id": str(row[0]),
                     "drug_name": row[1],
                     "strength": row[2],
@@ -66,9 +86,15 @@ def list_medications():
                     "pills_remaining": row[4],
                     "total_pills": row[5],
                     "schedule": row[6]
-                })
+                }
+                for row in cursor
+            ]
             
-            return jsonify({"medications": medications}), 200
+            return jsonify({
+                "medications": medications,
+                "limit": limit,
+                "offset": offset
+            }), 200
             
     except Exception as e:
         logger.error(f"❌ Error listing medications: {e}")
@@ -88,27 +114,15 @@ def mark_taken(medication_id: str):
         }
     """
     try:
-        data = request.get_json()
-        
-        if not data or 'patient_id' not in data:
-            return jsonify({"error": "patient_id required"}), 400
-        
-        patient_id = data['patient_id']
-        scheduled_time_str = data.get('scheduled_time')
-        pills_count = data.get('pills_count', 1)
-        
-        # Parse datetime
-        if scheduled_time_str:
-            scheduled_time = datetime.fromisoformat(scheduled_time_str)
-        else:
-            scheduled_time = datetime.now()
+        # Parses and validates the body (including scheduled_time) in one call
+        req = MarkTakenReq.model_validate_json(request.get_data())
         
         # Record event
         success = inventory_service.record_taken(
             medication_id=medication_id,
-            patient_id=patient_id,
-            scheduled_time=scheduled_time,
-            pills_count=pills_count
+            patient_id=str(req.patient_id),
+            scheduled_time=req.scheduled_time or datetime.now(),
+            pills_count=req.pills_count
         )
         
         if success:
@@ -116,11 +130,49 @@ def mark_taken(medication_id: str):
         else:
             return jsonify({"error": "Failed to record"}), 500
             
+    except ValidationError as e:
+        return jsonify({"error": "Invalid request body", "details": error_details(e)}), 400
     except Exception as e:
         logger.error(f"❌ Error marking taken: {e}")
         return jsonify({"error": "Internal server error"}), 500
 
 
+@medication_bp.route('/taken/batch', methods=['POST'])
+def mark_taken_batch():
+    """
+    Mark a batch of doses as taken (offline sync)
+    
+    Request Body:
+        {
+            "events": [
+                {
+                    "medication_id": "...",
+                    "patient_id": "...",
+                    "scheduled_time": "2026-01-08T09:00:00",
+                    "pills_count": 1
+                }
+            ]
+        }
+    
+    Events are committed per database shard; on a 500 the events of shards
+    written before the failure are already recorded.
+    """
+    try:
+        req = MarkTakenBatchReq.model_validate_json(request.get_data())
+        
+        recorded = inventory_service.record_taken_many(
+            [event.model_dump() for event in req.events]
+        )
+        
+        return jsonify({"message": "Marked as taken", "recorded": recorded}), 200
+            
+    except ValidationError as e:
+        return jsonify({"error": "Invalid request body", "details": error_details(e)}), 400
+    except Exception as e:
+        logger.error(f"❌ Error marking batch taken: {e}")
+        return jsonify({"error": "Internal server error"}), 500
+
+
 @medication_bp.route('/<medication_id>/missed', methods=['POST'])
 def mark_missed(medication_id: str):
     """
@@ -133,23 +185,12 @@ def mark_missed(medication_id: str):
         }
     """
     try:
-        data = request.get_json()
-        
-        if not data or 'patient_id' not in data:
-            return jsonify({"error": "patient_id required"}), 400
-        
-        patient_id = data['patient_id']
-        scheduled_time_str = data.get('scheduled_time')
-        
-        if scheduled_time_str:
-            scheduled_time = datetime.fromisoformat(scheduled_time_str)
-        else:
-            scheduled_time = datetime.now()
+        req = MarkMissedReq.model_validate_json(request.get_data())
         
         success = inventory_service.record_missed(
             medication_id=medication_id,
-            patient_id=patient_id,
-            scheduled_time=scheduled_time
+            patient_id=str(req.patient_id),
+            scheduled_time=req.scheduled_time or datetime.now()
         )
         
         if success:
@@ -157,6 +198,8 @@ def mark_missed(medication_id: str):
         else:
             return jsonify({"error": "Failed to record"}), 500
             
+    except ValidationError as e:
+        return jsonify({"error": "Invalid request body", "details": error_details(e)}), 400
     except Exception as e:
         logger.error(f"❌ Error marking missed: {e}")
         return jsonify({"error": "Internal server error"}), 500
@@ -174,15 +217,12 @@ def record_wastage_endpoint(medication_id: str):
         }
     """
     try:
-        data = request.get_json()
-        
-        if not data or 'patient_id' not in data or 'pills_count' not in data:
-            return jsonify({"error": "patient_id and pills_count required"}), 400
+        req = PillsCountReq.model_validate_json(request.get_data())
         
         success = inventory_service.record_wastage(
             medication_id=medication_id,
-            patient_id=data['patient_id'],
-            pills_count=data['pills_count']
+            patient_id=str(req.patient_id),
+            pills_count=req.pills_count
         )
         
         if success:
@@ -190,6 +230,8 @@ def record_wastage_endpoint(medication_id: str):
         else:
             return jsonify({"error": "Failed to record"}), 500
             
+    except ValidationError as e:
+        return jsonify({"error": "Invalid request body", "details": error_details(e)}), 400
     except Exception as e:
         logger.error(f"❌ Error recording wastage: {e}")
         return jsonify({"error": "Internal server error"}), 500
@@ -207,15 +249,12 @@ def refill_medication(medication_id: str):
         }
     """
     try:
-        data = request.get_json()
-        
-        if not data or 'patient_id' not in data or 'pills_count' not in data:
-            return jsonify({"error": "patient_id and pills_count required"}), 400
+        req = PillsCountReq.model_validate_json(request.get_data())
         
         success = inventory_service.record_refill(
             medication_id=medication_id,
-            patient_id=data['patient_id'],
-            pills_count=data['pills_count']
+            patient_id=str(req.patient_id),
+            pills_count=req.pills_count
         )
         
         if success:
@@ -223,6 +262,8 @@ def refill_medication(medication_id: str):
         else:
             return jsonify({"error": "Failed to record"}), 500
             
+    except ValidationError as e:
+        return jsonify({"error": "Invalid request body", "details": error_details(e)}), 400
     except Exception as e:
         logger.error(f"❌ Error recording refill: {e}")
         return jsonify({"error": "Internal server error"}), 500
@@ -6,7 +6,9 @@ from flask import Blueprint, request, jsonify
 from flask_limiter import Limiter
 from flask_limiter.util import get_remote_address
 import logging
+from pydantic import ValidationError
 
+from app.models.schemas import CreatePatientReq, UpdatePatientReq, error_details
 from app.services.patient_service import PatientService
 
 logger = logging.getLogger(__name__)
@@ -44,14 +46,11 @@ def create_patient():
         }
     """
     try:
-        data = request.get_json()
-        
-        if not data or 'name' not in data or 'medical_history' not in data:
-            return jsonify({"error": "Missing required fields: name, medical_history"}), 400
+        req = CreatePatientReq.model_validate_json(request.get_data())
         
         patient = patient_service.create_patient(
-            name=data['name'],
-            medical_history=data['medical_history']
+            name=req.name,
+            medical_history=req.medical_history
         )
         
         return jsonify({
@@ -61,6 +60,8 @@ def create_patient():
             "shard_id": patient.shard_id
         }), 201
         
+    except ValidationError as e:
+        return jsonify({"error": "Invalid request body", "details": error_details(e)}), 400
     except Exception as e:
         logger.error(f"❌ Error creating patient: {e}")
         return jsonify({"error": "Internal server error"}), 500
@@ -109,15 +110,15 @@ def update_patient(patient_id: str):
         }
     """
     try:
-        data = request.get_json()
+        req = UpdatePatientReq.model_validate_json(request.get_data())
         
-        if not data:
+        if not req.model_fields_set:
             return jsonify({"error": "No data provided"}), 400
         
         success = patient_service.update_patient(
             patient_id=patient_id,
-            name=data.get('name'),
-            medical_history=data.get('medical_history')
+            name=req.name,
+            medical_history=req.medical_history
         )
         
         if not success:
@@ -125,6 +126,8 @@ def update_patient(patient_id: str):
         
         return jsonify({"message": "Patient updated successfully"}), 200
         
+    except ValidationError as e:
+        return jsonify({"error": "Invalid request body", "details": error_details(e)}), 400
     except Exception as e:
         logger.error(f"❌ Error updating patient: {e}")
         return jsonify({"error": "Internal server error"}), 500
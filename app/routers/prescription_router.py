@@ -2,36 +2,130 @@
 Prescription API Router
 Endpoints for uploading prescriptions and running OCR.
 """
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, current_app, request, jsonify
 import logging
 from uuid import UUID
-import base64
+import hashlib
+from pydantic import ValidationError
 
-from app.services.ocr_service import get_ocr_service
+try:
+    from pybase64 import b64decode  # SIMD decoder for multi-MB scans
+except ImportError:
+    from base64 import b64decode
+
+from app.models.ids import fast_uuid4
+from app.models.schemas import UploadPrescriptionReq, ConfirmPrescriptionReq, error_details
+from app.services.ocr_service import get_ocr_service, init_ocr_service
 from app.services.semantic_parser import get_semantic_parser
+from app.services.storage_service import get_storage_service, init_storage_service
+from app.services.digital_twin_service import invalidate_twin
 from app.core.security import get_encryption_manager
-from app.database.connection import get_db_manager
+from app.database.connection import get_db_manager, execute_values, jsonb
 from app.database.router import get_shard_router
 
 logger = logging.getLogger(__name__)
 
 prescription_bp = Blueprint('prescriptions', __name__, url_prefix='/api/prescriptions')
 
+# A 'pending' row older than this is treated as a lost OCR job
+OCR_PENDING_TIMEOUT_S = 15 * 60
+
+# Rows a re-upload may reuse: finished OCR, or a job still in flight
+_REUSABLE_UPLOAD = """
+    (status = 'completed'
+     OR (status = 'pending' AND created_at > NOW() - %s * INTERVAL '1 second'))
+"""
+
+# Earlier upload of the same scan by the same patient
+DUPLICATE_UPLOAD_SQL = f"""
+    SELECT prescription_id, extracted_data, status
+    FROM prescriptions
+    WHERE patient_id = %s AND image_hash = %s AND {_REUSABLE_UPLOAD}
+"""
+
+# Upload whose OCR job could not be enqueued
+MARK_OCR_FAILED_SQL = """
+    UPDATE prescriptions
+    SET status = 'failed'
+    WHERE prescription_id = %s AND patient_id = %s
+"""
+
+# Failed or stuck earlier upload of the same scan, replaced by the re-upload
+DISCARD_FAILED_UPLOAD_SQL = f"""
+    DELETE FROM prescriptions
+    WHERE patient_id = %s AND image_hash = %s AND NOT {_REUSABLE_UPLOAD}
+    RETURNING storage_key
+"""
+
+
+@prescription_bp.record_once
+def init_prescription_services(state):
+    """Initialize the services only this blueprint uses, on registration"""
+    init_ocr_service()
+    
+    if state.app.config.get("MOCK_MODE", True):
+        init_storage_service()
+    else:
+        from app.core.config import S3_BUCKET, S3_ENDPOINT_URL
+        init_storage_service(S3_BUCKET, S3_ENDPOINT_URL)
+
+
+def _discard_failed_upload(cursor, patient_id: str, image_hash: str) -> list:
+    """Delete a failed or stuck earlier upload of the same image so OCR reruns
+    
+    Returns:
+        Object storage keys of the deleted rows' images
+    """
+    cursor.execute(DISCARD_FAILED_UPLOAD_SQL, (patient_id, image_hash, OCR_PENDING_TIMEOUT_S))
+    return [row[0] for row in cursor.fetchall() if row[0]]
+
+
+def _find_duplicate_upload(cursor, patient_id: str, image_hash: str):
+    """Response body for a completed or in-flight upload of the same image, or None"""
+    cursor.execute(DUPLICATE_UPLOAD_SQL, (patient_id, image_hash, OCR_PENDING_TIMEOUT_S))
+    row = cursor.fetchone()
+    if not row:
+        return None
+    
+    return {
+        "prescription_id": str(row[0]),
+        "status": row[2],
+        "extracted_data": row[1],
+        "duplicate": True
+    }
+
 
 @prescription_bp.route('/upload', methods=['POST'])
 def upload_prescription():
     """
     Upload prescription image and run OCR
     
+    OCR runs on the Celery 'ocr' queue: the encrypted image is stored with
+    status 'pending' and the endpoint returns 202 immediately; poll
+    GET /api/prescriptions/<id> for the result. In mock mode (no broker)
+    OCR runs inline and the result is returned with 201.
+    
+    Re-uploading a scan the patient already sent (e.g. a client retry)
+    returns the existing prescription with 200 instead of running OCR again.
+    An earlier upload whose OCR failed (or has been pending for longer than
+    OCR_PENDING_TIMEOUT_S) is replaced and OCR runs again.
+    
     Request Body:
         {
             "patient_id": "550e8400-e29b-41d4-a716-446655440000",
             "image": "<base64-encoded-image>"
         }
     
-    Response:
+    Response (202):
         {
             "prescription_id": "...",
+            "status": "pending"
+        }
+    
+    Response (201, mock mode):
+        {
+            "prescription_id": "...",
+            "status": "completed",
             "extracted_data": {
                 "pharmacy_name": "...",
                 "medications": [...]
@@ -39,57 +133,115 @@ def upload_prescription():
         }
     """
     try:
-        data = request.get_json()
+        req = UploadPrescriptionReq.model_validate_json(request.get_data())
         
-        if not data or 'patient_id' not in data or 'image' not in data:
-            return jsonify({"error": "Missing patient_id or image"}), 400
-        
-        patient_id = data['patient_id']
-        image_base64 = data['image']
+        patient_id = str(req.patient_id)
+        image_base64 = req.image
         
         # Decode base64 image
         try:
-            image_bytes = base64.b64decode(image_base64)
+            image_bytes = b64decode(image_base64, validate=True)
         except Exception as e:
             return jsonify({"error": "Invalid base64 image"}), 400
         
-        # Run OCR
-        ocr_service = get_ocr_service()
-        text = ocr_service.extract_text(image_bytes)
-        extracted_data = ocr_service.extract_structured_data(text)
-        
-        # Encrypt and store prescription
-        encryption = get_encryption_manager()
         shard_router = get_shard_router()
         db_manager = get_db_manager()
-        
         shard_id = shard_router.get_shard_id(patient_id)
         
+        # Same scan uploaded before -> reuse its OCR result unless OCR failed
+        image_hash = hashlib.blake2b(image_bytes, digest_size=32).hexdigest()
+        with db_manager.get_connection(shard_id) as conn:
+            cursor = conn.cursor()
+            discarded_keys = _discard_failed_upload(cursor, patient_id, image_hash)
+            duplicate = _find_duplicate_upload(cursor, patient_id, image_hash)
+        
+        storage = get_storage_service()
+        for key in discarded_keys:
+            storage.delete(key)
+        
+        if duplicate:
+            return jsonify(duplicate), 200
+        
+        # Run OCR inline only when there is no worker to hand it to
+        run_inline = current_app.config.get("MOCK_MODE", True)
+        if run_inline:
+            ocr_service = get_ocr_service()
+            text = ocr_service.extract_text(image_bytes)
+            extracted_data = ocr_service.extract_structured_data(text)
+            status = 'completed'
+        else:
+            text = None
+            extracted_data = None
+            status = 'pending'
+        
+        # Encrypt and store prescription
+        encryption = get_encryption_manager()
+        
         # Encrypt image
         encrypted_image = encryption.encrypt(image_base64, patient_id)
         
         # Store prescription
-        import uuid
-        prescription_id = str(uuid.uuid4())
+        prescription_id = str(fast_uuid4())
+        
+        # Keep the blob out of the row when object storage is configured
+        storage_key = None
+        if storage.enabled:
+            storage_key = storage.object_key(prescription_id)
+            storage.put(storage_key, encrypted_image)
+            encrypted_image = None
         
         with db_manager.get_connection(shard_id) as conn:
             cursor = conn.cursor()
             cursor.execute(
                 """
-                INSERT INTO prescriptions (prescription_id, patient_id, prescription_image, extracted_data)
-                VALUES (%s, %s, %s, %s)
+                INSERT INTO prescriptions (prescription_id, patient_id, prescription_image, storage_key, image_hash, extracted_data, status)
+                VALUES (%s, %s, %s, %s, %s, %s, %s)
+                ON CONFLICT (patient_id, image_hash) DO NOTHING
                 """,
-                (prescription_id, patient_id, encrypted_image, str(extracted_data))
+                (prescription_id, patient_id, encrypted_image, storage_key, image_hash,
+                 jsonb(extracted_data), status)
             )
+            inserted = cursor.rowcount > 0
+            # Commit before enqueueing so the worker can see the row
+            conn.commit()
+            
+            # A concurrent upload of the same scan got there first
+            if not inserted:
+                duplicate = _find_duplicate_upload(cursor, patient_id, image_hash)
+        
+        if not inserted:
+            if storage_key:
+                storage.delete(storage_key)
+            return jsonify(duplicate), 200
         
         logger.info(f"✅ Uploaded prescription {prescription_id}")
         
+        if not run_inline:
+            from app.tasks.celery_tasks import run_ocr
+            try:
+                run_ocr.delay(prescription_id, patient_id)
+            except Exception as e:
+                # Broker unreachable: don't leave a 'pending' row nothing will
+                # pick up; 'failed' lets the client's re-upload retry OCR
+                logger.error(f"❌ Could not enqueue OCR for {prescription_id}: {e}")
+                with db_manager.get_connection(shard_id) as conn:
+                    conn.cursor().execute(MARK_OCR_FAILED_SQL, (prescription_id, patient_id))
+                return jsonify({"error": "OCR queue unavailable, retry the upload"}), 503
+            
+            return jsonify({
+                "prescription_id": prescription_id,
+                "status": status
+            }), 202
+        
         return jsonify({
             "prescription_id": prescription_id,
+            "status": status,
             "extracted_data": extracted_data,
             "raw_text": text[:500]  # First 500 chars
         }), 201
         
+    except ValidationError as e:
+        return jsonify({"error": "Invalid request body", "details": error_details(e)}), 400
     except Exception as e:
         logger.error(f"❌ Error uploading prescription: {e}")
         return jsonify({"error": "Internal server error"}), 500
@@ -117,7 +269,7 @@ def get_prescription(prescription_id: str):
             cursor = conn.cursor()
             cursor.execute(
                 """
-                SELECT prescription_id, extracted_data, created_at
+                SELECT prescription_id, extracted_data, created_at, status
                 FROM prescriptions
                 WHERE prescription_id = %s AND patient_id = %s
                 """,
@@ -131,7 +283,8 @@ def get_prescription(prescription_id: str):
             return jsonify({
                 "prescription_id": str(row[0]),
                 "extracted_data": row[1],
-                "created_at": row[2].isoformat()
+                "created_at": row[2].isoformat(),
+                "status": row[3]
             }), 200
             
     except Exception as e:
@@ -161,15 +314,11 @@ def confirm_prescription(prescription_id: str):
         }
     """
     try:
-        data = request.get_json()
+        req = ConfirmPrescriptionReq.model_validate_json(request.get_data())
         
-        if not data or 'patient_id' not in data or 'medications' not in data:
-            return jsonify({"error": "Missing required fields"}), 400
-        
-        patient_id = data['patient_id']
-        medications = data['medications']
-        pharmacy_name = data.get('pharmacy_name')
-        pharmacy_phone = data.get('pharmacy_phone')
+        patient_id = str(req.patient_id)
+        pharmacy_name = req.pharmacy_name
+        pharmacy_phone = req.pharmacy_phone
         
         semantic_parser = get_semantic_parser()
         shard_router = get_shard_router()
@@ -177,51 +326,57 @@ def confirm_prescription(prescription_id: str):
         
         shard_id = shard_router.get_shard_id(patient_id)
         created_medications = []
+        rows = []
         
+        for med in req.medications:
+            # Parse frequency
+            frequency_schedule = semantic_parser.parse_frequency(med.frequency)
+            if not frequency_schedule:
+                continue
+            
+            # Calculate total pills
+            total_pills = semantic_parser.calculate_total_inventory(
+                dosage_per_intake=med.dosage_per_intake,
+                frequency=frequency_schedule,
+                duration_days=med.duration_days
+            )
+            
+            # Create medication record
+            medication_id = str(fast_uuid4())
+            
+            frequency_json = {
+                "count_per_day": frequency_schedule.count_per_day,
+                "times": frequency_schedule.times,
+                "abbreviation": frequency_schedule.abbreviation
+            }
+            
+            rows.append(
+                (medication_id, patient_id, prescription_id, med.drug_name, med.strength,
+                 med.frequency, jsonb(frequency_json), med.duration_days, 
+                 total_pills, total_pills, pharmacy_name, pharmacy_phone)
+            )
+            
+            created_medications.append({
+                "medication_id": medication_id,
+                "drug_name": med.drug_name,
+                "total_pills": total_pills
+            })
+        
+        # One round trip for all medications
         with db_manager.get_connection(shard_id) as conn:
             cursor = conn.cursor()
-            
-            for med in medications:
-                # Parse frequency
-                frequency_schedule = semantic_parser.parse_frequency(med['frequency'])
-                if not frequency_schedule:
-                    continue
-                
-                # Calculate total pills
-                total_pills = semantic_parser.calculate_total_inventory(
-                    dosage_per_intake=med.get('dosage_per_intake', 1),
-                    frequency=frequency_schedule,
-                    duration_days=med['duration_days']
-                )
-                
-                # Create medication record
-                import uuid as uuid_lib
-                medication_id = str(uuid_lib.uuid4())
-                
-                frequency_json = {
-                    "count_per_day": frequency_schedule.count_per_day,
-                    "times": frequency_schedule.times,
-                    "abbreviation": frequency_schedule.abbreviation
-                }
-                
-                cursor.execute(
-                    """
-                    INSERT INTO medications 
-                    (medication_id, patient_id, prescription_id, drug_name, strength, 
-                     frequency, frequency_json, duration_days, total_pills, pills_remaining,
-                     pharmacy_name, pharmacy_phone)
-                    VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
-                    """,
-                    (medication_id, patient_id, prescription_id, med['drug_name'], med['strength'],
-                     med['frequency'], str(frequency_json), med['duration_days'], 
-                     total_pills, total_pills, pharmacy_name, pharmacy_phone)
-                )
-                
-                created_medications.append({
-                    "medication_id": medication_id,
-                    "drug_name": med['drug_name'],
-                    "total_pills": total_pills
-                })
+            execute_values(
+                cursor,
+                """
+                INSERT INTO medications 
+                (medication_id, patient_id, prescription_id, drug_name, strength, 
+                 frequency, frequency_json, duration_days, total_pills, pills_remaining,
+                 pharmacy_name, pharmacy_phone)
+                VALUES %s
+                """,
+                rows
+            )
+        invalidate_twin(patient_id)
         
         logger.info(f"✅ Created {len(created_medications)} medication records")
         
@@ -230,6 +385,8 @@ def confirm_prescription(prescription_id: str):
             "medications": created_medications
         }), 201
         
+    except ValidationError as e:
+        return jsonify({"error": "Invalid request body", "details": error_details(e)}), 400
     except Exception as e:
         logger.error(f"❌ Error confirming prescription: {e}")
         return jsonify({"error": "Internal server error"}), 500
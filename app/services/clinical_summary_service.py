@@ -1,15 +1,63 @@
 """
 Clinical Summary Service
 Generates professional medical summaries using Google Gemini API.
+
+LLM summaries are cached in memory per process, keyed on a digest of the
+prompt (which encodes every input), so re-rendering an unchanged patient
+view within SUMMARY_CACHE_TTL skips the LLM round trip. Concurrent misses
+for the same prompt share a single in-flight LLM call.
+
+generate_summary_stream() yields the summary as the provider produces it,
+for clients that render progressively.
 """
-from typing import Optional, List, Dict
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Optional, List, Dict, Tuple, Iterator
 from datetime import datetime, timedelta
+import hashlib
 import logging
+import threading
+import time
 
+from app.core.http import get_http_session
+from app.core.serialization import loads
 from app.models.digital_twin import DigitalTwinState
 
 logger = logging.getLogger(__name__)
 
+# Generated summaries kept in memory (LRU) and for how long (seconds)
+SUMMARY_CACHE_SIZE = 1024
+SUMMARY_CACHE_TTL = 600
+
+OPENROUTER_URL = "https://openrouter.ai/api/v1/chat/completions"
+
+# (connect, read) seconds; generation routinely outlasts the default HTTP_TIMEOUT
+LLM_TIMEOUT = (3.05, 30)
+
+# Concurrent LLM requests in generate_summaries_batch (provider rate limits)
+BATCH_CONCURRENCY = 16
+
+# Instructions shared by every summary prompt. Kept first and byte-identical
+# so providers with prefix caching (Gemini implicit caching, DeepSeek) can
+# reuse it; patient data goes after it.
+PROMPT_PREFIX = """You are writing a professional clinical summary for a patient.
+
+Generate a concise clinical abstract including:
+1. Overview of chronic conditions and duration
+2. Current medication regimen
+3. Adherence status and risk assessment
+4. Any notable patterns or concerns
+
+Keep it professional and factual.
+"""
+
+GEMINI_GENERATION_CONFIG = {
+    'temperature': 0.3,
+    'max_output_tokens': 300,
+    'top_p': 0.8,
+    'top_k': 40
+}
+
 
 class ClinicalSummaryService:
     """Service for generating LLM-based clinical summaries using Google Gemini"""
@@ -28,6 +76,16 @@ class ClinicalSummaryService:
         self.api_key = api_key
         self.model_name = model_name
         
+        # prompt digest -> (expires_at, summary)
+        self._summary_cache: "OrderedDict[str, Tuple[float, str]]" = OrderedDict()
+        self._cache_lock = threading.Lock()
+        self.cache_hits = 0
+        self.cache_misses = 0
+        
+        # prompt digest -> Future for LLM calls in progress
+        self._inflight: Dict[str, Future] = {}
+        self._inflight_lock = threading.Lock()
+        
         if not mock_mode:
             # Check for provider configuration
             from app.core.config import get_config
@@ -38,6 +96,11 @@ class ClinicalSummaryService:
                 if self.provider == 'openrouter':
                     self.api_key = config.get('api_key')
                     self.model_name = config.get('model_name', 'deepseek/deepseek-r1')
+                    self._openrouter_headers = {
+                        "Authorization": f"Bearer {self.api_key}",
+                        "HTTP-Referer": "https://aurahealth.ai",  # Required by OpenRouter
+                        "X-Title": "AuraHealth"
+                    }
                     logger.info(f"✅ OpenRouter initialized with model: {self.model_name}")
                 else:
                     # Google Gemini
@@ -72,55 +135,225 @@ class ClinicalSummaryService:
         # Construct prompt
         prompt = self._build_prompt(digital_twin, medication_history, max_words)
         
+        cache_key = self._cache_key(prompt)
+        cached = self._cache_get(cache_key)
+        if cached is not None:
+            return cached
+        
+        # Coalesce concurrent identical requests: the first caller makes the
+        # LLM call, the rest wait on its Future
+        with self._inflight_lock:
+            inflight = self._inflight.get(cache_key)
+            owner = inflight is None
+            if owner:
+                inflight = self._inflight[cache_key] = Future()
+        
         try:
-            if hasattr(self, 'provider') and self.provider == 'openrouter':
-                # OpenRouter (DeepSeek) implementation using requests
-                import requests
-                import json
-                
-                response = requests.post(
-                    url="https://openrouter.ai/api/v1/chat/completions",
-                    headers={
-                        "Authorization": f"Bearer {self.api_key}",
-                        "Content-Type": "application/json",
-                        "HTTP-Referer": "https://aurahealth.ai", # Required by OpenRouter
-                        "X-Title": "AuraHealth"
-                    },
-                    data=json.dumps({
-                        "model": self.model_name,
-                        "messages": [
-                            {"role": "system", "content": "You are a specialized medical assistant generating clinical summaries."},
-                            {"role": "user", "content": prompt}
-                        ],
-                        "temperature": 0.3,
-                        "max_tokens": 300
-                    })
-                )
-                
-                response.raise_for_status()
-                result = response.json()
-                summary = result['choices'][0]['message']['content'].strip()
-                logger.info(f"✅ Generated clinical summary via OpenRouter ({self.model_name})")
-                return summary
+            if not owner:
+                return inflight.result()
             
-            else:
-                # Gemini implementation
-                response = self.client.generate_content(
-                    prompt,
-                    generation_config={
-                        'temperature': 0.3,
-                        'max_output_tokens': 300,
-                        'top_p': 0.8,
-                        'top_k': 40
-                    }
-                )
-                summary = response.text.strip()
-                logger.info(f"✅ Generated clinical summary via Gemini ({self.model_name})")
-                return summary
+            summary = self._call_llm(prompt)
+            self._cache_put(cache_key, summary)
+            inflight.set_result(summary)
+            return summary
             
         except Exception as e:
+            if owner:
+                inflight.set_exception(e)
             logger.error(f"❌ LLM summary generation failed: {e}")
             return self._generate_mock_summary(digital_twin, medication_history)
+        
+        finally:
+            if owner:
+                with self._inflight_lock:
+                    self._inflight.pop(cache_key, None)
+    
+    def generate_summary_stream(self,
+                                digital_twin: DigitalTwinState,
+                                medication_history: List[Dict],
+                                max_words: int = 150) -> Iterator[str]:
+        """
+        Generate a clinical summary, yielding text chunks as they arrive
+        
+        Mock mode and cache hits yield the whole summary at once. A completed
+        stream is cached like generate_summary's result. If the provider
+        fails before sending anything the mock summary is yielded instead;
+        a failure mid-stream ends the stream early.
+        
+        Args:
+            digital_twin: Patient's Digital Twin state
+            medication_history: List of medication records
+            max_words: Maximum summary length
+            
+        Yields:
+            Successive pieces of the summary text
+        """
+        if self.mock_mode:
+            yield self._generate_mock_summary(digital_twin, medication_history)
+            return
+        
+        prompt = self._build_prompt(digital_twin, medication_history, max_words)
+        
+        cache_key = self._cache_key(prompt)
+        cached = self._cache_get(cache_key)
+        if cached is not None:
+            yield cached
+            return
+        
+        parts = []
+        try:
+            for chunk in self._stream_llm(prompt):
+                if chunk:
+                    parts.append(chunk)
+                    yield chunk
+        except Exception as e:
+            logger.error(f"❌ LLM summary stream failed: {e}")
+            if not parts:
+                yield self._generate_mock_summary(digital_twin, medication_history)
+            return
+        
+        self._cache_put(cache_key, "".join(parts).strip())
+    
+    def generate_summaries_batch(self,
+                                 items: List[Tuple[DigitalTwinState, List[Dict]]],
+                                 max_words: int = 150,
+                                 max_concurrency: int = BATCH_CONCURRENCY) -> List[str]:
+        """
+        Generate summaries for several patients concurrently
+        
+        LLM calls are network-bound, so running them on a thread pool makes
+        total latency roughly the slowest call instead of the sum. Each item
+        goes through generate_summary (cache and mock fallback included).
+        
+        Args:
+            items: (digital_twin, medication_history) pairs
+            max_words: Maximum summary length
+            max_concurrency: Maximum in-flight LLM requests
+            
+        Returns:
+            Summaries in the same order as items
+        """
+        if len(items) <= 1 or self.mock_mode:
+            return [self.generate_summary(twin, meds, max_words) for twin, meds in items]
+        
+        with ThreadPoolExecutor(max_workers=min(max_concurrency, len(items)),
+                                thread_name_prefix="summary") as executor:
+            futures = [
+                executor.submit(self.generate_summary, twin, meds, max_words)
+                for twin, meds in items
+            ]
+            return [future.result() for future in futures]
+    
+    def clear_cache(self):
+        """Drop all cached summaries and reset hit/miss counters"""
+        with self._cache_lock:
+            self._summary_cache.clear()
+            self.cache_hits = 0
+            self.cache_misses = 0
+    
+    def _cache_key(self, prompt: str) -> str:
+        """Digest of the model and prompt; the prompt encodes every input"""
+        return hashlib.blake2b(
+            f"{self.model_name}\0{prompt}".encode('utf-8'), digest_size=16
+        ).hexdigest()
+    
+    def _cache_get(self, key: str) -> Optional[str]:
+        """Cached summary for key, or None if absent or expired"""
+        with self._cache_lock:
+            entry = self._summary_cache.get(key)
+            if entry is not None and entry[0] > time.monotonic():
+                self._summary_cache.move_to_end(key)
+                self.cache_hits += 1
+                logger.debug("Summary cache hit (%d hits / %d misses)", self.cache_hits, self.cache_misses)
+                return entry[1]
+            
+            self._summary_cache.pop(key, None)
+            self.cache_misses += 1
+            logger.debug("Summary cache miss (%d hits / %d misses)", self.cache_hits, self.cache_misses)
+            return None
+    
+    def _cache_put(self, key: str, summary: str):
+        """Store a summary, evicting the least recently used past the limit"""
+        with self._cache_lock:
+            self._summary_cache[key] = (time.monotonic() + SUMMARY_CACHE_TTL, summary)
+            self._summary_cache.move_to_end(key)
+            if len(self._summary_cache) > SUMMARY_CACHE_SIZE:
+                self._summary_cache.popitem(last=False)
+    
+    def _call_llm(self, prompt: str) -> str:
+        """Send the prompt to the configured provider and return the summary text"""
+        if hasattr(self, 'provider') and self.provider == 'openrouter':
+            # OpenRouter (DeepSeek) implementation on the shared, pooled session
+            response = get_http_session().post(
+                OPENROUTER_URL,
+                headers=self._openrouter_headers,
+                timeout=LLM_TIMEOUT,
+                json=self._openrouter_payload(prompt)
+            )
+            
+            response.raise_for_status()
+            result = response.json()
+            summary = result['choices'][0]['message']['content'].strip()
+            logger.info(f"✅ Generated clinical summary via OpenRouter ({self.model_name})")
+            return summary
+        
+        else:
+            # Gemini implementation
+            response = self.client.generate_content(
+                prompt,
+                generation_config=GEMINI_GENERATION_CONFIG
+            )
+            summary = response.text.strip()
+            logger.info(f"✅ Generated clinical summary via Gemini ({self.model_name})")
+            return summary
+    
+    def _stream_llm(self, prompt: str) -> Iterator[str]:
+        """Send the prompt with streaming enabled and yield text as it arrives"""
+        if hasattr(self, 'provider') and self.provider == 'openrouter':
+            # Server-sent events: "data: {json}" lines, ending with "data: [DONE]"
+            with get_http_session().post(
+                OPENROUTER_URL,
+                headers=self._openrouter_headers,
+                timeout=LLM_TIMEOUT,
+                json=self._openrouter_payload(prompt, stream=True),
+                stream=True
+            ) as response:
+                response.raise_for_status()
+                for line in response.iter_lines():
+                    if not line.startswith(b"data: "):
+                        continue  # keep-alive comments and blank separators
+                    data = line[6:]
+                    if data == b"[DONE]":
+                        break
+                    yield loads(data)['choices'][0]['delta'].get('content') or ""
+            
+            logger.info(f"✅ Streamed clinical summary via OpenRouter ({self.model_name})")
+        
+        else:
+            response = self.client.generate_content(
+                prompt,
+                generation_config=GEMINI_GENERATION_CONFIG,
+                stream=True
+            )
+            for chunk in response:
+                yield chunk.text
+            
+            logger.info(f"✅ Streamed clinical summary via Gemini ({self.model_name})")
+    
+    def _openrouter_payload(self, prompt: str, stream: bool = False) -> Dict:
+        """Chat completion request body for OpenRouter"""
+        payload = {
+            "model": self.model_name,
+            "messages": [
+                {"role": "system", "content": "You are a specialized medical assistant generating clinical summaries."},
+                {"role": "user", "content": prompt}
+            ],
+            "temperature": 0.3,
+            "max_tokens": 300
+        }
+        if stream:
+            payload["stream"] = True
+        return payload
     
     def _build_prompt(self,
                      digital_twin: DigitalTwinState,
@@ -128,11 +361,13 @@ class ClinicalSummaryService:
                      max_words: int) -> str:
         """Build LLM prompt for clinical summary"""
         
-        # Format chronic conditions
+        # Format chronic conditions (list comprehensions: str.join builds a
+        # list from a generator anyway, so the list form is faster)
+        conditions = digital_twin.chronic_conditions
         conditions_text = ", ".join([
-            f"{c.condition_name} (detected {c.first_detected.strftime('%b %Y')})"
-            for c in digital_twin.chronic_conditions
-        ]) if digital_twin.chronic_conditions else "None detected"
+            f"{c.condition_name} (detected {c.first_detected:%b %Y})"
+            for c in conditions.values()
+        ]) if conditions else "None detected"
         
         # Format active medications
         meds_text = "\n".join([
@@ -140,8 +375,7 @@ class ClinicalSummaryService:
             for med in medication_history[:10]  # Last 10 medications
         ])
         
-        prompt = f"""Generate a {max_words}-word professional clinical summary for a patient.
-
+        prompt = PROMPT_PREFIX + f"""
 Patient Data:
 - Chronic Conditions: {conditions_text}
 - Adherence Rate: {digital_twin.consistency_index:.1f}%
@@ -152,13 +386,7 @@ Patient Data:
 Recent Medications:
 {meds_text}
 
-Generate a concise clinical abstract including:
-1. Overview of chronic conditions and duration
-2. Current medication regimen
-3. Adherence status and risk assessment
-4. Any notable patterns or concerns
-
-Keep it professional, factual, and within {max_words} words."""
+Write the summary in at most {max_words} words."""
         
         return prompt
     
@@ -167,48 +395,50 @@ Keep it professional, factual, and within {max_words} words."""
                                medication_history: List[Dict]) -> str:
         """Generate mock clinical summary (for testing)"""
         
-        # Build conditions list
-        if digital_twin.chronic_conditions:
-            conditions_str = ", ".join([c.condition_name for c in digital_twin.chronic_conditions])
+        # Build conditions list and months since first detection in one
+        # pass (cheaper than min() over a generator for a handful of items)
+        conditions = digital_twin.chronic_conditions
+        if conditions:
+            first_date = None
+            for c in conditions.values():
+                if first_date is None or c.first_detected < first_date:
+                    first_date = c.first_detected
+            conditions_str = ", ".join(conditions)
+            months = (datetime.now() - first_date).days // 30
+            history_str = f"{months}-month history"
         else:
             conditions_str = "no chronic conditions detected"
+            history_str = "recent history"
         
         # Get recent medications
         recent_meds = medication_history[:3] if medication_history else []
         meds_str = ", ".join([f"{m.get('drug_name', 'Unknown')} {m.get('strength', '')}" 
                               for m in recent_meds])
         
-        # Calculate months since first prescription
-        if digital_twin.chronic_conditions:
-            first_date = min([c.first_detected for c in digital_twin.chronic_conditions])
-            months = (datetime.now() - first_date).days // 30
-            history_str = f"{months}-month history"
-        else:
-            history_str = "recent history"
-        
-        summary = (
+        # Collect the sentences and join once instead of growing a string
+        parts = [
             f"Patient has a {history_str} with {conditions_str}. "
             f"Currently managing {digital_twin.active_medications_count} active medications"
-        )
+        ]
         
         if recent_meds:
-            summary += f" including {meds_str}"
+            parts.append(f" including {meds_str}")
         
-        summary += (
+        parts.append(
             f". Adherence rate is {digital_twin.consistency_index:.1f}%, "
             f"indicating {digital_twin.risk_level.lower()} risk of treatment failure."
         )
         
         if digital_twin.last_acute_episode:
-            summary += f" Last acute episode: {digital_twin.last_acute_episode} in {digital_twin.last_acute_date.strftime('%b %Y')}."
+            parts.append(f" Last acute episode: {digital_twin.last_acute_episode} in {digital_twin.last_acute_date:%b %Y}.")
         
-        summary += (
+        parts.append(
             f" Patient has completed {digital_twin.total_prescriptions} prescriptions to date. "
             "Continued monitoring recommended for optimal health outcomes."
         )
         
         logger.info("✅ Generated mock clinical summary")
-        return summary
+        return "".join(parts)
 
 
 # Global service instance
@@ -1,14 +1,20 @@
 """
 Digital Twin Service
 Manages Health Digital Twin state, chronic condition detection, and adherence tracking.
+
+Built twins are kept in a per-process LRU cache for TWIN_CACHE_TTL seconds;
+medication and adherence writes drop the patient's entry via invalidate_twin().
 """
-from typing import List, Optional, Dict
+from collections import OrderedDict
+from typing import List, Optional, Tuple
 from datetime import datetime, timedelta
 from uuid import UUID
 import logging
+import threading
+import time
 
 from app.models.digital_twin import DigitalTwinState, ChronicCondition
-from app.database.connection import get_db_manager
+from app.database.connection import get_db_manager, execute_prepared
 from app.database.router import get_shard_router
 
 logger = logging.getLogger(__name__)
@@ -23,6 +29,61 @@ CHRONIC_DRUG_PATTERNS = {
     "GERD": ["omeprazole", "pantoprazole", "esomeprazole", "rabeprazole"]
 }
 
+# Per-process twin cache bounds
+TWIN_CACHE_SIZE = 10_000
+TWIN_CACHE_TTL = 60
+
+# Prescriptions of a condition's drugs needed to tag it as chronic
+CHRONIC_MIN_PRESCRIPTIONS = 3
+
+# The queries below run as server-side prepared statements ($n placeholders)
+# since every twin build issues all three.
+
+# CHRONIC_DRUG_PATTERNS as a VALUES table of (condition, LIKE patterns),
+# built once. LIKE ANY counts each medication at most once per condition,
+# matching the substring rule.
+_N_PATTERN_PARAMS = 2 * len(CHRONIC_DRUG_PATTERNS)
+CHRONIC_CONDITIONS_SQL = f"""
+    SELECT p.condition, COUNT(*), MIN(m.created_at), ARRAY_AGG(DISTINCT m.drug_name)
+    FROM medications m
+    JOIN (VALUES {", ".join(f"(${i}::text, ${i + 1}::text[])" for i in range(1, _N_PATTERN_PARAMS, 2))}) AS p(condition, likes)
+      ON LOWER(m.drug_name) LIKE ANY(p.likes)
+    WHERE m.patient_id = ${_N_PATTERN_PARAMS + 1}
+      AND m.created_at >= ${_N_PATTERN_PARAMS + 2}
+    GROUP BY p.condition
+    HAVING COUNT(*) >= ${_N_PATTERN_PARAMS + 3}
+"""
+CHRONIC_PATTERN_PARAMS = tuple(
+    param
+    for condition, drug_patterns in CHRONIC_DRUG_PATTERNS.items()
+    for param in (condition, [f"%{pattern}%" for pattern in drug_patterns])
+)
+_CONDITION_ORDER = {condition: i for i, condition in enumerate(CHRONIC_DRUG_PATTERNS)}
+
+# Active medications with their daily dose count and TAKEN events in the
+# window, one round trip. count_per_day is read out of the JSONB column by
+# Postgres, so no schedule documents are shipped or decoded in Python.
+MEDICATION_ADHERENCE_SQL = """
+    SELECT m.medication_id,
+           COALESCE((m.frequency_json->>'count_per_day')::int, 1) AS count_per_day,
+           COUNT(ae.event_id) FILTER (
+               WHERE ae.event_type = 'TAKEN' AND ae.created_at >= $1
+           ) AS taken
+    FROM medications m
+    LEFT JOIN adherence_events ae ON ae.medication_id = m.medication_id
+    WHERE m.patient_id = $2
+      AND m.pills_remaining > 0
+      AND m.created_at <= $3
+    GROUP BY m.medication_id
+"""
+
+# Active and total medication counts for the twin, one scan
+MEDICATION_COUNTS_SQL = """
+    SELECT COUNT(*) FILTER (WHERE pills_remaining > 0), COUNT(*)
+    FROM medications
+    WHERE patient_id = $1
+"""
+
 
 class DigitalTwinService:
     """Service for managing patient Digital Twins"""
@@ -30,79 +91,95 @@ class DigitalTwinService:
     def __init__(self):
         self.db_manager = get_db_manager()
         self.shard_router = get_shard_router()
+        
+        # patient_id -> (expires_at, twin), least recently used first
+        self._twin_cache: "OrderedDict[str, Tuple[float, DigitalTwinState]]" = OrderedDict()
+        self._cache_lock = threading.Lock()
+    
+    def invalidate(self, patient_id: str):
+        """Drop the cached twin for a patient (call after writes)"""
+        with self._cache_lock:
+            self._twin_cache.pop(str(patient_id), None)
+    
+    def _cache_get(self, patient_id: str) -> Optional[DigitalTwinState]:
+        """Cached twin for patient_id, or None if absent or expired"""
+        patient_id = str(patient_id)  # same key as invalidate()
+        with self._cache_lock:
+            entry = self._twin_cache.get(patient_id)
+            if entry is not None and entry[0] > time.monotonic():
+                self._twin_cache.move_to_end(patient_id)
+                return entry[1]
+            
+            self._twin_cache.pop(patient_id, None)
+            return None
     
-    def detect_chronic_conditions(self, patient_id: str, lookback_months: int = 3) -> List[ChronicCondition]:
+    def _cache_put(self, patient_id: str, twin: DigitalTwinState):
+        """Store a twin, evicting the least recently used past the limit"""
+        patient_id = str(patient_id)
+        with self._cache_lock:
+            self._twin_cache[patient_id] = (time.monotonic() + TWIN_CACHE_TTL, twin)
+            self._twin_cache.move_to_end(patient_id)
+            if len(self._twin_cache) > TWIN_CACHE_SIZE:
+                self._twin_cache.popitem(last=False)
+    
+    def detect_chronic_conditions(self, patient_id: str, lookback_months: int = 3,
+                                  cursor=None, now: Optional[datetime] = None) -> List[ChronicCondition]:
         """
         Detect chronic conditions from medication history
         
         Rule: If a drug from chronic pattern appears in ≥3 prescriptions
               over the lookback period, tag as chronic condition
         
+        Matching and counting run in Postgres (one row per detected
+        condition), so no per-medication rows cross the wire.
+        
         Args:
             patient_id: Patient UUID
             lookback_months: Months to analyze (default: 3)
+            cursor: Cursor on the patient's shard (opens a connection if None)
+            now: Reference time for the lookback window (default: now)
             
         Returns:
             List of detected chronic conditions
         """
-        shard_id = self.shard_router.get_shard_id(patient_id)
-        since_date = datetime.now() - timedelta(days=lookback_months * 30)
+        if cursor is None:
+            shard_id = self.shard_router.get_shard_id(patient_id)
+            with self.db_manager.get_connection(shard_id) as conn:
+                return self.detect_chronic_conditions(patient_id, lookback_months, conn.cursor(), now)
         
-        with self.db_manager.get_connection(shard_id) as conn:
-            cursor = conn.cursor()
-            
-            # Get all medications in lookback period
-            cursor.execute(
-                """
-                SELECT drug_name, created_at
-                FROM medications
-                WHERE patient_id = %s
-                  AND created_at >= %s
-                ORDER BY created_at ASC
-                """,
-                (patient_id, since_date)
-            )
-            
-            medications = cursor.fetchall()
+        now = now or datetime.now()
+        since_date = now - timedelta(days=lookback_months * 30)
         
-        # Count occurrences per condition
-        condition_matches: Dict[str, List[tuple]] = {
-            condition: [] for condition in CHRONIC_DRUG_PATTERNS.keys()
-        }
+        # Conditions with ≥3 matching prescriptions in the lookback period
+        execute_prepared(
+            cursor,
+            "chronic_conditions",
+            CHRONIC_CONDITIONS_SQL,
+            CHRONIC_PATTERN_PARAMS + (patient_id, since_date, CHRONIC_MIN_PRESCRIPTIONS)
+        )
         
-        for drug_name, created_at in medications:
-            drug_lower = drug_name.lower()
-            
-            # Check each chronic pattern
-            for condition, drug_patterns in CHRONIC_DRUG_PATTERNS.items():
-                if any(pattern in drug_lower for pattern in drug_patterns):
-                    condition_matches[condition].append((drug_name, created_at))
+        rows = sorted(cursor.fetchall(), key=lambda row: _CONDITION_ORDER[row[0]])
         
-        # Filter conditions with ≥3 occurrences
         chronic_conditions = []
         
-        for condition, matches in condition_matches.items():
-            if len(matches) >= 3:
-                # Get unique drug names
-                unique_drugs = list(set([drug for drug, _ in matches]))
-                first_detected = min([date for _, date in matches])
-                
-                # Confidence based on number of occurrences
-                confidence = min(len(matches) / 10.0, 1.0)
-                
-                chronic_conditions.append(ChronicCondition(
-                    condition_name=condition,
-                    first_detected=first_detected,
-                    confidence_score=confidence,
-                    supporting_medications=unique_drugs,
-                    prescription_count=len(matches)
-                ))
-                
-                logger.info(f"🔍 Detected chronic condition: {condition} (confidence: {confidence:.2f})")
+        for condition, count, first_detected, unique_drugs in rows:
+            # Confidence based on number of occurrences
+            confidence = min(count / 10.0, 1.0)
+            
+            chronic_conditions.append(ChronicCondition(
+                condition_name=condition,
+                first_detected=first_detected,
+                confidence_score=confidence,
+                supporting_medications=list(unique_drugs),
+                prescription_count=count
+            ))
+            
+            logger.info(f"🔍 Detected chronic condition: {condition} (confidence: {confidence:.2f})")
         
         return chronic_conditions
     
-    def calculate_consistency_index(self, patient_id: str, days: int = 30) -> float:
+    def calculate_consistency_index(self, patient_id: str, days: int = 30, cursor=None,
+                                    now: Optional[datetime] = None) -> float:
         """
         Calculate adherence consistency index
         
@@ -111,108 +188,91 @@ class DigitalTwinService:
         Args:
             patient_id: Patient UUID
             days: Period to analyze
+            cursor: Cursor on the patient's shard (opens a connection if None)
+            now: End of the period (default: now)
             
         Returns:
             Consistency index (0-100%)
         """
-        shard_id = self.shard_router.get_shard_id(patient_id)
-        since_date = datetime.now() - timedelta(days=days)
+        if cursor is None:
+            shard_id = self.shard_router.get_shard_id(patient_id)
+            with self.db_manager.get_connection(shard_id) as conn:
+                return self.calculate_consistency_index(patient_id, days, conn.cursor(), now)
         
-        with self.db_manager.get_connection(shard_id) as conn:
-            cursor = conn.cursor()
-            
-            # Get all active medications
-            cursor.execute(
-                """
-                SELECT medication_id, frequency_json
-                FROM medications
-                WHERE patient_id = %s
-                  AND pills_remaining > 0
-                  AND created_at <= %s
-                """,
-                (patient_id, datetime.now())
-            )
-            
-            medications = cursor.fetchall()
-            
-            if not medications:
-                return 100.0  # No medications = perfect adherence
-            
-            total_expected = 0
-            total_taken = 0
-            
-            for med_id, freq_json in medications:
-                # Calculate expected doses
-                import json
-                freq_data = json.loads(freq_json) if isinstance(freq_json, str) else freq_json
-                count_per_day = freq_data.get('count_per_day', 1)
-                total_expected += count_per_day * days
-                
-                # Count actual TAKEN events
-                cursor.execute(
-                    """
-                    SELECT COUNT(*)
-                    FROM adherence_events
-                    WHERE medication_id = %s
-                      AND event_type = 'TAKEN'
-                      AND created_at >= %s
-                    """,
-                    (med_id, since_date)
-                )
-                
-                taken_count = cursor.fetchone()[0]
-                total_taken += taken_count
-            
-            consistency = (total_taken / total_expected * 100) if total_expected > 0 else 100.0
-            
-            logger.info(f"📊 Consistency Index: {consistency:.1f}% ({total_taken}/{total_expected})")
-            return min(consistency, 100.0)
+        now = now or datetime.now()
+        since_date = now - timedelta(days=days)
+        
+        # Active medications with TAKEN counts (one query, not one per medication)
+        execute_prepared(
+            cursor,
+            "medication_adherence",
+            MEDICATION_ADHERENCE_SQL,
+            (since_date, patient_id, now)
+        )
+        
+        medications = cursor.fetchall()
+        
+        if not medications:
+            return 100.0  # No medications = perfect adherence
+        
+        total_expected = 0
+        total_taken = 0
+        
+        for _med_id, count_per_day, taken_count in medications:
+            # Calculate expected doses
+            total_expected += count_per_day * days
+            total_taken += taken_count
+        
+        consistency = (total_taken / total_expected * 100) if total_expected > 0 else 100.0
+        
+        logger.info(f"📊 Consistency Index: {consistency:.1f}% ({total_taken}/{total_expected})")
+        return min(consistency, 100.0)
     
     def get_or_create_twin(self, patient_id: str) -> DigitalTwinState:
         """
         Get existing Digital Twin or create new one
         
+        A twin built within the last TWIN_CACHE_TTL seconds is returned
+        as-is; treat it as read-only.
+        
         Args:
             patient_id: Patient UUID
             
         Returns:
             DigitalTwinState
         """
+        cached = self._cache_get(patient_id)
+        if cached is not None:
+            return cached
+        
         shard_id = self.shard_router.get_shard_id(patient_id)
+        # One reference time for the twin and every window below
+        now = datetime.now()
+        twin = DigitalTwinState.create(UUID(patient_id), now)
         
+        # One connection checkout for every query below
         with self.db_manager.get_connection(shard_id) as conn:
             cursor = conn.cursor()
             
-            # Try to fetch existing twin (would be in a digital_twins table)
-            # For now, create new one each time
-            pass
-        
-        # Create new twin
-        twin = DigitalTwinState.create(UUID(patient_id))
-        
-        # Detect chronic conditions
-        twin.chronic_conditions = self.detect_chronic_conditions(patient_id)
-        
-        # Calculate consistency
-        twin.consistency_index = self.calculate_consistency_index(patient_id)
-        twin.risk_level = twin.calculate_risk_level()
-        
-        # Count active medications
-        with self.db_manager.get_connection(shard_id) as conn:
-            cursor = conn.cursor()
+            # Detect chronic conditions
+            twin.chronic_conditions = {
+                c.condition_name: c for c in self.detect_chronic_conditions(patient_id, cursor=cursor, now=now)
+            }
             
-            cursor.execute(
-                "SELECT COUNT(*) FROM medications WHERE patient_id = %s AND pills_remaining > 0",
-                (patient_id,)
-            )
-            twin.active_medications_count = cursor.fetchone()[0]
+            # Calculate consistency
+            twin.consistency_index = self.calculate_consistency_index(patient_id, cursor=cursor, now=now)
+            twin.risk_level = twin.calculate_risk_level()
             
-            cursor.execute(
-                "SELECT COUNT(*) FROM medications WHERE patient_id = %s",
+            # Count active and total medications in one scan
+            execute_prepared(
+                cursor,
+                "medication_counts",
+                MEDICATION_COUNTS_SQL,
                 (patient_id,)
             )
-            twin.total_prescriptions = cursor.fetchone()[0]
+            twin.active_medications_count, twin.total_prescriptions = cursor.fetchone()
         
+        self._cache_put(patient_id, twin)
         logger.info(f"✅ Digital Twin created for patient {patient_id}")
         return twin
 
@@ -233,3 +293,9 @@ def get_digital_twin_service() -> DigitalTwinService:
     if digital_twin_service is None:
         raise RuntimeError("Digital Twin service not initialized")
     return digital_twin_service
+
+
+def invalidate_twin(patient_id: str):
+    """Drop a patient's cached twin, if the service is running in this process"""
+    if digital_twin_service is not None:
+        digital_twin_service.invalidate(patient_id)
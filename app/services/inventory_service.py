@@ -9,11 +9,81 @@ import logging
 
 from app.models.medication import MedicationData
 from app.models.adherence_event import AdherenceEvent
-from app.database.connection import get_db_manager
+from app.database.connection import get_db_manager, execute_values
 from app.database.router import get_shard_router
+from app.services.digital_twin_service import invalidate_twin
 
 logger = logging.getLogger(__name__)
 
+# Event insert shared by the record_* methods
+INSERT_EVENT_SQL = """
+    INSERT INTO adherence_events
+    (event_id, medication_id, event_type, pills_count, scheduled_time, actual_time, created_at)
+    VALUES (%s, %s, %s, %s, %s, %s, %s)
+"""
+
+# Event insert and inventory change in one statement (one round trip);
+# the data-modifying CTE runs even though the UPDATE doesn't read it
+RECORD_TAKEN_SQL = f"""
+    WITH event AS ({INSERT_EVENT_SQL})
+    UPDATE medications
+    SET pills_remaining = pills_remaining - %s,
+        last_taken_at = %s
+    WHERE medication_id = %s
+    RETURNING pills_remaining
+"""
+RECORD_ADJUSTMENT_SQL = f"""
+    WITH event AS ({INSERT_EVENT_SQL})
+    UPDATE medications
+    SET pills_remaining = pills_remaining + %s
+    WHERE medication_id = %s
+    RETURNING pills_remaining
+"""
+
+
+# Batched inserts/updates for record_taken_many (execute_values fills VALUES %s)
+INSERT_EVENTS_SQL = """
+    INSERT INTO adherence_events
+    (event_id, medication_id, event_type, pills_count, scheduled_time, actual_time, created_at)
+    VALUES %s
+"""
+APPLY_TAKEN_SQL = """
+    UPDATE medications m
+    SET pills_remaining = m.pills_remaining - v.pills,
+        last_taken_at = v.taken_at
+    FROM (VALUES %s) AS v(medication_id, pills, taken_at)
+    WHERE m.medication_id = v.medication_id
+"""
+APPLY_TAKEN_TEMPLATE = "(%s::uuid, %s::int, %s::timestamp)"
+
+# Adherence percentage for one medication, computed by Postgres: TAKEN
+# events since a date over expected doses (count_per_day * days). The
+# count is served from idx_adherence_med_type_created.
+ADHERENCE_RATE_SQL = """
+    SELECT CASE WHEN m.expected > 0
+                THEN 100.0 * t.taken / m.expected
+                ELSE 0
+           END::float8
+    FROM (SELECT medication_id,
+                 (frequency_json->>'count_per_day')::int * %s AS expected
+          FROM medications
+          WHERE medication_id = %s) m,
+    LATERAL (SELECT COUNT(*) AS taken
+             FROM adherence_events ae
+             WHERE ae.medication_id = m.medication_id
+               AND ae.event_type = 'TAKEN'
+               AND ae.created_at >= %s) t
+"""
+
+# Rows per statement for batched writes
+BATCH_PAGE_SIZE = 1000
+
+
+def _event_params(event: AdherenceEvent, medication_id: str) -> tuple:
+    """INSERT_EVENT_SQL parameters for an event"""
+    return (str(event.event_id), medication_id, event.event_type,
+            event.pills_count, event.scheduled_time, event.actual_time, event.created_at)
+
 
 class InventoryService:
     """Service for medication inventory management"""
@@ -51,34 +121,81 @@ class InventoryService:
                 pills_count=pills_count
             )
             
-            # Insert event
-            cursor.execute(
-                """
-                INSERT INTO adherence_events 
-                (event_id, medication_id, event_type, pills_count, scheduled_time, actual_time, created_at)
-                VALUES (%s, %s, %s, %s, %s, %s, %s)
-                """,
-                (str(event.event_id), medication_id, event.event_type, 
-                 event.pills_count, event.scheduled_time, event.actual_time, event.created_at)
-            )
-            
-            # Update medication inventory
+            # Insert event and update medication inventory
             cursor.execute(
-                """
-                UPDATE medications
-                SET pills_remaining = pills_remaining - %s,
-                    last_taken_at = %s
-                WHERE medication_id = %s
-                RETURNING pills_remaining
-                """,
-                (pills_count, datetime.now(), medication_id)
+                RECORD_TAKEN_SQL,
+                _event_params(event, medication_id) + (pills_count, event.actual_time, medication_id)
             )
             
             result = cursor.fetchone()
             remaining = result[0] if result else 0
             
             logger.info(f"✅ Recorded TAKEN event for {medication_id}. Remaining: {remaining} pills")
-            return True
+        
+        # After the commit, so a concurrent rebuild cannot re-cache old rows
+        invalidate_twin(patient_id)
+        return True
+    
+    def record_taken_many(self, events: List[Dict]) -> int:
+        """
+        Record a batch of taken doses (e.g. a device syncing offline events)
+        
+        Per shard, all events go in with one multi-row INSERT and each
+        medication's inventory is decremented once by its summed pills in
+        one UPDATE ... FROM (VALUES ...), inside one transaction.
+        
+        Shards commit independently, one after another. If a shard fails,
+        the shards before it stay committed (their patients' cached twins
+        are already dropped) and the error propagates; events for that
+        shard and any after it are not recorded.
+        
+        Args:
+            events: Dicts with medication_id, patient_id, scheduled_time
+                    and optional pills_count (default 1)
+            
+        Returns:
+            Number of events recorded
+        """
+        now = datetime.now()
+        
+        # shard_id -> (event rows, medication_id -> pills taken, patient ids)
+        by_shard: Dict[int, tuple] = {}
+        for e in events:
+            medication_id = str(e["medication_id"])
+            patient_id = str(e["patient_id"])
+            pills_count = e.get("pills_count", 1)
+            
+            event = AdherenceEvent.create_taken(
+                medication_id=UUID(medication_id),
+                scheduled_time=e.get("scheduled_time") or now,
+                pills_count=pills_count,
+                now=now
+            )
+            
+            shard_id = self.shard_router.get_shard_id(patient_id)
+            rows, pills, patient_ids = by_shard.setdefault(shard_id, ([], {}, set()))
+            rows.append(_event_params(event, medication_id))
+            pills[medication_id] = pills.get(medication_id, 0) + pills_count
+            patient_ids.add(patient_id)
+        
+        for shard_id, (rows, pills, patient_ids) in by_shard.items():
+            with self.db_manager.get_connection(shard_id) as conn:
+                cursor = conn.cursor()
+                execute_values(cursor, INSERT_EVENTS_SQL, rows, page_size=BATCH_PAGE_SIZE)
+                execute_values(
+                    cursor,
+                    APPLY_TAKEN_SQL,
+                    [(medication_id, count, now) for medication_id, count in pills.items()],
+                    page_size=BATCH_PAGE_SIZE,
+                    template=APPLY_TAKEN_TEMPLATE
+                )
+            
+            # This shard is committed even if a later one fails
+            for patient_id in patient_ids:
+                invalidate_twin(patient_id)
+        
+        logger.info(f"✅ Recorded {len(events)} TAKEN events across {len(by_shard)} shard(s)")
+        return len(events)
     
     def record_missed(self,
                      medication_id: str,
@@ -107,18 +224,12 @@ class InventoryService:
                 scheduled_time=scheduled_time
             )
             
-            cursor.execute(
-                """
-                INSERT INTO adherence_events 
-                (event_id, medication_id, event_type, pills_count, scheduled_time, actual_time, created_at)
-                VALUES (%s, %s, %s, %s, %s, %s, %s)
-                """,
-                (str(event.event_id), medication_id, event.event_type,
-                 event.pills_count, event.scheduled_time, event.actual_time, event.created_at)
-            )
+            cursor.execute(INSERT_EVENT_SQL, _event_params(event, medication_id))
             
             logger.warning(f"⚠️  Recorded MISSED event for {medication_id}")
-            return True
+        
+        invalidate_twin(patient_id)
+        return True
     
     def record_wastage(self,
                       medication_id: str,
@@ -145,28 +256,16 @@ class InventoryService:
                 pills_count=pills_count
             )
             
+            # Insert event and decrement inventory
             cursor.execute(
-                """
-                INSERT INTO adherence_events 
-                (event_id, medication_id, event_type, pills_count, scheduled_time, actual_time, created_at)
-                VALUES (%s, %s, %s, %s, %s, %s, %s)
-                """,
-                (str(event.event_id), medication_id, event.event_type,
-                 event.pills_count, event.scheduled_time, event.actual_time, event.created_at)
-            )
-            
-            # Decrement inventory
-            cursor.execute(
-                """
-                UPDATE medications
-                SET pills_remaining = pills_remaining - %s
-                WHERE medication_id = %s
-                """,
-                (pills_count, medication_id)
+                RECORD_ADJUSTMENT_SQL,
+                _event_params(event, medication_id) + (-pills_count, medication_id)
             )
             
             logger.warning(f"⚠️  Recorded WASTAGE of {pills_count} pills for {medication_id}")
-            return True
+        
+        invalidate_twin(patient_id)
+        return True
     
     def record_refill(self,
                      medication_id: str,
@@ -193,32 +292,19 @@ class InventoryService:
                 pills_count=pills_count
             )
             
+            # Insert event and increment inventory
             cursor.execute(
-                """
-                INSERT INTO adherence_events 
-                (event_id, medication_id, event_type, pills_count, scheduled_time, actual_time, created_at)
-                VALUES (%s, %s, %s, %s, %s, %s, %s)
-                """,
-                (str(event.event_id), medication_id, event.event_type,
-                 event.pills_count, event.scheduled_time, event.actual_time, event.created_at)
-            )
-            
-            # Increment inventory
-            cursor.execute(
-                """
-                UPDATE medications
-                SET pills_remaining = pills_remaining + %s
-                WHERE medication_id = %s
-                RETURNING pills_remaining
-                """,
-                (pills_count, medication_id)
+                RECORD_ADJUSTMENT_SQL,
+                _event_params(event, medication_id) + (pills_count, medication_id)
             )
             
             result = cursor.fetchone()
             remaining = result[0] if result else 0
             
             logger.info(f"✅ Recorded REFILL of {pills_count} pills. New total: {remaining}")
-            return True
+        
+        invalidate_twin(patient_id)
+        return True
     
     def get_medications_needing_refill(self, patient_id: str) -> List[Dict]:
         """
@@ -284,37 +370,12 @@ class InventoryService:
             
             since_date = datetime.now() - timedelta(days=days)
             
-            # Get expected doses per day
-            cursor.execute(
-                """
-                SELECT frequency_json->>'count_per_day'
-                FROM medications
-                WHERE medication_id = %s
-                """,
-                (medication_id,)
-            )
+            cursor.execute(ADHERENCE_RATE_SQL, (days, medication_id, since_date))
             result = cursor.fetchone()
             if not result:
                 return 0.0
             
-            expected_per_day = int(result[0])
-            total_expected = expected_per_day * days
-            
-            # Count taken doses
-            cursor.execute(
-                """
-                SELECT COUNT(*)
-                FROM adherence_events
-                WHERE medication_id = %s
-                  AND event_type = 'TAKEN'
-                  AND created_at >= %s
-                """,
-                (medication_id, since_date)
-            )
-            
-            taken_count = cursor.fetchone()[0]
-            
-            adherence_rate = (taken_count / total_expected * 100) if total_expected > 0 else 0
+            adherence_rate = result[0]
             
-            logger.info(f"📊 Adherence rate: {adherence_rate:.1f}% ({taken_count}/{total_expected})")
+            logger.info(f"📊 Adherence rate: {adherence_rate:.1f}% over {days} days")
             return adherence_rate
@@ -2,14 +2,31 @@
 Google Maps Service
 Geo-spatial discovery of nearby hospitals with smart ranking.
 """
-from typing import List, Optional, Tuple
+from dataclasses import asdict
+from typing import Iterable, List, Optional, Tuple
 import logging
 import math
 
+import numpy as np
+
+from app.core.cache import cache_get_json, cache_set_json
+from app.core.http import get_http_session
+from app.core.serialization import loads
 from app.models.hospital import HospitalData
 
 logger = logging.getLogger(__name__)
 
+# Nearby searches are cached per ~110 m cell (3 decimal places of lat/lon)
+# and 1 km radius bucket, so neighbouring users share one Places API call
+SEARCH_CACHE_TTL = 3600  # seconds
+SEARCH_CACHE_PRECISION = 3
+
+EARTH_RADIUS_M = 6371000
+
+# Distances up to this use the equirectangular approximation (well under
+# 1% off at city scale); any result beyond it is recomputed with Haversine
+APPROX_DISTANCE_MAX_M = 100_000
+
 
 class MapsService:
     """Service for Google Maps Places API integration"""
@@ -67,13 +84,21 @@ class MapsService:
         if self.mock_mode:
             return self._get_mock_hospitals(latitude, longitude)
         
+        cache_key = self._search_cache_key(latitude, longitude, radius_meters, max_results)
+        cached = cache_get_json(cache_key)
+        if cached is not None:
+            hospitals = [HospitalData(**h) for h in cached]
+            # Distances are per user, not per cache cell
+            self._assign_distances(latitude, longitude, hospitals)
+            return hospitals
+        
         try:
             if hasattr(self, 'provider') and self.provider == 'mappls':
-                return self._search_mappls(latitude, longitude, radius_meters, max_results)
+                hospitals = self._search_mappls(latitude, longitude, radius_meters, max_results)
+                cache_set_json(cache_key, [asdict(h) for h in hospitals], SEARCH_CACHE_TTL)
+                return hospitals
             
             # Use Places API (New) - Nearby Search
-            import requests
-            
             url = "https://places.googleapis.com/v1/places:searchNearby"
             headers = {
                 "Content-Type": "application/json",
@@ -95,19 +120,16 @@ class MapsService:
                 "maxResultCount": max_results
             }
             
-            response = requests.post(url, json=payload, headers=headers)
+            response = get_http_session().post(url, json=payload, headers=headers)
             response.raise_for_status()
             
-            data = response.json()
-            hospitals = []
-            
-            for place in data.get('places', []):
-                hospital = HospitalData.from_maps_result(place, (latitude, longitude))
-                hospital.distance_meters = self._calculate_distance(
-                    latitude, longitude,
-                    hospital.latitude, hospital.longitude
-                )
-                hospitals.append(hospital)
+            data = loads(response.content)
+            hospitals = [
+                HospitalData.from_maps_result(place, (latitude, longitude))
+                for place in data.get('places', [])
+            ]
+            self._assign_distances(latitude, longitude, hospitals)
+            cache_set_json(cache_key, [asdict(h) for h in hospitals], SEARCH_CACHE_TTL)
             
             logger.info(f"✅ Found {len(hospitals)} hospitals via Maps API")
             return hospitals
@@ -116,12 +138,22 @@ class MapsService:
             logger.error(f"❌ Maps API error: {e}")
             return self._get_mock_hospitals(latitude, longitude)
 
+    @staticmethod
+    def _search_cache_key(latitude: float,
+                          longitude: float,
+                          radius_meters: int,
+                          max_results: int) -> str:
+        """Cache key for a nearby search, quantized so nearby users share it"""
+        return (
+            f"hosp:{round(latitude, SEARCH_CACHE_PRECISION)}"
+            f":{round(longitude, SEARCH_CACHE_PRECISION)}"
+            f":{radius_meters // 1000}:{max_results}"
+        )
+
     def _get_mappls_token(self) -> str:
         """Get OAuth token for Mappls"""
-        import requests
-        
         token_url = "https://outpost.mapmyindia.com/api/security/oauth/token"
-        response = requests.post(token_url, data={
+        response = get_http_session().post(token_url, data={
             "grant_type": "client_credentials",
             "client_id": self.client_id,
             "client_secret": self.client_secret
@@ -131,8 +163,6 @@ class MapsService:
 
     def _search_mappls(self, latitude: float, longitude: float, radius: int, max_results: int) -> List[HospitalData]:
         """Search using Mappls (MapMyIndia) API"""
-        import requests
-        
         try:
             token = self._get_mappls_token()
             
@@ -148,10 +178,10 @@ class MapsService:
             
             headers = {"Authorization": f"Bearer {token}"}
             
-            response = requests.get(url, params=params, headers=headers)
+            response = get_http_session().get(url, params=params, headers=headers)
             response.raise_for_status()
             
-            data = response.json()
+            data = loads(response.content)
             hospitals = []
             
             for place in data.get('suggestedLocations', []):
@@ -181,30 +211,64 @@ class MapsService:
             logger.error(f"❌ Mappls API error: {e}")
             raise e
     
-    def _calculate_distance(self, lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+    def _calculate_distances(self,
+                             lat: float,
+                             lon: float,
+                             lats: np.ndarray,
+                             lons: np.ndarray,
+                             precise: bool = False) -> np.ndarray:
         """
-        Calculate distance between two coordinates using Haversine formula
+        Vectorized distances from one point to many
+        
+        Distances feed a per-km ranking penalty and a display value, so by
+        default they use the equirectangular approximation (one cos per
+        query, no per-point trig). Haversine is used when precise=True or
+        when any point is farther than APPROX_DISTANCE_MAX_M.
         
         Returns:
-            Distance in meters
+            Distances in meters, one per (lats[i], lons[i])
         """
-        R = 6371000  # Earth radius in meters
+        R = EARTH_RADIUS_M
+        
+        if not precise:
+            x = np.radians(lons - lon) * math.cos(math.radians(lat))
+            y = np.radians(lats - lat)
+            distances = R * np.hypot(x, y)
+            if not distances.size or distances.max() <= APPROX_DISTANCE_MAX_M:
+                return distances
         
-        phi1 = math.radians(lat1)
-        phi2 = math.radians(lat2)
-        delta_phi = math.radians(lat2 - lat1)
-        delta_lambda = math.radians(lon2 - lon1)
+        phi1 = math.radians(lat)
+        phi2 = np.radians(lats)
+        delta_phi = phi2 - phi1
+        delta_lambda = np.radians(lons - lon)
         
-        a = (math.sin(delta_phi / 2) ** 2 +
-             math.cos(phi1) * math.cos(phi2) * math.sin(delta_lambda / 2) ** 2)
+        a = (np.sin(delta_phi / 2) ** 2 +
+             math.cos(phi1) * np.cos(phi2) * np.sin(delta_lambda / 2) ** 2)
         
-        c = 2 * math.atan2(math.sqrt(a), math.sqrt(1 - a))
+        # arcsin(sqrt(a)) == atan2(sqrt(a), sqrt(1 - a)); clip rounding above 1
+        return 2 * R * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+    
+    def _assign_distances(self,
+                          latitude: float,
+                          longitude: float,
+                          hospitals: List[HospitalData]):
+        """Set distance_meters on every hospital in one vectorized pass"""
+        if not hospitals:
+            return
+        
+        count = len(hospitals)
+        lats = np.fromiter((h.latitude for h in hospitals), dtype=np.float64, count=count)
+        lons = np.fromiter((h.longitude for h in hospitals), dtype=np.float64, count=count)
+        
+        distances = self._calculate_distances(latitude, longitude, lats, lons)
         
-        return R * c
+        # tolist() hands back plain floats for JSON encoding
+        for hospital, distance in zip(hospitals, distances.tolist()):
+            hospital.distance_meters = distance
     
     def rank_hospitals(self,
                       hospitals: List[HospitalData],
-                      visited_place_ids: List[str]) -> List[HospitalData]:
+                      visited_place_ids: Iterable[str]) -> List[HospitalData]:
         """
         Rank hospitals with smart scoring
         
@@ -213,13 +277,19 @@ class MapsService:
         
         Args:
             hospitals: List of hospitals
-            visited_place_ids: List of place_ids user has visited
+            visited_place_ids: place_ids the user has visited
             
         Returns:
             Sorted list of hospitals
         """
+        # Hashed lookups however the ids were passed (a list would be O(N*M))
+        if isinstance(visited_place_ids, (set, frozenset)):
+            visited = visited_place_ids
+        else:
+            visited = frozenset(visited_place_ids)
+        
         for hospital in hospitals:
-            hospital.visited_before = hospital.place_id in visited_place_ids
+            hospital.visited_before = hospital.place_id in visited
             
             visited_bonus = 100 if hospital.visited_before else 0
             rating_score = (hospital.rating or 0) * 10
@@ -1,10 +1,11 @@
 """
 OCR Service with Image Preprocessing
 Extracts text from prescription images using OpenCV + Tesseract.
+
+cv2 and pytesseract are imported on first use, so processes that never
+OCR an image (mock mode, workers, tests) skip loading them.
 """
-import cv2
 import numpy as np
-import pytesseract
 from typing import Optional, Dict, Tuple
 import logging
 import re
@@ -23,6 +24,7 @@ class OCRService:
             tesseract_cmd: Path to tesseract executable (optional)
         """
         if tesseract_cmd:
+            import pytesseract
             pytesseract.pytesseract.tesseract_cmd = tesseract_cmd
         
         logger.info("✅ OCR Service initialized")
@@ -45,6 +47,8 @@ class OCRService:
         Returns:
             Preprocessed image as numpy array
         """
+        import cv2
+        
         # 1. Decode image
         nparr = np.frombuffer(image_bytes, np.uint8)
         image = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
@@ -88,6 +92,8 @@ class OCRService:
         Returns:
             Deskewed image
         """
+        import cv2
+        
         # Detect edges
         edges = cv2.Canny(image, 50, 150, apertureSize=3)
         
@@ -131,6 +137,8 @@ class OCRService:
         Returns:
             Extracted text
         """
+        import pytesseract
+        
         # Preprocess image
         preprocessed = self.preprocess_image(image_bytes)
         
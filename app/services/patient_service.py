@@ -6,6 +6,7 @@ from typing import Optional, List
 from uuid import UUID
 import logging
 
+from app.models.ids import fast_uuid4
 from app.models.patient import PatientRecord, PatientData
 from app.core.security import get_encryption_manager
 from app.database.router import get_shard_router
@@ -34,16 +35,15 @@ class PatientService:
             PatientData with decrypted information
         """
         # Generate new patient ID
-        patient_id = UUID(int=0).hex  # Temporary, will use uuid4
-        import uuid
-        patient_id = str(uuid.uuid4())
+        patient_id = str(fast_uuid4())
         
         # Determine shard
         shard_id = self.shard_router.get_shard_id(patient_id)
         
         # Encrypt sensitive data
-        encrypted_name = self.encryption.encrypt(name, patient_id)
-        encrypted_history = self.encryption.encrypt(medical_history, patient_id)
+        encrypted_name, encrypted_history = self.encryption.encrypt_many(
+            (name, medical_history), patient_id
+        )
         
         # Insert into appropriate shard
         with self.db_manager.get_connection(shard_id) as conn:
@@ -102,8 +102,9 @@ class PatientService:
                 raise ValueError(f"Data integrity error: patient in wrong shard")
             
             # Decrypt sensitive data
-            decrypted_name = self.encryption.decrypt(row[1], patient_id)
-            decrypted_history = self.encryption.decrypt(row[2], patient_id)
+            decrypted_name, decrypted_history = self.encryption.decrypt_many(
+                (row[1], row[2]), patient_id
+            )
             
             return PatientData(
                 patient_id=UUID(row[0]),
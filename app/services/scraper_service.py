@@ -7,8 +7,11 @@ import time
 import logging
 import re
 from urllib.parse import urljoin, urlparse
+from urllib.robotparser import RobotFileParser
 from datetime import datetime, timedelta
 
+from app.core.http import get_http_session
+
 logger = logging.getLogger(__name__)
 
 
@@ -60,9 +63,7 @@ class HospitalScraperService:
                 return cached_data
         
         try:
-            import requests
             from bs4 import BeautifulSoup
-            from urllib.robotparser import RobotFileParser
             
             # 1. Check robots.txt
             if not self._check_robots_txt(website_url):
@@ -77,7 +78,7 @@ class HospitalScraperService:
                 'User-Agent': 'AuraHealth/1.0 (Healthcare App; Educational Purpose)'
             }
             
-            response = requests.get(website_url, headers=headers, timeout=10)
+            response = get_http_session().get(website_url, headers=headers)
             response.raise_for_status()
             
             # 4. Parse HTML
@@ -111,14 +112,20 @@ class HospitalScraperService:
     def _check_robots_txt(self, url: str) -> bool:
         """Check if robots.txt allows crawling"""
         try:
-            from urllib.robotparser import RobotFileParser
-            
             parsed = urlparse(url)
             robots_url = f"{parsed.scheme}://{parsed.netloc}/robots.txt"
             
+            # Fetched on the shared session so the page request that
+            # follows reuses the connection (same rules as RobotFileParser.read)
+            response = get_http_session().get(robots_url)
+            if response.status_code in (401, 403):
+                return False
+            if 400 <= response.status_code < 500:
+                return True
+            response.raise_for_status()
+            
             rp = RobotFileParser()
-            rp.set_url(robots_url)
-            rp.read()
+            rp.parse(response.text.splitlines())
             
             user_agent = "AuraHealth/1.0"
             can_fetch = rp.can_fetch(user_agent, url)
@@ -5,6 +5,7 @@ Translates doctor shorthand (sigs) into machine-readable logic.
 from typing import Dict, List, Optional
 from dataclasses import dataclass
 import logging
+import re
 
 logger = logging.getLogger(__name__)
 
@@ -154,8 +155,6 @@ class SemanticParser:
         Returns:
             Numeric dosage count (defaults to 1 if unclear)
         """
-        import re
-        
         # Look for numbers at start of string
         match = re.search(r'^(\d+)', dosage_text.strip())
         if match:
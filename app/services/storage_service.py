@@ -0,0 +1,86 @@
+"""
+Prescription Image Storage
+Keeps encrypted prescription images in S3-compatible object storage
+(AWS S3 or MinIO) instead of in-row BYTEA.
+
+Postgres then holds only the object key. When no bucket is configured
+(local development, mock mode) images stay in prescriptions.prescription_image.
+boto3 is imported only when a bucket is configured.
+"""
+from typing import Optional
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Concurrent HTTP connections boto3 keeps to the object store
+MAX_POOL_CONNECTIONS = 32
+
+
+class ImageStorageService:
+    """Stores encrypted prescription images by prescription_id"""
+    
+    def __init__(self, bucket: Optional[str] = None, endpoint_url: Optional[str] = None):
+        """
+        Initialize image storage
+        
+        Args:
+            bucket: S3 bucket name (None keeps images in Postgres)
+            endpoint_url: Custom endpoint, e.g. http://localhost:9000 for MinIO
+        """
+        self.bucket = bucket
+        self.client = None
+        
+        if not bucket:
+            logger.info("⚠️  Object storage not configured - images stored in Postgres")
+            return
+        
+        import boto3
+        from botocore.config import Config
+        
+        self.client = boto3.client(
+            "s3",
+            endpoint_url=endpoint_url,
+            config=Config(max_pool_connections=MAX_POOL_CONNECTIONS)
+        )
+        logger.info(f"✅ Image storage initialized (bucket: {bucket})")
+    
+    @property
+    def enabled(self) -> bool:
+        """True when images go to object storage"""
+        return self.client is not None
+    
+    @staticmethod
+    def object_key(prescription_id: str) -> str:
+        """Object key for a prescription image"""
+        return f"rx/{prescription_id}"
+    
+    def put(self, key: str, data: bytes) -> None:
+        """Upload an (already encrypted) image"""
+        self.client.put_object(Bucket=self.bucket, Key=key, Body=data)
+    
+    def get(self, key: str) -> bytes:
+        """Download an encrypted image"""
+        return self.client.get_object(Bucket=self.bucket, Key=key)["Body"].read()
+    
+    def delete(self, key: str) -> None:
+        """Remove an image (e.g. one orphaned by a duplicate upload)"""
+        self.client.delete_object(Bucket=self.bucket, Key=key)
+
+
+# Global storage instance
+storage_service: Optional[ImageStorageService] = None
+
+
+def init_storage_service(bucket: Optional[str] = None,
+                         endpoint_url: Optional[str] = None) -> ImageStorageService:
+    """Initialize the global image storage service"""
+    global storage_service
+    storage_service = ImageStorageService(bucket, endpoint_url)
+    return storage_service
+
+
+def get_storage_service() -> ImageStorageService:
+    """Get the global image storage service instance"""
+    if storage_service is None:
+        raise RuntimeError("Image storage not initialized. Call init_storage_service() first.")
+    return storage_service
@@ -22,7 +22,7 @@ class VoiceService:
         
         if not mock_mode:
             try:
-                from app.core.config import get_config
+                from app.core.config import get_config, HTTP_TIMEOUT
                 config = get_config()
                 
                 twilio_creds = config.get_api_key('twilio')
@@ -31,7 +31,12 @@ class VoiceService:
                 self.from_number = twilio_creds.get('phone_number')
                 
                 from twilio.rest import Client
-                self.client = Client(self.account_sid, self.auth_token)
+                from twilio.http.http_client import TwilioHttpClient
+                self.client = Client(
+                    self.account_sid,
+                    self.auth_token,
+                    http_client=TwilioHttpClient(timeout=HTTP_TIMEOUT)
+                )
                 
                 logger.info("✅ Twilio Voice client initialized")
             except Exception as e:
@@ -43,7 +48,8 @@ class VoiceService:
     def initiate_call(self,
                      patient_phone: str,
                      hospital_phone: str,
-                     hospital_name: str) -> Dict:
+                     hospital_name: str,
+                     status_callback: Optional[str] = None) -> Dict:
         """
         Initiate a bridged call between patient and hospital
         
@@ -56,6 +62,7 @@ class VoiceService:
             patient_phone: Patient's phone number
             hospital_phone: Hospital's phone number
             hospital_name: Hospital name (for logging)
+            status_callback: URL Twilio POSTs call status changes to (optional)
             
         Returns:
             Dict with call status and SID
@@ -82,10 +89,15 @@ class VoiceService:
             """
             
             # Initiate call to patient
+            call_options = {}
+            if status_callback:
+                call_options["status_callback"] = status_callback
+            
             call = self.client.calls.create(
                 to=patient_phone,
                 from_=self.from_number,
-                twiml=twiml
+                twiml=twiml,
+                **call_options
             )
             
             logger.info(f"✅ Call initiated: {call.sid}")
@@ -139,6 +151,24 @@ class VoiceService:
             logger.error(f"❌ Failed to fetch call status: {e}")
             return {"error": str(e)}
     
+    def validate_callback(self, url: str, params: Dict, signature: str) -> bool:
+        """
+        Verify a Twilio webhook came from Twilio (X-Twilio-Signature)
+        
+        Args:
+            url: Full URL the webhook was sent to
+            params: POSTed form parameters
+            signature: Value of the X-Twilio-Signature header
+            
+        Returns:
+            True if the signature is valid (always True in mock mode)
+        """
+        if self.mock_mode:
+            return True
+        
+        from twilio.request_validator import RequestValidator
+        return RequestValidator(self.auth_token).validate(url, params, signature)
+    
     def send_appointment_sms(self,
                             patient_phone: str,
                             hospital_name: str,
@@ -1,18 +1,35 @@
 """
 Celery Task Definitions
-Background jobs for inventory monitoring and reminders.
+Background jobs for inventory monitoring, reminders, prescription OCR,
+hospital website scraping and outbound calls.
+
+OCR, scraping and telephony run on their own queues so slow jobs never
+starve the periodic tasks:
+
+    celery -A app.tasks.celery_tasks worker -Q ocr --loglevel=info
+    celery -A app.tasks.celery_tasks worker -Q scrape --loglevel=info
+    celery -A app.tasks.celery_tasks worker -Q telephony --loglevel=info
 """
 from celery import Celery
+from celery.signals import worker_process_init
 from datetime import datetime, timedelta
 import logging
+import os
+
+from app.core.config import CELERY_BROKER_URL
+
+try:
+    from pybase64 import b64decode  # SIMD decoder for multi-MB scans
+except ImportError:
+    from base64 import b64decode
 
 logger = logging.getLogger(__name__)
 
 # Initialize Celery
 celery_app = Celery(
     'aurahealth_tasks',
-    broker='redis://localhost:6379/0',
-    backend='redis://localhost:6379/0'
+    broker=CELERY_BROKER_URL,
+    backend=CELERY_BROKER_URL
 )
 
 # Celery configuration
@@ -22,9 +39,131 @@ celery_app.conf.update(
     result_serializer='json',
     timezone='UTC',
     enable_utc=True,
+    task_routes={
+        'tasks.run_ocr': {'queue': 'ocr'},
+        'tasks.scrape_hospital': {'queue': 'scrape'},
+        'tasks.place_call': {'queue': 'telephony'},
+    },
 )
 
 
+@worker_process_init.connect
+def init_worker_services(**kwargs):
+    """Build the app once per worker process so tasks share its services"""
+    from app.main import create_app
+    
+    create_app(mock_mode=os.getenv("MOCK_MODE", "false").lower() == "true")
+
+
+@celery_app.task(name='tasks.run_ocr')
+def run_ocr(prescription_id: str, patient_id: str):
+    """
+    Background task: OCR an uploaded prescription and store the result
+    
+    Reads the encrypted image stored by the upload endpoint, extracts the
+    structured data and marks the prescription 'completed' (or 'failed').
+    
+    Args:
+        prescription_id: Prescription UUID
+        patient_id: Patient UUID (shard routing and decryption key)
+    """
+    from app.core.security import get_encryption_manager
+    from app.database.connection import get_db_manager, jsonb
+    from app.database.router import get_shard_router
+    from app.services.ocr_service import get_ocr_service
+    
+    shard_id = get_shard_router().get_shard_id(patient_id)
+    db_manager = get_db_manager()
+    
+    with db_manager.get_connection(shard_id) as conn:
+        cursor = conn.cursor()
+        cursor.execute(
+            """
+            SELECT prescription_image, storage_key
+            FROM prescriptions
+            WHERE prescription_id = %s AND patient_id = %s
+            """,
+            (prescription_id, patient_id)
+        )
+        row = cursor.fetchone()
+    
+    if not row:
+        logger.warning(f"⚠️  Prescription {prescription_id} not found for OCR")
+        return {"status": "missing", "prescription_id": prescription_id}
+    
+    status = 'failed'
+    extracted_data = None
+    try:
+        encrypted_image = row[0]
+        if row[1]:
+            from app.services.storage_service import get_storage_service
+            encrypted_image = get_storage_service().get(row[1])
+        
+        image_base64 = get_encryption_manager().decrypt(encrypted_image, patient_id)
+        ocr_service = get_ocr_service()
+        text = ocr_service.extract_text(b64decode(image_base64))
+        extracted_data = ocr_service.extract_structured_data(text)
+        status = 'completed'
+    finally:
+        with db_manager.get_connection(shard_id) as conn:
+            cursor = conn.cursor()
+            cursor.execute(
+                """
+                UPDATE prescriptions
+                SET extracted_data = %s, status = %s
+                WHERE prescription_id = %s AND patient_id = %s
+                """,
+                (jsonb(extracted_data), status, prescription_id, patient_id)
+            )
+    
+    logger.info(f"✅ OCR complete for prescription {prescription_id}")
+    return {"status": status, "prescription_id": prescription_id}
+
+
+@celery_app.task(name='tasks.scrape_hospital')
+def scrape_hospital(website_url: str, place_id: str):
+    """
+    Background task: Scrape a hospital website for OPD/department details
+    
+    Args:
+        website_url: Hospital website URL
+        place_id: Google Maps place_id
+        
+    Returns:
+        Dict with scraped data (kept in the result backend for polling)
+    """
+    from app.services.scraper_service import get_scraper_service
+    
+    return get_scraper_service().scrape_hospital_details(website_url, place_id)
+
+
+@celery_app.task(name='tasks.place_call')
+def place_call(patient_phone: str,
+               hospital_phone: str,
+               hospital_name: str,
+               status_callback: str = None):
+    """
+    Background task: Bridge a patient to a hospital via Twilio
+    
+    Args:
+        patient_phone: Patient's phone number
+        hospital_phone: Hospital's phone number
+        hospital_name: Hospital name
+        status_callback: URL Twilio reports call progress to
+        
+    Returns:
+        Dict with call status and SID (kept in the result backend for polling)
+    """
+    from app.services.voice_service import get_voice_service
+    
+    return get_voice_service().initiate_call(
+        patient_phone=patient_phone,
+        hospital_phone=hospital_phone,
+        hospital_name=hospital_name,
+        status_callback=status_callback
+    )
+
+
 @celery_app.task(name='tasks.monitor_inventory')
 def monitor_inventory():
     """
@@ -5,8 +5,11 @@
 CREATE TABLE IF NOT EXISTS prescriptions (
     prescription_id UUID PRIMARY KEY,
     patient_id UUID NOT NULL,
-    prescription_image BYTEA NOT NULL,  -- Encrypted prescription image
+    prescription_image BYTEA,           -- Encrypted prescription image (when not in object storage)
+    storage_key TEXT,                   -- Object storage key of the encrypted image
+    image_hash CHAR(64),                -- BLAKE2b-256 of the decoded image (duplicate uploads)
     extracted_data JSONB,               -- Structured OCR output
+    status VARCHAR(20) NOT NULL DEFAULT 'completed',  -- 'pending', 'completed', 'failed'
     created_at TIMESTAMP DEFAULT NOW(),
     
     -- Foreign key (assuming patient_records exists)
@@ -17,6 +20,17 @@ CREATE TABLE IF NOT EXISTS prescriptions (
 CREATE INDEX IF NOT EXISTS idx_prescription_patient ON prescriptions(patient_id);
 CREATE INDEX IF NOT EXISTS idx_prescription_created ON prescriptions(created_at DESC);
 
+-- Existing databases: add the OCR job status column
+ALTER TABLE prescriptions ADD COLUMN IF NOT EXISTS status VARCHAR(20) NOT NULL DEFAULT 'completed';
+
+-- Existing databases: allow images to live in object storage
+ALTER TABLE prescriptions ADD COLUMN IF NOT EXISTS storage_key TEXT;
+ALTER TABLE prescriptions ALTER COLUMN prescription_image DROP NOT NULL;
+
+-- Existing databases: detect re-uploads of the same scan
+ALTER TABLE prescriptions ADD COLUMN IF NOT EXISTS image_hash CHAR(64);
+CREATE UNIQUE INDEX IF NOT EXISTS idx_prescription_image_hash ON prescriptions(patient_id, image_hash);
+
 -- Medications Table
 CREATE TABLE IF NOT EXISTS medications (
     medication_id UUID PRIMARY KEY,
@@ -56,6 +70,12 @@ CREATE INDEX IF NOT EXISTS idx_medication_prescription ON medications(prescripti
 CREATE INDEX IF NOT EXISTS idx_medication_pills_remaining ON medications(pills_remaining);
 CREATE INDEX IF NOT EXISTS idx_medication_active ON medications(patient_id, pills_remaining) 
     WHERE pills_remaining > 0;
+-- Lookback scans per patient (chronic-condition detection)
+CREATE INDEX IF NOT EXISTS idx_medication_patient_created ON medications(patient_id, created_at);
+-- Serves GET /api/medications (newest active first) without a sort;
+-- on a live database create it with CREATE INDEX CONCURRENTLY
+CREATE INDEX IF NOT EXISTS idx_medication_active_recent ON medications(patient_id, created_at DESC) 
+    WHERE pills_remaining > 0;
 
 -- Adherence Events Table
 CREATE TABLE IF NOT EXISTS adherence_events (
@@ -75,6 +95,8 @@ CREATE TABLE IF NOT EXISTS adherence_events (
 CREATE INDEX IF NOT EXISTS idx_adherence_medication ON adherence_events(medication_id);
 CREATE INDEX IF NOT EXISTS idx_adherence_created ON adherence_events(created_at DESC);
 CREATE INDEX IF NOT EXISTS idx_adherence_type ON adherence_events(event_type);
+-- Per-medication TAKEN counts in a window (consistency index)
+CREATE INDEX IF NOT EXISTS idx_adherence_med_type_created ON adherence_events(medication_id, event_type, created_at);
 
 -- Trigger to update medications.updated_at
 CREATE OR REPLACE FUNCTION update_medication_updated_at()
@@ -95,6 +117,9 @@ COMMENT ON TABLE prescriptions IS 'Uploaded prescription images with OCR results
 COMMENT ON TABLE medications IS 'Active and historical medication records with inventory tracking';
 COMMENT ON TABLE adherence_events IS 'Log of medication adherence events (taken, missed, wastage)';
 
+COMMENT ON COLUMN prescriptions.status IS 'OCR job state: pending (queued on Celery), completed, failed';
+COMMENT ON COLUMN prescriptions.image_hash IS 'BLAKE2b-256 hex of the uploaded image; re-uploads by the same patient reuse the existing row';
+COMMENT ON COLUMN prescriptions.storage_key IS 'S3/MinIO key of the encrypted image; NULL when stored in prescription_image';
 COMMENT ON COLUMN medications.frequency_json IS 'Parsed frequency schedule: {count_per_day: X, times: [...]}';
 COMMENT ON COLUMN medications.pills_remaining IS 'Current pill count for inventory management';
 COMMENT ON COLUMN adherence_events.event_type IS 'TAKEN: pill consumed, MISSED: forgot dose, WASTAGE: lost pills, REFILL: restocked';
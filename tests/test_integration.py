@@ -3,6 +3,8 @@ Integration Tests: End-to-End Workflow Verification
 Tests the complete flow from prescription upload to refill alerts.
 """
 import unittest
+from collections import defaultdict
+from contextlib import contextmanager
 from unittest.mock import Mock, patch
 import base64
 from datetime import datetime
@@ -11,6 +13,29 @@ from app.services.semantic_parser import SemanticParser
 from app.services.notification_service import NotificationService
 
 
+def _inventory_service_on_mock_db(get_shard_id=lambda patient_id: 0):
+    """
+    InventoryService on mock shards, each handing out its own Mock cursor
+    
+    Returns:
+        (service, shard id -> cursor)
+    """
+    from app.services.inventory_service import InventoryService
+    
+    cursors = defaultdict(Mock)
+    
+    @contextmanager
+    def get_connection(shard_id):
+        yield Mock(cursor=Mock(return_value=cursors[shard_id]))
+    
+    with patch('app.services.inventory_service.get_db_manager',
+               return_value=Mock(get_connection=get_connection)), \
+         patch('app.services.inventory_service.get_shard_router',
+               return_value=Mock(get_shard_id=get_shard_id)):
+        service = InventoryService()
+    return service, cursors
+
+
 class TestPrescriptionToMedicationFlow(unittest.TestCase):
     """Test complete prescription → medication workflow"""
     
@@ -66,6 +91,110 @@ class TestAdherenceTracking(unittest.TestCase):
         # pills_remaining stays same
         self.assertEqual(pills_remaining, 29)
     
+    def test_event_timestamps_are_consistent(self):
+        """Test events share one timestamp and accept a caller-supplied one"""
+        from uuid import uuid4
+        from app.models.adherence_event import AdherenceEvent
+        
+        event = AdherenceEvent.create_taken(uuid4(), datetime.now())
+        self.assertEqual(event.actual_time, event.created_at)
+        
+        now = datetime(2024, 1, 1, 8, 0)
+        events = [AdherenceEvent.create_refill(uuid4(), 30, now=now) for _ in range(3)]
+        self.assertTrue(all(e.actual_time == e.created_at == now for e in events))
+    
+    def test_fast_uuid4_ids_are_unique_v4(self):
+        """Test batched event ids are valid, unique version 4 UUIDs"""
+        from uuid import RFC_4122
+        from app.models.ids import fast_uuid4, UUID_BATCH_SIZE
+        
+        ids = [fast_uuid4() for _ in range(UUID_BATCH_SIZE + 10)]  # crosses a refill
+        self.assertEqual(len(set(ids)), len(ids))
+        self.assertTrue(all(u.version == 4 and u.variant == RFC_4122 for u in ids))
+    
+    def test_record_taken_is_one_statement(self):
+        """Test the event insert and inventory update share one round trip"""
+        service, cursors = _inventory_service_on_mock_db()
+        cursor = cursors[0]
+        cursor.fetchone.return_value = (29,)
+        
+        service.record_taken("550e8400-e29b-41d4-a716-446655440001",
+                             "550e8400-e29b-41d4-a716-446655440000", datetime.now())
+        
+        cursor.execute.assert_called_once()
+        sql, params = cursor.execute.call_args.args
+        self.assertIn("INSERT INTO adherence_events", sql)
+        self.assertIn("UPDATE medications", sql)
+        self.assertEqual(params[2], "TAKEN")
+        self.assertEqual(params[-3:-1], (1, params[5]))  # last_taken_at = actual_time
+    
+    def test_record_taken_many_batches_per_shard(self):
+        """Test a sync batch is one insert and one inventory update per shard"""
+        service, _ = _inventory_service_on_mock_db(lambda pid: 0 if pid == "p0" else 1)
+        
+        med = "550e8400-e29b-41d4-a716-446655440001"
+        events = [
+            {"medication_id": med, "patient_id": "p0", "scheduled_time": None},
+            {"medication_id": med, "patient_id": "p0", "scheduled_time": None, "pills_count": 2},
+            {"medication_id": med, "patient_id": "p1", "scheduled_time": None}
+        ]
+        with patch('app.services.inventory_service.execute_values') as batched:
+            recorded = service.record_taken_many(events)
+        
+        self.assertEqual(recorded, 3)
+        self.assertEqual(batched.call_count, 4)  # insert + update on each of two shards
+        inserted, updated = batched.call_args_list[0].args[2], batched.call_args_list[1].args[2]
+        self.assertEqual(len(inserted), 2)
+        self.assertEqual([(m, pills) for m, pills, _ in updated], [(med, 3)])
+    
+    def test_record_taken_many_invalidates_committed_shards(self):
+        """Test a failing shard leaves earlier shards' twins invalidated"""
+        service, _ = _inventory_service_on_mock_db(lambda pid: 0 if pid == "p0" else 1)
+        med = "550e8400-e29b-41d4-a716-446655440001"
+        events = [
+            {"medication_id": med, "patient_id": "p0", "scheduled_time": None},
+            {"medication_id": med, "patient_id": "p1", "scheduled_time": None}
+        ]
+        
+        with patch('app.services.inventory_service.execute_values') as batched, \
+             patch('app.services.inventory_service.invalidate_twin') as invalidate:
+            batched.side_effect = [None, None, RuntimeError("shard 1 down")]
+            with self.assertRaises(RuntimeError):
+                service.record_taken_many(events)
+        
+        invalidate.assert_called_once_with("p0")
+    
+    def test_twin_invalidated_after_commit(self):
+        """Test single-event writes drop the cached twin only once committed"""
+        service, _ = _inventory_service_on_mock_db()
+        order = []
+        scoped = service.db_manager.get_connection
+        
+        @contextmanager
+        def get_connection(shard_id):
+            with scoped(shard_id) as conn:
+                yield conn
+            order.append("commit")
+        
+        service.db_manager.get_connection = get_connection
+        with patch('app.services.inventory_service.invalidate_twin',
+                   side_effect=lambda patient_id: order.append("invalidate")):
+            service.record_missed("550e8400-e29b-41d4-a716-446655440001", "p1", datetime.now())
+        
+        self.assertEqual(order, ["commit", "invalidate"])
+    
+    def test_adherence_rate_is_one_query(self):
+        """Test the adherence percentage comes back from one query"""
+        service, cursors = _inventory_service_on_mock_db()
+        cursor = cursors[0]
+        cursor.fetchone.return_value = (50.0,)
+        
+        rate = service.get_adherence_rate("med_1", "p1", days=7)
+        
+        cursor.execute.assert_called_once()
+        self.assertEqual(cursor.execute.call_args.args[1][:2], (7, "med_1"))
+        self.assertEqual(rate, 50.0)
+    
     def test_consistency_index_thresholds(self):
         """Test risk level thresholds"""
         test_cases = [
@@ -179,5 +308,125 @@ class TestContinuityVerification(unittest.TestCase):
         self.assertAlmostEqual(adherence_rate, 85.71, places=1)
 
 
+class TestAppErrorHandlers(unittest.TestCase):
+    """Test the application-level error handlers"""
+    
+    def test_rate_limit_handler_returns_429(self):
+        """Test the 429 handler renders JSON instead of failing"""
+        from flask import abort
+        from app.main import create_app
+        
+        app = create_app(mock_mode=True)
+        app.add_url_rule('/_limited', 'limited', lambda: abort(429))
+        
+        response = app.test_client().get('/_limited')
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response.get_json()["error"], "Rate limit exceeded")
+    
+    def test_health_is_exempt_from_rate_limits(self):
+        """Test health probes never hit the per-second limit"""
+        from app.main import create_app
+        
+        client = create_app(mock_mode=True).test_client()
+        statuses = {client.get('/health').status_code for _ in range(15)}
+        self.assertEqual(statuses, {200})
+
+
+class TestJSONProvider(unittest.TestCase):
+    """Test the orjson-backed Flask JSON provider"""
+    
+    def test_provider_encodes_uuid_and_datetime(self):
+        """UUIDs and datetimes encode the same as the old manual conversions"""
+        import json
+        import uuid
+        from flask import Flask
+        from app.core.serialization import OrjsonProvider
+        
+        app = Flask(__name__)
+        app.json = OrjsonProvider(app)
+        twin_id = uuid.uuid4()
+        created_at = datetime(2026, 1, 8, 18, 25, 0, 123456)
+        
+        with app.app_context():
+            body = app.json.dumps({"twin_id": twin_id, "created_at": created_at, 1: "x"})
+        
+        self.assertEqual(json.loads(body), {
+            "twin_id": str(twin_id),
+            "created_at": created_at.isoformat(),
+            "1": "x"
+        })
+    
+    def test_provider_encodes_numpy_and_parses_requests(self):
+        """NumPy values encode as plain JSON and request bodies round-trip"""
+        import numpy as np
+        from flask import Flask
+        from app.core.serialization import OrjsonProvider
+        
+        app = Flask(__name__)
+        app.json = OrjsonProvider(app)
+        
+        with app.app_context():
+            body = app.json.dumps({"d": np.float64(1.5), "v": np.array([1, 2])})
+            self.assertEqual(app.json.loads(body), {"d": 1.5, "v": [1, 2]})
+            self.assertEqual(app.json.loads(b'{"a": [1]}'), {"a": [1]})
+
+
+class TestHTTPSession(unittest.TestCase):
+    """Test the shared outbound HTTP session"""
+    
+    def test_session_is_shared_and_pooled(self):
+        """One session per process with pooled https connections"""
+        from app.core import http
+        
+        session = http.get_http_session()
+        self.assertIs(http.get_http_session(), session)
+        
+        adapter = session.get_adapter("https://places.googleapis.com")
+        self.assertEqual(adapter._pool_maxsize, http.POOL_MAXSIZE)
+        self.assertEqual(adapter.max_retries.total, 2)
+        self.assertEqual(adapter.timeout, http.HTTP_TIMEOUT)
+
+
+class TestRequestSchemas(unittest.TestCase):
+    """Test request validation on API handlers"""
+    
+    def test_mark_taken_parses_types(self):
+        """UUID, datetime and defaults are parsed from raw JSON bytes"""
+        from uuid import UUID
+        from app.models.schemas import MarkTakenReq
+        
+        req = MarkTakenReq.model_validate_json(
+            b'{"patient_id": "550e8400-e29b-41d4-a716-446655440000", '
+            b'"scheduled_time": "2026-01-08T09:00:00"}'
+        )
+        
+        self.assertEqual(req.patient_id, UUID("550e8400-e29b-41d4-a716-446655440000"))
+        self.assertEqual(req.scheduled_time, datetime(2026, 1, 8, 9, 0))
+        self.assertEqual(req.pills_count, 1)
+    
+    def test_invalid_body_returns_400_with_details(self):
+        """Missing fields come back as 400 with the failing locations"""
+        from app.main import create_app
+        
+        client = create_app(mock_mode=True).test_client()
+        response = client.post('/api/medications/med_1/taken', json={
+            "patient_id": "not-a-uuid",
+            "scheduled_time": "yesterday"
+        })
+        
+        self.assertEqual(response.status_code, 400)
+        locations = {tuple(err["loc"]) for err in response.get_json()["details"]}
+        self.assertEqual(locations, {("patient_id",), ("scheduled_time",)})
+    
+    def test_list_medications_rejects_bad_paging(self):
+        """Non-integer or out-of-range limit/offset return 400"""
+        from app.main import create_app
+        
+        client = create_app(mock_mode=True).test_client()
+        for query in ("limit=abc", "limit=0", "offset=-1"):
+            response = client.get(f'/api/medications/?patient_id=p1&{query}')
+            self.assertEqual(response.status_code, 400, query)
+
+
 if __name__ == '__main__':
     unittest.main(verbosity=2)
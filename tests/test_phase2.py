@@ -136,5 +136,221 @@ class TestNotificationService(unittest.TestCase):
         self.assertGreater(result["pills_needed"], 0)
 
 
+class TestBackgroundJobs(unittest.TestCase):
+    """Test OCR and scraping are handed to Celery outside mock mode"""
+    
+    def setUp(self):
+        from app.main import create_app
+        
+        self.app = create_app(mock_mode=True)
+        self.app.config["MOCK_MODE"] = False  # behave as production routing
+        self.client = self.app.test_client()
+    
+    def test_task_routes(self):
+        """Test OCR and scrape tasks go to dedicated queues"""
+        from app.tasks.celery_tasks import celery_app
+        
+        routes = celery_app.conf.task_routes
+        self.assertEqual(routes['tasks.run_ocr'], {'queue': 'ocr'})
+        self.assertEqual(routes['tasks.scrape_hospital'], {'queue': 'scrape'})
+        self.assertEqual(routes['tasks.place_call'], {'queue': 'telephony'})
+    
+    def test_celery_uses_configured_broker(self):
+        """Test workers and the web process share the configured broker"""
+        from app.core.config import CELERY_BROKER_URL
+        from app.tasks.celery_tasks import celery_app
+        
+        self.assertEqual(celery_app.conf.broker_url, CELERY_BROKER_URL)
+        self.assertEqual(celery_app.conf.result_backend, CELERY_BROKER_URL)
+    
+    def test_upload_enqueues_ocr(self):
+        """Test upload stores a pending prescription and returns 202"""
+        import base64
+        from unittest.mock import patch
+        
+        patient_id = "550e8400-e29b-41d4-a716-446655440000"
+        with patch('app.tasks.celery_tasks.run_ocr.delay') as delay:
+            response = self.client.post('/api/prescriptions/upload', json={
+                "patient_id": patient_id,
+                "image": base64.b64encode(b"not-really-an-image").decode()
+            })
+        
+        self.assertEqual(response.status_code, 202)
+        body = response.get_json()
+        self.assertEqual(body["status"], "pending")
+        delay.assert_called_once_with(body["prescription_id"], patient_id)
+    
+    def test_upload_stores_image_in_object_storage(self):
+        """Test the encrypted image goes to the bucket and only the key to Postgres"""
+        import base64
+        from unittest.mock import Mock, patch
+        from app.services.storage_service import ImageStorageService
+        
+        storage = ImageStorageService()
+        storage.client = Mock()
+        storage.bucket = "rx-bucket"
+        
+        with patch('app.routers.prescription_router.get_storage_service', return_value=storage), \
+                patch('app.tasks.celery_tasks.run_ocr.delay'):
+            response = self.client.post('/api/prescriptions/upload', json={
+                "patient_id": "550e8400-e29b-41d4-a716-446655440000",
+                "image": base64.b64encode(b"scan").decode()
+            })
+        
+        self.assertEqual(response.status_code, 202)
+        prescription_id = response.get_json()["prescription_id"]
+        kwargs = storage.client.put_object.call_args.kwargs
+        self.assertEqual(kwargs["Bucket"], "rx-bucket")
+        self.assertEqual(kwargs["Key"], f"rx/{prescription_id}")
+        self.assertIsInstance(kwargs["Body"], bytes)
+    
+    def test_duplicate_upload_skips_ocr(self):
+        """Test a re-uploaded scan returns the earlier prescription"""
+        import base64
+        import hashlib
+        from unittest.mock import patch
+        
+        patient_id = "550e8400-e29b-41d4-a716-446655440000"
+        earlier = {"prescription_id": "rx-1", "status": "completed",
+                   "extracted_data": {"medications": []}, "duplicate": True}
+        
+        with patch('app.routers.prescription_router._find_duplicate_upload',
+                   return_value=earlier) as find, \
+                patch('app.tasks.celery_tasks.run_ocr.delay') as delay:
+            response = self.client.post('/api/prescriptions/upload', json={
+                "patient_id": patient_id,
+                "image": base64.b64encode(b"scan").decode()
+            })
+        
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.get_json(), earlier)
+        delay.assert_not_called()
+        self.assertEqual(find.call_args.args[1:], (
+            patient_id, hashlib.blake2b(b"scan", digest_size=32).hexdigest()
+        ))
+    
+    def test_reupload_replaces_failed_ocr(self):
+        """Test a re-upload after failed OCR deletes the old row and enqueues again"""
+        import base64
+        from unittest.mock import Mock, patch
+        
+        storage = Mock(enabled=False)
+        with patch('app.routers.prescription_router._discard_failed_upload',
+                   return_value=["rx/old"]), \
+                patch('app.routers.prescription_router.get_storage_service',
+                      return_value=storage), \
+                patch('app.tasks.celery_tasks.run_ocr.delay') as delay:
+            response = self.client.post('/api/prescriptions/upload', json={
+                "patient_id": "550e8400-e29b-41d4-a716-446655440000",
+                "image": base64.b64encode(b"scan").decode()
+            })
+        
+        self.assertEqual(response.status_code, 202)
+        storage.delete.assert_called_once_with("rx/old")
+        delay.assert_called_once()
+    
+    def test_duplicate_lookup_skips_failed_rows(self):
+        """Test only completed or recently pending rows count as duplicates"""
+        from app.routers.prescription_router import (
+            DUPLICATE_UPLOAD_SQL, DISCARD_FAILED_UPLOAD_SQL
+        )
+        
+        self.assertIn("status = 'completed'", DUPLICATE_UPLOAD_SQL)
+        self.assertIn("status = 'pending' AND created_at >", DUPLICATE_UPLOAD_SQL)
+        self.assertIn("NOT", DISCARD_FAILED_UPLOAD_SQL)
+    
+    def test_upload_broker_down_returns_503(self):
+        """Test a failed enqueue marks the prescription failed and returns 503"""
+        import base64
+        from unittest.mock import MagicMock, patch
+        
+        conn = MagicMock()
+        cursor = conn.cursor.return_value
+        cursor.fetchall.return_value = []
+        cursor.fetchone.return_value = None
+        cursor.rowcount = 1
+        db_manager = MagicMock()
+        db_manager.get_connection.return_value.__enter__.return_value = conn
+        
+        with patch('app.routers.prescription_router.get_db_manager', return_value=db_manager), \
+                patch('app.tasks.celery_tasks.run_ocr.delay',
+                      side_effect=ConnectionError("broker down")):
+            response = self.client.post('/api/prescriptions/upload', json={
+                "patient_id": "550e8400-e29b-41d4-a716-446655440000",
+                "image": base64.b64encode(b"scan").decode()
+            })
+        
+        self.assertEqual(response.status_code, 503)
+        last_query = cursor.execute.call_args.args[0]
+        self.assertIn("SET status = 'failed'", last_query)
+    
+    def test_upload_rejects_invalid_base64(self):
+        """Test non-base64 characters are rejected instead of skipped"""
+        from unittest.mock import patch
+        
+        with patch('app.tasks.celery_tasks.run_ocr.delay') as delay:
+            response = self.client.post('/api/prescriptions/upload', json={
+                "patient_id": "550e8400-e29b-41d4-a716-446655440000",
+                "image": "aGVsbG8*!"
+            })
+        
+        self.assertEqual(response.status_code, 400)
+        delay.assert_not_called()
+    
+    def test_details_enqueues_scrape(self):
+        """Test hospital details returns a job id to poll"""
+        from unittest.mock import patch
+        
+        with patch('app.tasks.celery_tasks.scrape_hospital.delay') as delay:
+            delay.return_value.id = "job-1"
+            response = self.client.get(
+                '/api/hospitals/place_1/details?website=https://example.org'
+            )
+        
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(response.get_json(), {"job_id": "job-1", "status": "queued"})
+        delay.assert_called_once_with("https://example.org", "place_1")
+    
+    def test_call_enqueues_place_call(self):
+        """Test hospital call returns a job id and passes the status callback"""
+        from unittest.mock import patch
+        
+        with patch('app.tasks.celery_tasks.place_call.delay') as delay:
+            delay.return_value.id = "job-2"
+            response = self.client.post('/api/hospitals/call', json={
+                "patient_phone": "+919876543210",
+                "hospital_phone": "+919123456789",
+                "hospital_name": "City General Hospital"
+            })
+        
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(response.get_json(), {"job_id": "job-2", "status": "queued"})
+        args = delay.call_args.args
+        self.assertEqual(args[:3], ("+919876543210", "+919123456789", "City General Hospital"))
+        self.assertTrue(args[3].endswith('/api/hospitals/call/status'))
+    
+    def test_call_status_validated_against_public_url(self):
+        """Test the callback signature is checked against PUBLIC_BASE_URL"""
+        from unittest.mock import patch
+        
+        with patch('app.routers.hospital_router.PUBLIC_BASE_URL', 'https://api.example.org/'), \
+                patch('app.routers.hospital_router.get_voice_service') as voice:
+            voice.return_value.validate_callback.return_value = True
+            response = self.client.post('/api/hospitals/call/status',
+                                        data={"CallSid": "CA1", "CallStatus": "ringing"})
+        
+        self.assertEqual(response.status_code, 204)
+        url = voice.return_value.validate_callback.call_args.args[0]
+        self.assertEqual(url, 'https://api.example.org/api/hospitals/call/status')
+    
+    def test_call_status_not_rate_limited(self):
+        """Test Twilio status callbacks bypass the per-second rate limit"""
+        codes = {
+            self.client.post('/api/hospitals/call/status', data={"CallSid": "CA1"}).status_code
+            for _ in range(15)
+        }
+        self.assertEqual(codes, {204})
+
+
 if __name__ == '__main__':
     unittest.main(verbosity=2)
@@ -2,7 +2,11 @@
 Phase 4 Verification Tests: Digital Twin and Geo-Discovery
 """
 import unittest
+from contextlib import contextmanager
 from datetime import datetime, timedelta
+from unittest.mock import Mock, patch
+
+import numpy as np
 
 from app.services.digital_twin_service import DigitalTwinService, CHRONIC_DRUG_PATTERNS
 from app.services.clinical_summary_service import ClinicalSummaryService
@@ -11,6 +15,43 @@ from app.services.scraper_service import HospitalScraperService
 from app.models.digital_twin import DigitalTwinState, ChronicCondition
 
 
+class FakeRedis(dict):
+    """In-memory stand-in for the Redis commands app.core.cache uses"""
+    
+    def setex(self, key, ttl, value):
+        self[key] = value
+    
+    def sadd(self, key, member):
+        self.setdefault(key, set()).add(member)
+    
+    def smismember(self, key, members):
+        stored = self.get(key, set())
+        return [int(m in stored) for m in members]
+
+
+def _twin_service_on_mock_db():
+    """
+    DigitalTwinService whose shard connections all hand out one Mock cursor
+    
+    Returns:
+        (service, cursor, list of shard ids checked out)
+    """
+    cursor = Mock()
+    checkouts = []
+    
+    @contextmanager
+    def get_connection(shard_id):
+        checkouts.append(shard_id)
+        yield Mock(cursor=Mock(return_value=cursor))
+    
+    with patch('app.services.digital_twin_service.get_db_manager',
+               return_value=Mock(get_connection=get_connection)), \
+         patch('app.services.digital_twin_service.get_shard_router',
+               return_value=Mock(get_shard_id=Mock(return_value=0))):
+        service = DigitalTwinService()
+    return service, cursor, checkouts
+
+
 class TestDigitalTwinService(unittest.TestCase):
     """Test Digital Twin chronic condition detection"""
     
@@ -60,6 +101,114 @@ class TestDigitalTwinService(unittest.TestCase):
         twin.consistency_index = 92.0
         risk = twin.calculate_risk_level()
         self.assertEqual(risk, "LOW")
+    
+    def test_twin_to_dict(self):
+        """Test to_dict matches asdict (conditions as a list) without deep-copying"""
+        from dataclasses import asdict
+        
+        twin = DigitalTwinState.create("mock_patient_id")
+        twin.add_chronic_condition(ChronicCondition(
+            condition_name="DIABETES",
+            first_detected=datetime(2025, 6, 1),
+            confidence_score=0.9,
+            supporting_medications=["metformin"],
+            prescription_count=3
+        ))
+        
+        result = twin.to_dict()
+        expected = asdict(twin)
+        expected["chronic_conditions"] = list(expected["chronic_conditions"].values())
+        self.assertEqual(result, expected)
+        self.assertIs(result["chronic_conditions"][0]["supporting_medications"],
+                      twin.chronic_conditions["DIABETES"].supporting_medications)
+    
+    def test_add_chronic_condition_upserts_by_name(self):
+        """Test re-adding a condition replaces it in place"""
+        twin = DigitalTwinState.create("mock_patient_id")
+        for name, count in (("DIABETES", 3), ("HYPERTENSION", 3), ("DIABETES", 5)):
+            twin.add_chronic_condition(ChronicCondition(
+                condition_name=name,
+                first_detected=datetime(2025, 6, 1),
+                confidence_score=0.5,
+                supporting_medications=[],
+                prescription_count=count
+            ))
+        
+        self.assertEqual(list(twin.chronic_conditions), ["DIABETES", "HYPERTENSION"])
+        self.assertEqual(twin.chronic_conditions["DIABETES"].prescription_count, 5)
+    
+    def test_chronic_conditions_aggregated_in_query(self):
+        """Test conditions come back from one grouped query over the demo data"""
+        from app.main import create_app
+        client = create_app(mock_mode=True).test_client()
+        
+        response = client.get('/api/twin/550e8400-e29b-41d4-a716-446655440000/chronic-conditions')
+        
+        conditions = {
+            c["condition_name"]: (c["prescription_count"], c["supporting_medications"])
+            for c in response.get_json()["chronic_conditions"]
+        }
+        self.assertEqual(conditions, {
+            "DIABETES": (3, ["Metformin"]),
+            "HYPERTENSION": (3, ["Amlodipine"])
+        })
+    
+    def test_consistency_index_single_query(self):
+        """Test TAKEN counts for all medications come from one query"""
+        service, cursor, _ = _twin_service_on_mock_db()
+        cursor.fetchall.return_value = [
+            ("med-1", 2, 30),
+            ("med-2", 1, 15)
+        ]
+        
+        now = datetime(2026, 1, 31)
+        consistency = service.calculate_consistency_index("mock_patient_id", days=30, now=now)
+        
+        executed = [c.args[0] for c in cursor.execute.call_args_list]
+        self.assertEqual([sql.split()[0] for sql in executed], ["PREPARE", "EXECUTE"])
+        self.assertEqual(cursor.execute.call_args.args[1],
+                         (datetime(2026, 1, 1), "mock_patient_id", now))
+        self.assertAlmostEqual(consistency, 45 / 90 * 100)
+    
+    def test_twin_built_on_one_connection(self):
+        """Test the twin's queries share one connection checkout"""
+        service, cursor, checkouts = _twin_service_on_mock_db()
+        cursor.fetchall.return_value = []
+        cursor.fetchone.return_value = (2, 5)
+        
+        twin = service.get_or_create_twin("550e8400-e29b-41d4-a716-446655440000")
+        
+        self.assertEqual(len(checkouts), 1)
+        executed = [c.args[0] for c in cursor.execute.call_args_list]
+        self.assertEqual(sum(sql.startswith("EXECUTE") for sql in executed), 3)
+        self.assertEqual((twin.active_medications_count, twin.total_prescriptions), (2, 5))
+    
+    def test_twin_cache_key_normalised(self):
+        """Test a twin cached under a UUID is dropped by its string id"""
+        from uuid import UUID
+        
+        service, _, _ = _twin_service_on_mock_db()
+        patient_id = "550e8400-e29b-41d4-a716-446655440000"
+        service._cache_put(UUID(patient_id), Mock())
+        self.assertIsNotNone(service._cache_get(patient_id))
+        
+        service.invalidate(patient_id)
+        self.assertIsNone(service._cache_get(UUID(patient_id)))
+    
+    def test_twin_cached_until_invalidated(self):
+        """Test a built twin is reused until the patient's data changes"""
+        service, cursor, checkouts = _twin_service_on_mock_db()
+        cursor.fetchall.return_value = []
+        cursor.fetchone.return_value = (0, 0)
+        patient_id = "550e8400-e29b-41d4-a716-446655440000"
+        
+        first = service.get_or_create_twin(patient_id)
+        self.assertIs(service.get_or_create_twin(patient_id), first)
+        self.assertEqual(len(checkouts), 1)
+        
+        service.invalidate(patient_id)
+        self.assertIsNot(service.get_or_create_twin(patient_id), first)
+        self.assertEqual(len(checkouts), 2)
 
 
 class TestClinicalSummaryService(unittest.TestCase):
@@ -83,7 +232,7 @@ class TestClinicalSummaryService(unittest.TestCase):
             supporting_medications=["Amlodipine"],
             prescription_count=4
         )
-        twin.chronic_conditions.append(condition)
+        twin.add_chronic_condition(condition)
         
         summary = self.service._generate_mock_summary(twin, [])
         
@@ -98,6 +247,126 @@ class TestClinicalSummaryService(unittest.TestCase):
         
         word_count = len(summary.split())
         self.assertLess(word_count, 200)  # Should be under 200 words
+    
+    def test_llm_summaries_cached_by_inputs(self):
+        """Test unchanged inputs reuse the LLM summary until they change"""
+        from unittest.mock import patch
+        
+        twin = DigitalTwinState.create("mock_patient_id")
+        meds = [{"drug_name": "Metformin", "strength": "500mg", "frequency": "BID"}]
+        self.service.mock_mode = False
+        
+        with patch.object(self.service, '_call_llm', return_value="LLM summary") as llm:
+            first = self.service.generate_summary(twin, meds)
+            second = self.service.generate_summary(twin, meds)
+            twin.consistency_index = 42.0
+            self.service.generate_summary(twin, meds)
+        
+        self.assertEqual(first, second)
+        self.assertEqual(llm.call_count, 2)
+        self.assertEqual((self.service.cache_hits, self.service.cache_misses), (1, 2))
+        
+        self.service.clear_cache()
+        self.assertEqual(self.service.cache_hits, 0)
+    
+    def test_concurrent_identical_summaries_share_one_call(self):
+        """Test simultaneous misses for one prompt make a single LLM call"""
+        import threading
+        import time
+        from concurrent.futures import ThreadPoolExecutor
+        from unittest.mock import patch
+        
+        twin = DigitalTwinState.create("mock_patient_id")
+        release = threading.Event()
+        
+        def slow_llm(prompt):
+            release.wait(timeout=5)
+            return "LLM summary"
+        
+        self.service.mock_mode = False
+        with patch.object(self.service, '_call_llm', side_effect=slow_llm) as llm, \
+             ThreadPoolExecutor(max_workers=4) as executor:
+            futures = [executor.submit(self.service.generate_summary, twin, []) for _ in range(4)]
+            while self.service.cache_misses < 4:
+                time.sleep(0.01)
+            release.set()
+            summaries = [future.result() for future in futures]
+        
+        self.assertEqual(summaries, ["LLM summary"] * 4)
+        self.assertEqual(llm.call_count, 1)
+        self.assertEqual(self.service._inflight, {})
+    
+    def test_prompt_starts_with_shared_instructions(self):
+        """Test patient data follows the fixed, cacheable instruction prefix"""
+        from app.services.clinical_summary_service import PROMPT_PREFIX
+        
+        first = DigitalTwinState.create("patient_a")
+        second = DigitalTwinState.create("patient_b")
+        second.consistency_index = 42.0
+        
+        prompts = [
+            self.service._build_prompt(first, [], 150),
+            self.service._build_prompt(second, [], 80)
+        ]
+        
+        for prompt in prompts:
+            self.assertTrue(prompt.startswith(PROMPT_PREFIX))
+            self.assertNotIn("Adherence Rate", PROMPT_PREFIX)
+        self.assertIn("42.0%", prompts[1])
+        self.assertIn("80 words", prompts[1])
+    
+    def test_batch_summaries_run_concurrently_in_order(self):
+        """Test batch generation overlaps LLM calls and keeps item order"""
+        import threading
+        from unittest.mock import patch
+        
+        twins = []
+        for index in range(4):
+            twin = DigitalTwinState.create(f"patient_{index}")
+            twin.consistency_index = float(index)
+            twins.append(twin)
+        
+        barrier = threading.Barrier(4, timeout=5)
+        
+        def fake_llm(prompt):
+            barrier.wait()  # only passes if all four calls are in flight
+            return prompt.split("Adherence Rate: ")[1].split("%")[0]
+        
+        self.service.mock_mode = False
+        with patch.object(self.service, '_call_llm', side_effect=fake_llm):
+            summaries = self.service.generate_summaries_batch([(t, []) for t in twins])
+        
+        self.assertEqual(summaries, ["0.0", "1.0", "2.0", "3.0"])
+    
+    def test_openrouter_summary_streamed_and_cached(self):
+        """Test SSE deltas are yielded as they arrive, then cached"""
+        from unittest.mock import MagicMock, patch
+        
+        twin = DigitalTwinState.create("mock_patient_id")
+        self.service.mock_mode = False
+        self.service.provider = 'openrouter'
+        self.service._openrouter_headers = {}
+        
+        response = MagicMock()
+        response.__enter__.return_value = response
+        response.iter_lines.return_value = [
+            b": OPENROUTER PROCESSING",
+            b'data: {"choices": [{"delta": {"content": "Patient is "}}]}',
+            b"",
+            b'data: {"choices": [{"delta": {"content": "stable."}}]}',
+            b"data: [DONE]"
+        ]
+        session = MagicMock()
+        session.post.return_value = response
+        
+        with patch('app.services.clinical_summary_service.get_http_session', return_value=session):
+            chunks = list(self.service.generate_summary_stream(twin, []))
+            cached = list(self.service.generate_summary_stream(twin, []))
+        
+        self.assertEqual(chunks, ["Patient is ", "stable."])
+        self.assertEqual(cached, ["Patient is stable."])
+        self.assertEqual(session.post.call_count, 1)
+        self.assertTrue(session.post.call_args.kwargs["json"]["stream"])
 
 
 class TestMapsService(unittest.TestCase):
@@ -112,17 +381,124 @@ class TestMapsService(unittest.TestCase):
         self.assertGreater(len(hospitals), 0)
         self.assertEqual(hospitals[0].place_id, "mock_hospital_1")
     
+    def test_from_maps_result_field_order(self):
+        """Test the positional Maps parser fills the right fields"""
+        from app.models.hospital import HospitalData
+        
+        hospital = HospitalData.from_maps_result({
+            "id": "place_1",
+            "displayName": {"text": "City Hospital"},
+            "formattedAddress": "1 Main St",
+            "location": {"latitude": 12.9, "longitude": 77.5},
+            "nationalPhoneNumber": "080 1234 5678",
+            "websiteUri": "https://example.org",
+            "rating": 4.2,
+            "userRatingCount": 310
+        }, (12.9716, 77.5946))
+        
+        self.assertEqual(hospital.place_id, "place_1")
+        self.assertEqual(hospital.name, "City Hospital")
+        self.assertEqual(hospital.formatted_address, "1 Main St")
+        self.assertEqual((hospital.latitude, hospital.longitude), (12.9, 77.5))
+        self.assertIsNone(hospital.distance_meters)
+        self.assertEqual(hospital.phone_number, "080 1234 5678")
+        self.assertEqual(hospital.website, "https://example.org")
+        self.assertEqual(hospital.rating, 4.2)
+        self.assertEqual(hospital.user_ratings_total, 310)
+        self.assertEqual(hospital.departments, [])
+        self.assertFalse(hospital.visited_before)
+        self.assertEqual(hospital.rank_score, 0.0)
+        
+        empty = HospitalData.from_maps_result({}, (0.0, 0.0))
+        self.assertEqual(empty.name, "Unknown")
+        self.assertEqual(empty.latitude, 0.0)
+    
     def test_distance_calculation(self):
         """Test Haversine distance formula"""
         # Bangalore to Mysore (approx 140 km)
         lat1, lon1 = 12.9716, 77.5946  # Bangalore
         lat2, lon2 = 12.2958, 76.6394  # Mysore
         
-        distance = self.service._calculate_distance(lat1, lon1, lat2, lon2)
+        for precise in (True, False):  # beyond city scale both use Haversine
+            distance = self.service._calculate_distances(
+                lat1, lon1, np.array([lat2]), np.array([lon2]), precise=precise
+            )[0]
+            
+            # Should be approximately 128-145 km (Earth radius variations)
+            self.assertGreater(distance, 120000)
+            self.assertLess(distance, 150000)
+    
+    def test_search_results_cached_per_cell(self):
+        """Test nearby searches in the same cell reuse one Places API call"""
+        import json
+        from unittest.mock import Mock, patch
+        import app.core.cache as cache
+        
+        response = Mock()
+        response.content = json.dumps({"places": [{
+            "id": "place_1",
+            "displayName": {"text": "City Hospital"},
+            "location": {"latitude": 12.98, "longitude": 77.60}
+        }]}).encode()
         
-        # Should be approximately 128-145 km (Earth radius variations)
-        self.assertGreater(distance, 120000)
-        self.assertLess(distance, 150000)
+        session = Mock()
+        session.post.return_value = response
+        
+        self.service.mock_mode = False
+        with patch.object(cache, 'redis_client', FakeRedis()), \
+             patch('app.services.maps_service.get_http_session', return_value=session):
+            first = self.service.search_nearby_hospitals(12.97161, 77.59461)
+            second = self.service.search_nearby_hospitals(12.97164, 77.59458)
+        
+        session.post.assert_called_once()
+        self.assertEqual(second[0].place_id, "place_1")
+        self.assertNotEqual(first[0].distance_meters, second[0].distance_meters)
+    
+    def test_booked_hospital_ranked_as_visited(self):
+        """Test a booking is remembered and boosts that hospital in search"""
+        from unittest.mock import patch
+        import app.core.cache as cache
+        from app.main import create_app
+        
+        client = create_app(mock_mode=True).test_client()
+        with patch.object(cache, 'redis_client', FakeRedis()):
+            client.post('/api/hospitals/appointment', json={
+                "patient_id": "p1", "place_id": "mock_hospital_2"
+            })
+            response = client.get(
+                '/api/hospitals/search?latitude=12.97&longitude=77.59&patient_id=p1'
+            )
+        
+        hospitals = response.get_json()["hospitals"]
+        visited = [h["place_id"] for h in hospitals if h["visited_before"]]
+        self.assertEqual(visited, ["mock_hospital_2"])
+        self.assertEqual(hospitals[0]["place_id"], "mock_hospital_2")
+    
+    def test_approximate_distances_match_haversine(self):
+        """Test the default equirectangular distances track Haversine"""
+        hospitals = self.service._get_mock_hospitals(12.9716, 77.5946)
+        
+        lats = np.array([h.latitude for h in hospitals])
+        lons = np.array([h.longitude for h in hospitals])
+        expected = self.service._calculate_distances(
+            12.9716, 77.5946, lats, lons, precise=True
+        ).tolist()
+        
+        # Default (equirectangular) stays within 0.5% at city scale
+        self.service._assign_distances(12.9716, 77.5946, hospitals)
+        
+        for hospital, distance in zip(hospitals, expected):
+            self.assertIs(type(hospital.distance_meters), float)
+            self.assertAlmostEqual(hospital.distance_meters, distance, delta=distance * 0.005)
+    
+    def test_far_distances_fall_back_to_haversine(self):
+        """Test points beyond the approximation range get exact distances"""
+        lats, lons = np.array([12.2958]), np.array([76.6394])  # Mysore, ~128 km
+        
+        approx = self.service._calculate_distances(12.9716, 77.5946, lats, lons)
+        precise = self.service._calculate_distances(12.9716, 77.5946, lats, lons, precise=True)
+        
+        self.assertEqual(approx.tolist(), precise.tolist())
     
     def test_hospital_ranking_visited_bonus(self):
         """Test visited hospital gets priority"""
@@ -136,6 +512,16 @@ class TestMapsService(unittest.TestCase):
         self.assertTrue(visited_hospital.visited_before)
         self.assertGreater(visited_hospital.rank_score, 100)  # Should have bonus
     
+    def test_hospital_ranking_accepts_any_iterable(self):
+        """Test a one-shot iterator of visited ids marks every match"""
+        hospitals = self.service._get_mock_hospitals(12.9716, 77.5946)
+        visited_ids = iter(["mock_hospital_3", "mock_hospital_1"])
+        
+        ranked = self.service.rank_hospitals(hospitals, visited_ids)
+        
+        visited = sorted(h.place_id for h in ranked if h.visited_before)
+        self.assertEqual(visited, ["mock_hospital_1", "mock_hospital_3"])
+    
     def test_hospital_ranking_formula(self):
         """Test ranking score calculation"""
         # Score = visited_bonus + (rating * 10) - (distance / 1000)
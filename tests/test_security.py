@@ -37,6 +37,38 @@ class TestConfigManager(unittest.TestCase):
         self.assertIn('account_sid', twilio)
         self.assertIn('auth_token', twilio)
 
+    def test_config_lookups_are_cached_and_read_only(self):
+        """Test repeated lookups return the same immutable mapping"""
+        creds = self.config.get_database_credentials(0)
+        self.assertIs(creds, self.config.get_database_credentials(0))
+
+        with self.assertRaises(TypeError):
+            creds['password'] = 'tampered'
+
+    def test_api_keys_are_shared_frozen_mappings(self):
+        """Test API key lookups return one prebuilt mapping per service"""
+        self.assertIs(self.config.get_api_key('twilio'), self.config.get_api_key('twilio'))
+        
+        unknown = self.config.get_api_key('unknown-service')
+        self.assertEqual(len(unknown), 0)
+        self.assertIs(unknown, self.config.get_api_key('another-unknown'))
+
+    def test_reload_picks_up_environment_changes(self):
+        """Test config reads a snapshot of os.environ refreshed by reload()"""
+        import os
+        original = os.environ.get('DB_SHARD0_HOST')
+        os.environ['DB_SHARD0_HOST'] = 'reloaded-host'
+        try:
+            self.assertNotEqual(self.config.get_database_credentials(0)['host'], 'reloaded-host')
+            ConfigManager.reload()
+            self.assertEqual(self.config.get_database_credentials(0)['host'], 'reloaded-host')
+        finally:
+            if original is None:
+                os.environ.pop('DB_SHARD0_HOST')
+            else:
+                os.environ['DB_SHARD0_HOST'] = original
+            ConfigManager.reload()
+
 
 class TestEncryption(unittest.TestCase):
     """Test AES-256-GCM encryption"""
@@ -95,6 +127,52 @@ class TestEncryption(unittest.TestCase):
         with self.assertRaises(ValueError):
             self.encryption.decrypt(encrypted, user2)
 
+    def test_cipher_cache_is_bounded_lru(self):
+        """Test per-user ciphers are reused and least recently used are evicted"""
+        encryption = EncryptionManager("test-master-key-32-bytes-long", cache_size=2)
+        user1, user2, user3 = str(uuid4()), str(uuid4()), str(uuid4())
+
+        cipher1 = encryption._get_cipher(user1)
+        encryption._get_cipher(user2)
+        self.assertIs(encryption._get_cipher(user1), cipher1)
+
+        # user2 is now least recently used
+        encryption._get_cipher(user3)
+        self.assertEqual(list(encryption._key_cache), [user1, user3])
+
+    def test_encrypt_many_round_trip(self):
+        """Test batch encryption matches per-value semantics"""
+        values = ["Jane Doe", "", "Type 2 diabetes"]
+        encrypted = self.encryption.encrypt_many(values, self.user_id)
+
+        self.assertEqual(len(encrypted), 3)
+        self.assertEqual(encrypted[1], b'')
+        self.assertNotEqual(encrypted[0][1:13], encrypted[2][1:13])  # fresh IV per value
+        self.assertEqual(self.encryption.decrypt_many(encrypted, self.user_id), values)
+
+    def test_decrypt_many_resolves_cipher_once(self):
+        """Test batch decryption looks the user's cipher up once"""
+        from unittest.mock import patch
+
+        encrypted = self.encryption.encrypt_many(["a", "b", "c"], self.user_id)
+        with patch.object(self.encryption, '_get_cipher',
+                          wraps=self.encryption._get_cipher) as get_cipher:
+            self.assertEqual(self.encryption.decrypt_many(encrypted, self.user_id), ["a", "b", "c"])
+        get_cipher.assert_called_once_with(self.user_id)
+
+    def test_legacy_pbkdf2_ciphertext_still_decrypts(self):
+        """Test v1 (PBKDF2, unversioned) rows remain readable after the HKDF switch"""
+        plaintext = "Legacy Medical Record"
+        encrypted = self.encryption.encrypt(plaintext, self.user_id)
+        self.assertEqual(encrypted[:1], b'\x02')
+
+        # Build v1 ciphertexts: [IV][ciphertext+tag] under the PBKDF2 key,
+        # including one whose IV happens to start with the version byte
+        legacy_cipher = self.encryption._get_legacy_cipher(self.user_id)
+        for iv in (bytes(12), b'\x02' + bytes(11)):
+            legacy = iv + legacy_cipher.encrypt(iv, plaintext.encode('utf-8'), None)
+            self.assertEqual(self.encryption.decrypt(legacy, self.user_id), plaintext)
+
 
 class TestShardRouter(unittest.TestCase):
     """Test database sharding router"""
@@ -113,6 +191,37 @@ class TestShardRouter(unittest.TestCase):
         
         self.assertEqual(shard1, shard2)
         self.assertEqual(shard2, shard3)
+
+    def test_shard_mapping_matches_hexdigest_scheme(self):
+        """Test routing is unchanged from the original hexdigest-based mapping"""
+        import hashlib
+        for _ in range(50):
+            user_id = str(uuid4())
+            legacy = int(hashlib.sha256(user_id.encode('utf-8')).hexdigest()[:8], 16) % 2
+            self.assertEqual(self.router.get_shard_id(user_id), legacy)
+
+    def test_crc32_routing(self):
+        """Test the opt-in crc32 hash is deterministic and in range"""
+        import zlib
+        router = ShardRouter(num_shards=4, algorithm="crc32")
+        user_id = str(uuid4())
+
+        expected = zlib.crc32(user_id.encode('utf-8')) % 4
+        self.assertEqual(router.get_shard_id(user_id), expected)
+        self.assertEqual(router.get_shard_id(user_id), expected)
+
+        with self.assertRaises(ValueError):
+            ShardRouter(num_shards=2, algorithm="md5")
+
+    def test_shard_lookup_is_memoized(self):
+        """Test repeated lookups for a user are served from the cache"""
+        from app.database.router import _shard_for
+        user_id = str(uuid4())
+
+        self.router.get_shard_id(user_id)
+        hits = _shard_for.cache_info().hits
+        self.router.validate_shard_consistency(user_id, self.router.get_shard_id(user_id))
+        self.assertEqual(_shard_for.cache_info().hits, hits + 2)
     
     def test_shard_distribution(self):
         """Test that users are distributed across shards"""
@@ -128,6 +237,15 @@ class TestShardRouter(unittest.TestCase):
         self.assertGreater(shard_counts[0], 0)
         self.assertGreater(shard_counts[1], 0)
     
+    def test_routing_counts(self):
+        """Test shard lookups are tallied per shard"""
+        router = ShardRouter(num_shards=2)
+        shard_id = router.get_shard_id(str(uuid4()))
+        router.get_shard_id(str(uuid4()))
+        
+        self.assertEqual(sum(router.routing_counts), 2)
+        self.assertGreaterEqual(router.routing_counts[shard_id], 1)
+    
     def test_validate_shard_consistency(self):
         """Test shard consistency validation"""
         user_id = str(uuid4())
@@ -141,6 +259,182 @@ class TestShardRouter(unittest.TestCase):
         self.assertFalse(self.router.validate_shard_consistency(user_id, wrong_shard))
 
 
+
+class TestConnectionPool(unittest.TestCase):
+    """Test shard connection pooling"""
+
+    def setUp(self):
+        """Build a blocking pool over a stub psycopg2.pool module"""
+        from app.database.connection import _make_blocking_pool
+
+        class PoolError(Exception):
+            pass
+
+        class ThreadedConnectionPool:
+            def __init__(self, minconn, maxconn, **kwargs):
+                pass
+
+            def getconn(self, key=None):
+                return object()
+
+            def putconn(self, conn=None, key=None, close=False):
+                pass
+
+        class pool_module:
+            pass
+
+        pool_module.PoolError = PoolError
+        pool_module.ThreadedConnectionPool = ThreadedConnectionPool
+        self.PoolError = PoolError
+        self.pool = _make_blocking_pool(pool_module, 1, 2, 0.05, host='localhost')
+
+    def test_exhausted_pool_waits_then_times_out(self):
+        """Test callers beyond max_connections wait instead of failing immediately"""
+        conn1 = self.pool.getconn()
+        self.pool.getconn()
+
+        with self.assertRaises(self.PoolError):
+            self.pool.getconn()
+
+        # Returning a connection frees a slot
+        self.pool.putconn(conn1)
+        self.assertIsNotNone(self.pool.getconn())
+
+    def test_request_scope_reuses_one_connection_per_shard(self):
+        """Test nested get_connection calls in a request share a connection"""
+        from unittest.mock import Mock
+        from app.database.connection import DatabaseConnectionManager
+
+        manager = DatabaseConnectionManager()
+        pool = Mock()
+        manager.shard_pools[0] = pool
+
+        token = manager.begin_request()
+        with manager.get_connection(0) as conn1:
+            with manager.get_connection(0) as conn2:
+                pass
+            conn1.commit.assert_not_called()
+        self.assertIs(conn1, conn2)
+
+        # The outermost block commits and releases before the request ends
+        pool.getconn.assert_called_once()
+        conn1.commit.assert_called_once()
+        pool.putconn.assert_called_once_with(conn1)
+
+        manager.end_request(token)
+        pool.putconn.assert_called_once_with(conn1)
+
+    def test_request_scope_nested_error_keeps_connection_until_outer_exit(self):
+        """Test a caught inner error neither releases nor commits the shared connection"""
+        from unittest.mock import Mock
+        from app.database.connection import DatabaseConnectionManager
+
+        manager = DatabaseConnectionManager()
+        pool = Mock()
+        manager.shard_pools[0] = pool
+
+        token = manager.begin_request()
+        with manager.get_connection(0) as outer:
+            try:
+                with manager.get_connection(0) as inner:
+                    raise RuntimeError("statement failed")
+            except RuntimeError:
+                pass
+            self.assertIs(inner, outer)
+            pool.putconn.assert_not_called()
+            outer.rollback.assert_not_called()
+
+            # The outer block keeps querying on the connection it still owns
+            outer.cursor().execute("SELECT 1")
+            with manager.get_connection(0) as again:
+                self.assertIs(again, outer)
+
+        outer.commit.assert_not_called()
+        outer.rollback.assert_called_once()
+        pool.putconn.assert_called_once_with(outer)
+        pool.getconn.assert_called_once()
+        manager.end_request(token)
+        pool.putconn.assert_called_once_with(outer)
+
+    def test_request_scope_commit_failure_raises(self):
+        """Test a failed commit propagates instead of being lost in teardown"""
+        from unittest.mock import Mock
+        from app.database.connection import DatabaseConnectionManager
+
+        manager = DatabaseConnectionManager()
+        pool = Mock()
+        pool.getconn.return_value.commit.side_effect = RuntimeError("commit failed")
+        manager.shard_pools[0] = pool
+
+        token = manager.begin_request()
+        with self.assertRaises(RuntimeError):
+            with manager.get_connection(0):
+                pass
+        manager.end_request(token)
+        conn = pool.getconn.return_value
+        conn.rollback.assert_called_once()
+        pool.putconn.assert_called_once_with(conn)
+
+    def test_jsonb_wraps_values_and_keeps_null(self):
+        """Test JSONB parameters are wrapped explicitly and None stays NULL"""
+        from psycopg2.extras import Json
+        from app.database.connection import jsonb
+
+        self.assertIsNone(jsonb(None))
+        wrapped = jsonb({"times": ["08:00"]})
+        self.assertIsInstance(wrapped, Json)
+        self.assertEqual(wrapped.adapted, {"times": ["08:00"]})
+
+    def test_execute_prepared_without_server_prepare(self):
+        """Test DB_SERVER_PREPARE=false sends plain statements (PgBouncer-safe)"""
+        from unittest.mock import Mock, patch
+        from app.database.connection import execute_prepared
+
+        cursor = Mock()
+        with patch('app.database.connection.DB_SERVER_PREPARE', False):
+            execute_prepared(cursor, "q", "SELECT $1 WHERE x LIKE '%a' OR y = $1 OR z = $2", ("a", 2))
+
+        cursor.execute.assert_called_once_with(
+            "SELECT %(1)s WHERE x LIKE '%%a' OR y = %(1)s OR z = %(2)s",
+            {"1": "a", "2": 2}
+        )
+
+    def test_execute_prepared_prepares_once_per_connection(self):
+        """Test PREPARE runs once per connection, EXECUTE on every call"""
+        from unittest.mock import Mock
+        from app.database.connection import execute_prepared
+
+        cursor = Mock()
+        for _ in range(2):
+            execute_prepared(cursor, "q", "SELECT $1", ("a",))
+
+        statements = [c.args[0] for c in cursor.execute.call_args_list]
+        self.assertEqual(statements, [
+            "PREPARE q AS SELECT $1",
+            "EXECUTE q (%s)",
+            "EXECUTE q (%s)",
+        ])
+
+        # A new connection (e.g. after reconnect) prepares again
+        cursor.connection = Mock()
+        execute_prepared(cursor, "q", "SELECT $1", ("a",))
+        self.assertEqual(cursor.execute.call_args_list[-2].args[0], "PREPARE q AS SELECT $1")
+
+    def test_execute_values_batches_rows(self):
+        """Test rows are sent through psycopg2's execute_values in pages"""
+        from unittest.mock import Mock, patch
+        from app.database.connection import execute_values
+
+        cursor = Mock()
+        rows = [(i, "x") for i in range(3)]
+        with patch('psycopg2.extras.execute_values') as batched:
+            execute_values(cursor, "INSERT INTO t (a, b) VALUES %s", rows, page_size=2)
+            execute_values(cursor, "INSERT INTO t (a, b) VALUES %s", [])
+
+        batched.assert_called_once_with(
+            cursor, "INSERT INTO t (a, b) VALUES %s", rows, template=None, page_size=2
+        )
+
 if __name__ == '__main__':
     # Run tests
     unittest.main(verbosity=2)